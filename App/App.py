@@ -7,14 +7,31 @@ from Engine.Core.DeltaTime import DeltaTime
 from Engine.Core.UI import UI
 from Engine.Core.Window import Window
 from Engine.Renderer.Shader import Shader
-from Engine.Renderer.Mesh import Mesh
+from Engine.Renderer.ShaderCache import ShaderCache
+from Engine.Renderer.Mesh import Mesh, MeshLOD
 from Engine.Renderer.Camera import Camera
+from Engine.Renderer.CameraUniforms import CameraUniforms
+from Engine.Core.Profiler import Profiler
 
 import glm
 import imgui
+import numpy as np
 
 # App imports
 from App.Simulation.Simulation import *
+from App.Simulation.SimulationThread import SimulationThread, SnapshotBuffer
+from App.Simulation.Emitter import Emitter
+from App.Simulation.Trajectory import TrajectoryReader, TrajectoryPlayer
+
+# written by the Save Checkpoint button, in the working directory
+CHECKPOINT_PATH = "ParticleFlow.ckpt"
+# linked shader programs, rebuilt whenever a shader or the driver changes
+SHADER_CACHE_DIR = ".shadercache"
+# (stacks, slices) of the sphere levels, finest first, and the eye distances in
+# particle radii where each level hands over to the next; beyond 320 radii a
+# particle is a few pixels across
+SPHERE_LODS = ((12, 24), (6, 12), (4, 8), (3, 6))
+SPHERE_LOD_DISTANCES = (40.0, 120.0, 320.0)
 
 class ParticleFlowLayer(Layer):
     def __init__(self, window: Window, name="ParticleFlowLayer", ):
@@ -23,62 +40,220 @@ class ParticleFlowLayer(Layer):
         self._camera = Camera(aspect=window.GetWidth()/window.GetHeight())
         self._window = window
                       
-        self._shader: Shader = Shader("App/Shaders/Particle.vert", "App/Shaders/Particle.frag")
+        shader_cache = ShaderCache(SHADER_CACHE_DIR)
+        self._shader: Shader = Shader("App/Shaders/Particle.vert", "App/Shaders/Particle.frag", shader_cache)
 
         # Look at this hunk of garbage
-        self._mesh   = Mesh(Mesh.GenerateUVSphere(6, 12, 1))
+        self._mesh   = MeshLOD([Mesh.GenerateUVSphere(stacks, slices, 1) for stacks, slices in SPHERE_LODS],
+                               SPHERE_LOD_DISTANCES)
         self._renderer = Renderer(self._shader, self._mesh)
+
+        # one camera-facing quad per particle, the fragment shader ray casts the sphere
+        self._impostor_shader = Shader("App/Shaders/Impostor.vert", "App/Shaders/Impostor.frag", shader_cache)
+        self._impostor_mesh = Mesh(Mesh.GenerateQuad())
+        self._impostor_renderer = Renderer(self._impostor_shader, self._impostor_mesh)
+        # sphere meshes by default, impostors are opt-in from the UI
+        self._impostors = False
         
         self._camera = Camera()
+        # camera block shared by every program
+        self._camera_uniforms = CameraUniforms()
 
         self._particle_size = 0.05
         self._domain_size = glm.vec3(1.2)
         self._friction_coefficient = 0.7
         self._particle_number = 100
-        self._sim = Simulation(self._particle_number, self._particle_size, self._domain_size, self._friction_coefficient)
+        # checks the compiled kernels against the reference once, then uses the fastest
+        self._backend = Simulation.SelectBackend()
+        self._sim = Simulation(self._particle_number, self._particle_size, self._domain_size, self._friction_coefficient, self._backend)
+        # shared by every simulation the layer creates, so its settings survive a reset
+        self._emitter = self._sim.GetEmitter()
+        # removes particles that reach the floor, so a running emitter reaches a steady state
+        self._outflow = False
+        # resting particles skip integration while asleep, off unless ticked
+        self._sleeping = False
         self._minDt = 1/240
+
+        # the renderer draws from these, interpolated between the last two steps
+        self._snapshots = SnapshotBuffer()
+        self._snapshots.Publish(self._sim.GetPoints(), self._sim.GetColors(), self._sim.GetSerials(),
+                                self._sim.GetStepStats())
+        self._sim_thread: SimulationThread = None
+
+        # replay of a recorded trajectory, replaces the simulation while open
+        self._player: TrajectoryPlayer = None
+        self._replay_path = "run.traj"
+        self._shown_frame = None
         
     def OnAttach(self):
         print("Attached Particle Flow Layer")
 
-    def OnUpdate(self, dt: DeltaTime):
-        #Actual application code here
-        dt = dt.GetSeconds()
-        
-        # To stop the program from going unpredictable under low framerates we limit highest dt to ensure smooth sim        
-        dt = self._minDt
-         
+    def OnDetach(self):
+        self.SetThreaded(False)
+        self.CloseReplay()
+
+    def OnFixedUpdate(self, dt: DeltaTime):
+        if self._player is not None:
+            return
+        if self._sim_thread is not None:
+            self._sim_thread.SetPaused(UI.IsHovered())
+            return
+
+        # the simulation pauses while the UI is used, the state is still published so
+        # the interpolation settles instead of swinging between the last two steps
+        if not UI.IsHovered():
+            self._sim.OnUpdate(dt.GetSeconds())
+        self._snapshots.Publish(self._sim.GetPoints(), self._sim.GetColors(), self._sim.GetSerials(),
+                                self._sim.GetStepStats())
+
+    def OnUpdate(self, dt: DeltaTime, alpha: float = 1.0):
         if not UI.IsHovered():
             self._camera.OnUpdate(self._window.GetWindow())
-            # Yo i think this is a pretty cool fix for dt being too big after creating particles
-            self._sim.OnUpdate(dt)
 
-        self._shader.Use()
-        self._shader.UploadMat4("uView", self._camera.GetViewMatrix())
-        self._shader.UploadMat4("uProj", self._camera.GetProjectionMatrix())
-        self._shader.UploadFloat("uParticleRadii", self._particle_size)
+        # the simulation thread runs on its own clock
+        if self._sim_thread is not None:
+            alpha = self._sim_thread.GetAlpha()
+
+        self._camera_uniforms.Update(self._camera)
+        if not self._impostors:
+            self._shader.Use()
+            self._shader.UploadFloat("uParticleRadii", self._particle_size)
         
         # 2nd largest inefficiency
-        self._mesh.SetInstanceData(self._sim.GetPoints(), self._sim.GetColors())
-        self._renderer.DrawInstanced()
+        with Profiler.Scope("InstanceUpload"):
+            if self._player is not None:
+                self._UploadReplayFrame(dt.GetSeconds())
+            else:
+                points, colors = self._snapshots.Interpolate(alpha)
+                self._SetInstanceData(points, colors)
+        with Profiler.Scope("Draw"):
+            self._GetRenderer().DrawInstanced()
         # largest inefficiency
         
         # self._renderer.Draw()
+
+    def _GetRenderer(self) -> Renderer:
+        return self._impostor_renderer if self._impostors else self._renderer
+
+    def _SetInstanceData(self, points, colors):
+        if self._impostors:
+            self._impostor_mesh.SetInstanceData(points, colors, radii=self._particle_size)
+        else:
+            self._mesh.SetInstanceData(points, colors, self._camera.GetPosition(), self._particle_size)
+
+    def SetImpostors(self, impostors: bool):
+        """Draw particles as ray cast quads instead of sphere meshes."""
+        self._impostors = impostors
+        # the other mesh holds an older frame
+        self._shown_frame = None
+
+    def _UploadReplayFrame(self, seconds: float):
+        """Upload the replay frame due now, straight from the mapped file; a frame already shown is not uploaded again."""
+        frame = self._player.Advance(seconds)
+        if frame == self._shown_frame:
+            return
+        points, _ = self._player.GetFrame()
+        self._SetInstanceData(points, self._player.GetColors())
+        self._shown_frame = frame
+
+    def OpenReplay(self, path: str) -> bool:
+        """Play a recording from TrajectoryRecorder back instead of simulating."""
+        try:
+            player = TrajectoryPlayer(TrajectoryReader(path))
+        except (OSError, ValueError) as error:
+            print(f"Could not open recording {path}: {error}")
+            return False
+
+        self.CloseReplay()
+        self.SetThreaded(False)
+        self._player = player
+        self._shown_frame = None
+        size = player.GetReader().GetParticleSize()
+        if size > 0:
+            self._particle_size = size
+        return True
+
+    def CloseReplay(self):
+        if self._player is None:
+            return
+        self._player.Close()
+        self._player = None
+        self._particle_size = self._sim.GetParticleSize()
+
+    def SetThreaded(self, threaded: bool):
+        """Step the simulation on a background thread instead of in OnFixedUpdate."""
+        if threaded and self._sim_thread is None:
+            self._sim_thread = SimulationThread(self._sim, self._snapshots, self._minDt)
+            self._sim_thread.Start()
+        elif not threaded and self._sim_thread is not None:
+            self._sim_thread.Stop()
+            self._sim_thread = None
+
+    def _ApplyToSimulation(self, change):
+        """Run `change(sim)`, on the simulation thread when there is one."""
+        if self._sim_thread is not None:
+            self._sim_thread.Submit(lambda: change(self._sim))
+        else:
+            change(self._sim)
+
+    def _ApplyOutflow(self, sim):
+        sim.ClearKillZones()
+        if self._outflow:
+            # a slab one particle thick over the floor, open below
+            floor = -0.5 * self._domain_size[1] + self._particle_size
+            sim.AddKillZone((-np.inf, -np.inf, -np.inf), (np.inf, floor, np.inf))
+
+    def _ResetSimulation(self):
+        sim = Simulation(
+            self._particle_number,
+            self._particle_size,
+            self._domain_size,
+            self._friction_coefficient,
+            self._backend,
+        )
+        sim.SetEmitter(self._emitter)
+        self._ApplyOutflow(sim)
+        sim.SetSleeping(self._sleeping)
+        self._SetSimulation(sim)
+
+    def _LoadCheckpoint(self, path: str):
+        try:
+            sim = Simulation.LoadCheckpoint(path, self._backend)
+        except (OSError, ValueError) as error:
+            print(f"Could not load checkpoint {path}: {error}")
+            return
+
+        # the settings follow the loaded simulation
+        self._particle_number = sim.GetParticleNumber()
+        self._particle_size = sim.GetParticleSize()
+        self._domain_size = sim.GetBoundSize()
+        self._friction_coefficient = sim.GetFrictionCoefficient()
+        self._emitter = sim.GetEmitter()
+        self._outflow = bool(sim.GetKillZones())
+        self._sleeping = sim.IsSleeping()
+        self._SetSimulation(sim)
+
+    def _SetSimulation(self, sim: Simulation):
+        if self._sim_thread is not None:
+            self._sim_thread.SetSimulation(sim)
+        else:
+            self._snapshots.Publish(sim.GetPoints(), sim.GetColors(), sim.GetSerials(), sim.GetStepStats())
+        self._sim = sim
     
     def OnUI(self, dt: DeltaTime = None):
         UI.Begin("Settings")
         
         reset = UI.Button("Reset Simulation")
         if reset:
-            self._sim = Simulation(
-                    self._particle_number,
-                    self._particle_size,
-                    self._domain_size,
-                    self._friction_coefficient,
-                )
+            self._ResetSimulation()
         reset = UI.Button("Reset Camera")
         if reset:
                 self._camera = Camera()
+
+        if UI.Button("Save Checkpoint"):
+            self._ApplyToSimulation(lambda sim: sim.SaveCheckpoint(CHECKPOINT_PATH))
+        if UI.Button("Load Checkpoint"):
+            self._LoadCheckpoint(CHECKPOINT_PATH)
         
         # Show debug info if true
         if imgui.collapsing_header("Stats", flags=imgui.TREE_NODE_DEFAULT_OPEN)[0]:
@@ -88,31 +263,88 @@ class ParticleFlowLayer(Layer):
             UI.Text(f"Last frame time(s): {round(time, 4)}")
 
             UI.Text(f"FPS: {round(1/time, 2)}")
-            UI.Text(f"Particle Count: {self._sim.GetParticleCount()}")
+            UI.Text(f"Particle Count: {self._GetRenderer().mesh.instance_count}")
+            if not self._impostors:
+                UI.Text(f"Sphere LODs: {' / '.join(str(count) for count in self._mesh.GetLevelCounts())}")
+            # published with the particles, the simulation may be stepping on its own thread
+            step_stats = self._snapshots.GetStats()
+            UI.Text(f"Substeps: {step_stats['substeps']} (max speed {round(step_stats['max_speed'], 2)})")
+            UI.Text(f"Asleep: {step_stats['asleep']}")
+
+        threaded, changed = UI.Checkbox("Simulate on background thread", self._sim_thread is not None)
+        if changed and self._player is None:
+            self.SetThreaded(threaded)
+
+        impostors, changed = UI.Checkbox("Impostor spheres", self._impostors)
+        if changed:
+            self.SetImpostors(impostors)
+
+        if imgui.collapsing_header("Profiler")[0]:
+            UI.ProfilerStats()
         
         if imgui.collapsing_header("Simulation Params", flags=imgui.TREE_NODE_DEFAULT_OPEN)[0]:
             self._particle_number, changed = UI.SliderInt("Particle Amount", self._particle_number, 1, 10000)
-            if changed:#imgui.is_item_deactivated_after_edit():
-                self._sim = Simulation(
-                    self._particle_number,
-                    self._particle_size,
-                    self._domain_size,
-                    self._friction_coefficient,
-                )
+            if changed:
+                # the particles are kept, only the cap changes
+                self._ApplyToSimulation(lambda sim, number=self._particle_number: sim.SetParticleNumber(number))
             
             self._particle_size, changed = UI.SliderFloat("Particle Size", self._particle_size, 0.0005, 1.0)
             if changed:
-                self._sim.SetParticleSize(self._particle_size)
+                self._ApplyToSimulation(lambda sim, size=self._particle_size: sim.SetParticleSize(size))
                 # self._sim.SetOptimalSmoothingRadius()
             
             self._friction_coefficient, changed = UI.SliderFloat("Friction Coefficient", self._friction_coefficient, 0.005, 1.0)
             if changed:
-                self._sim.SetFrictionCoefficient(self._friction_coefficient)
+                self._ApplyToSimulation(lambda sim, friction=self._friction_coefficient: sim.SetFrictionCoefficient(friction))
             
+            self._sleeping, changed = UI.Checkbox("Sleep Resting Particles", self._sleeping)
+            if changed:
+                self._ApplyToSimulation(lambda sim, sleeping=self._sleeping: sim.SetSleeping(sleeping))
+
             self._domain_size, changed = UI.SliderFloat3("Domain Size", self._domain_size, 0.1, 20.0)
             if changed:
-                self._sim.SetBoundSize(self._domain_size)
+                self._ApplyToSimulation(lambda sim, bound=glm.vec3(self._domain_size): sim.SetBoundSize(bound))
                 # self._sim.SetOptimalSmoothingRadius()
+
+        if imgui.collapsing_header("Emitter")[0]:
+            shape = Emitter.SHAPES.index(self._emitter.shape)
+            changed, shape = imgui.combo("Shape", shape, list(Emitter.SHAPES))
+            if changed:
+                self._emitter.SetShape(Emitter.SHAPES[shape])
+            self._emitter.rate, _ = UI.SliderFloat("Rate (bursts/s)", self._emitter.rate, 0.0, 200.0)
+            self._emitter.burst, _ = UI.SliderInt("Burst Size", self._emitter.burst, 1, 1000)
+            self._emitter.velocity_spread, _ = UI.SliderFloat("Velocity Spread", self._emitter.velocity_spread, 0.0, 2.0)
+            lifetime = 0.0 if np.isinf(self._emitter.lifetime) else self._emitter.lifetime
+            lifetime, changed = UI.SliderFloat("Lifetime (s, 0 = forever)", lifetime, 0.0, 60.0)
+            if changed:
+                self._emitter.lifetime = lifetime if lifetime > 0.0 else np.inf
+
+            self._outflow, changed = UI.Checkbox("Outflow Floor", self._outflow)
+            if changed:
+                self._ApplyToSimulation(self._ApplyOutflow)
+
+            if UI.Button("Burst"):
+                self._ApplyToSimulation(lambda sim: sim.GetEmitter().Burst())
+            if UI.Button("Fill Domain"):
+                self._ApplyToSimulation(lambda sim: sim.Prefill())
+
+        if imgui.collapsing_header("Replay")[0]:
+            _, self._replay_path = imgui.input_text("Recording", self._replay_path, 256)
+            if self._player is None:
+                if UI.Button("Open Recording"):
+                    self.OpenReplay(self._replay_path)
+            else:
+                frame, changed = UI.SliderInt("Frame", self._player.GetFrameIndex(), 0, self._player.GetFrameCount() - 1)
+                if changed:
+                    self._player.Seek(frame)
+                speed, changed = UI.SliderFloat("Speed", self._player.GetSpeed(), -4.0, 4.0)
+                if changed:
+                    self._player.SetSpeed(speed)
+                playing, changed = UI.Checkbox("Playing", not self._player.IsPaused())
+                if changed:
+                    self._player.SetPaused(not playing)
+                if UI.Button("Close Recording"):
+                    self.CloseReplay()
         
         
 
@@ -121,7 +353,10 @@ class ParticleFlowLayer(Layer):
         
 
 class App(Application):
-    def __init__(self, width=800, height=600, title="ParticleFlow"):
+    def __init__(self, width=800, height=600, title="ParticleFlow", replay: str = None):
         super().__init__(width, height, title)
-               
-        self._layer_stack.PushLayer(ParticleFlowLayer(self._window))
+
+        layer = ParticleFlowLayer(self._window)
+        self._layer_stack.PushLayer(layer)
+        if replay is not None:
+            layer.OpenReplay(replay)
@@ -0,0 +1,38 @@
+#version 330 core
+
+layout (std140) uniform Camera
+{
+    mat4 uView;
+    mat4 uProj;
+    vec4 uCameraPosition;
+};
+
+in  vec3 vPosView;
+in  vec3 vCenterView;
+in  float vRadius;
+in  vec3 vColor;
+out vec4 FragColor;
+
+void main()
+{
+    // ray from the eye through this fragment against the sphere
+    vec3 dir = normalize(vPosView);
+    float b = dot(dir, vCenterView);
+    float disc = b * b - dot(vCenterView, vCenterView) + vRadius * vRadius;
+    if (disc < 0.0)
+        discard;
+    vec3 hit = dir * (b - sqrt(disc));
+    vec3 N = (hit - vCenterView) / vRadius;
+
+    vec4 clip = uProj * vec4(hit, 1.0);
+    gl_FragDepth = 0.5 * (clip.z / clip.w) * (gl_DepthRange.diff) + 0.5 * (gl_DepthRange.near + gl_DepthRange.far);
+
+    // same lighting as the mesh spheres
+    vec3 lightDir = normalize(vec3(-0.5, -0.5, -1.0));
+    float diff    = max(dot(N, -lightDir), 0.0);
+
+    vec3 amb   = 0.2 * vColor;
+    vec3 diffC = diff * vColor;
+
+    FragColor = vec4(amb + diffC, 1.0);
+}
\ No newline at end of file
@@ -0,0 +1,40 @@
+#version 330 core
+
+layout (location = 0) in vec3 aPos;
+layout (location = 1) in vec3 aInstancePoint;
+layout (location = 2) in vec3 aInstanceColor;
+layout (location = 3) in float aInstanceRadius;
+
+layout (std140) uniform Camera
+{
+    mat4 uView;
+    mat4 uProj;
+    vec4 uCameraPosition;
+};
+
+out vec3 vPosView;
+out vec3 vCenterView;
+out float vRadius;
+out vec3 vColor;
+
+void main()
+{
+    // quad through the sphere centre, facing the eye
+    vec3 center = (uView * vec4(aInstancePoint, 1.0)).xyz;
+    vec3 axis = normalize(center);
+    vec3 side = abs(axis.y) > 0.999 ? vec3(1.0, 0.0, 0.0) : vec3(0.0, 1.0, 0.0);
+    vec3 right = normalize(cross(axis, side));
+    vec3 up = cross(right, axis);
+
+    // the silhouette cone from the eye cuts this plane in a circle wider than the radius
+    float d2 = dot(center, center);
+    float r2 = aInstanceRadius * aInstanceRadius;
+    float extent = aInstanceRadius * sqrt(d2 / max(d2 - r2, 1e-6 * d2));
+
+    vPosView = center + (aPos.x * right + aPos.y * up) * extent;
+    vCenterView = center;
+    vRadius = aInstanceRadius;
+    vColor = aInstanceColor;
+
+    gl_Position = uProj * vec4(vPosView, 1.0);
+}
\ No newline at end of file
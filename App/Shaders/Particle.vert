@@ -4,8 +4,12 @@ layout (location = 0) in vec3 aPos;
 layout (location = 1) in vec3 aInstancePoint;
 layout (location = 2) in vec3 aInstanceColor;
 
-uniform mat4 uView;
-uniform mat4 uProj;
+layout (std140) uniform Camera
+{
+    mat4 uView;
+    mat4 uProj;
+    vec4 uCameraPosition;
+};
 uniform float uParticleRadii;
 
 out vec3 vPosView;
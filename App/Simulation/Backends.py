@@ -0,0 +1,224 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from App.Simulation import Kernels
+from App.Simulation.NarrowPhase import NarrowPhase
+
+# numba is optional, without it the NumPy backend is used
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+class NumpyBackend:
+    """
+    Whole-array NumPy kernels: vectorised integration and walls, the sort-based
+    spatial hash and the batched narrow phase. The default backend.
+    """
+    name = "numpy"
+
+    def Integrate(self, positions, velocities, gravity, dt: float):
+        velocities += np.asarray(gravity, dtype=np.float32) * dt
+        positions  += velocities * dt
+
+    def CollideWalls(self, positions, velocities, limit, friction: float, floorRestitution: float):
+        over  = positions >  limit
+        under = positions < -limit
+
+        np.copyto(positions,  limit, where=over)
+        np.copyto(positions, -limit, where=under)
+
+        # walls scale by friction, the floor uses its own restitution
+        bounce = np.where(over | under, np.float32(-friction), np.float32(1.0))
+        bounce[:, 1] = np.where(under[:, 1], np.float32(-floorRestitution), bounce[:, 1])
+        velocities *= bounce
+
+    def BuildGrid(self, spatialHash, positions):
+        spatialHash.Build(positions)
+
+    def Collide(self, spatialHash, positions, velocities, radius: float, awake=None) -> int:
+        if awake is None:
+            pairs_i, pairs_j = spatialHash.FindCandidatePairs()
+        else:
+            # skip cells of sleeping particles before expanding, then the remaining sleeping pairs
+            pairs_i, pairs_j = spatialHash.FindCandidatePairs(spatialHash.CellsContaining(awake))
+            keep = awake[pairs_i] | awake[pairs_j]
+            pairs_i, pairs_j = pairs_i[keep], pairs_j[keep]
+        return NarrowPhase.ResolveCollisions(positions, velocities, pairs_i, pairs_j, radius)
+
+    def CollidePairs(self, positions, velocities, radius: float, pairs_i, pairs_j, awake=None) -> int:
+        if awake is not None:
+            keep = awake[pairs_i] | awake[pairs_j]
+            pairs_i, pairs_j = pairs_i[keep], pairs_j[keep]
+        return NarrowPhase.ResolveCollisions(positions, velocities, pairs_i, pairs_j, radius)
+
+class PythonBackend:
+    """
+    Runs the loop kernels as plain interpreted Python.
+    Far too slow for real runs, it is the reference the other backends are checked against.
+    """
+    name = "python"
+
+    def __init__(self):
+        self._integrate = Kernels.IntegrateKernel
+        self._walls     = Kernels.WallKernel
+        self._build     = Kernels.BuildGridKernel
+        self._collide   = Kernels.CollideCellsKernel
+        self._apply     = Kernels.ApplyDeltasKernel
+        self._collide_pairs = Kernels.CollidePairsKernel
+
+    def Integrate(self, positions, velocities, gravity, dt: float):
+        self._integrate(positions, velocities, float(gravity[0]), float(gravity[1]), float(gravity[2]), float(dt))
+
+    def CollideWalls(self, positions, velocities, limit, friction: float, floorRestitution: float):
+        self._walls(positions, velocities, np.asarray(limit, dtype=np.float64), float(friction), float(floorRestitution))
+
+    def BuildGrid(self, spatialHash, positions):
+        order, cell_keys, cell_start, cell_end = self._build(
+            positions, spatialHash.cell_size, spatialHash.bound_size * 0.5, spatialHash.cell_count
+        )
+        spatialHash.SetCells(order, cell_keys, cell_start, cell_end)
+
+    @staticmethod
+    def _ActiveCells(spatialHash, positions, awake):
+        """
+        The occupied cells the collision kernel has to visit, and the awake mask it takes.
+        Without sleeping particles that is every cell, otherwise the cells holding or next
+        to an awake particle, since the kernel only looks at forward neighbours.
+        """
+        if awake is None:
+            return np.arange(spatialHash.cell_keys.size), np.ones(positions.shape[0], dtype=np.bool_)
+        active = spatialHash.DilateCells(spatialHash.CellsContaining(awake))
+        return np.flatnonzero(active), awake
+
+    def Collide(self, spatialHash, positions, velocities, radius: float, awake=None) -> int:
+        cells, awake = self._ActiveCells(spatialHash, positions, awake)
+        dpos = np.zeros(positions.shape, dtype=np.float64)
+        dvel = np.zeros(velocities.shape, dtype=np.float64)
+        contacts = self._collide(
+            positions, velocities, float(radius), spatialHash.order, spatialHash.cell_keys,
+            spatialHash.cell_start, spatialHash.cell_end, spatialHash.cell_count,
+            cells, awake, dpos, dvel
+        )
+        self._apply(positions, velocities, dpos, dvel)
+        return contacts
+
+    def CollidePairs(self, positions, velocities, radius: float, pairs_i, pairs_j, awake=None) -> int:
+        if awake is None:
+            awake = np.ones(positions.shape[0], dtype=np.bool_)
+        dpos = np.zeros(positions.shape, dtype=np.float64)
+        dvel = np.zeros(velocities.shape, dtype=np.float64)
+        contacts = self._collide_pairs(positions, velocities, float(radius), pairs_i, pairs_j, awake, dpos, dvel)
+        self._apply(positions, velocities, dpos, dvel)
+        return contacts
+
+class NumbaBackend(PythonBackend):
+    """
+    The loop kernels compiled with numba.njit.
+    Compilation happens once per process on first use.
+    """
+    name = "numba"
+    _compiled = None
+
+    def __init__(self):
+        if njit is None:
+            raise ImportError("numba is not installed")
+
+        # nogil lets ParallelBackend run the collision kernel from several threads
+        if NumbaBackend._compiled is None:
+            NumbaBackend._compiled = tuple(
+                njit(cache=True, nogil=True)(kernel)
+                for kernel in (Kernels.IntegrateKernel, Kernels.WallKernel, Kernels.BuildGridKernel,
+                               Kernels.CollideCellsKernel, Kernels.ApplyDeltasKernel, Kernels.CollidePairsKernel)
+            )
+        self._integrate, self._walls, self._build, self._collide, self._apply, self._collide_pairs = NumbaBackend._compiled
+
+class ParallelBackend(NumbaBackend):
+    """
+    Numba kernels with collisions solved on a thread pool.
+    The grid is cut into slabs of cells along x, coloured alternately. A slab only
+    reaches into the first layer of the next slab, so all slabs of one colour touch
+    disjoint particles and run concurrently; the two colours run one after another.
+    The single threaded backends remain the reference this is verified against.
+    Backends with the same worker count share one thread pool for the whole process,
+    so replacing the simulation does not leave idle pools behind.
+    """
+    name = "parallel"
+    _pools: dict[int, ThreadPoolExecutor] = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, workers: int = None):
+        super().__init__()
+        self._workers = max(1, workers or os.cpu_count() or 1)
+        with ParallelBackend._pools_lock:
+            if self._workers not in ParallelBackend._pools:
+                ParallelBackend._pools[self._workers] = ThreadPoolExecutor(
+                    max_workers=self._workers, thread_name_prefix="ParticleFlowCollide")
+            self._pool = ParallelBackend._pools[self._workers]
+
+    def GetWorkerCount(self) -> int:
+        return self._workers
+
+    def Collide(self, spatialHash, positions, velocities, radius: float, awake=None) -> int:
+        cells, awake = self._ActiveCells(spatialHash, positions, awake)
+        cell_count = spatialHash.cell_count
+        order = spatialHash.order
+        cell_keys = spatialHash.cell_keys
+        cell_start = spatialHash.cell_start
+        cell_end = spatialHash.cell_end
+
+        dpos = np.zeros(positions.shape, dtype=np.float64)
+        dvel = np.zeros(velocities.shape, dtype=np.float64)
+
+        # about one slab per worker and colour, cells are sorted by key so x is monotonic
+        slab_width = max(1, -(-int(cell_count[0]) // (2 * self._workers)))
+        slabs = cell_keys[cells] // (cell_count[1] * cell_count[2]) // slab_width
+        slab_bounds = np.flatnonzero(np.diff(slabs)) + 1
+        slab_cells = np.split(cells, slab_bounds)
+        slab_colours = [slab[0] % 2 for slab in np.split(slabs, slab_bounds) if slab.size]
+
+        contacts = 0
+        for colour in (0, 1):
+            jobs = [
+                self._pool.submit(
+                    self._collide, positions, velocities, float(radius), order, cell_keys,
+                    cell_start, cell_end, cell_count, slab, awake, dpos, dvel
+                )
+                for slab, slab_colour in zip(slab_cells, slab_colours)
+                if slab_colour == colour
+            ]
+            contacts += sum(job.result() for job in jobs)
+
+        self._apply(positions, velocities, dpos, dvel)
+        return contacts
+
+BACKENDS = {
+    "python":   PythonBackend,
+    "numpy":    NumpyBackend,
+    "numba":    NumbaBackend,
+    "parallel": ParallelBackend,
+}
+
+def AvailableBackends() -> list[str]:
+    """Names of the backends that can be created in this environment."""
+    return [name for name, backend in BACKENDS.items() if not issubclass(backend, NumbaBackend) or njit is not None]
+
+def CreateBackend(name: str = "numpy", workers: int = None):
+    """
+    Create a kernel backend by name.
+    The numba based backends fall back to "numpy" when numba is not installed.
+    `workers` sets the thread count of the "parallel" backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown simulation backend '{name}', expected one of {list(BACKENDS)}")
+
+    if issubclass(BACKENDS[name], NumbaBackend) and njit is None:
+        print(f"numba is not installed, falling back to the numpy backend instead of {name}")
+        name = "numpy"
+
+    if name == "parallel":
+        return ParallelBackend(workers)
+    return BACKENDS[name]()
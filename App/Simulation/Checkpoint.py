@@ -0,0 +1,72 @@
+import json
+
+import numpy as np
+
+class Checkpoint:
+    """
+    Versioned header-plus-arrays file format for saving simulation state.
+
+        magic    8 bytes   b"PFCKPT\\0\\0"
+        version  uint32
+        length   uint32    size of the JSON header in bytes
+        header   JSON      {"params": {...}, "arrays": {name: {"dtype", "shape", "offset"}}}
+        arrays   raw C-order data, every array starting on a 64 byte boundary
+
+    Read memory-maps the file and hands out the arrays as views into the mapping,
+    so opening a checkpoint reads nothing but the header.
+    """
+    MAGIC = b"PFCKPT\0\0"
+    VERSION = 3
+    ALIGNMENT = 64
+
+    @staticmethod
+    def Write(path: str, params: dict, arrays: dict[str, np.ndarray]):
+        arrays = {name: np.asarray(array, order="C") for name, array in arrays.items()}
+
+        # the data offsets depend on the header length, which depends on the offsets
+        table = {}
+        start = 0
+        while True:
+            offset = start
+            for name, array in arrays.items():
+                table[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+                offset = Checkpoint._Align(offset + array.nbytes)
+            header = json.dumps({"params": params, "arrays": table}).encode("utf-8")
+            data_start = Checkpoint._Align(16 + len(header))
+            if data_start == start:
+                break
+            start = data_start
+
+        with open(path, "wb") as f:
+            f.write(Checkpoint.MAGIC)
+            f.write(np.array([Checkpoint.VERSION, len(header)], dtype="<u4").tobytes())
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(table[name]["offset"])
+                f.write(array.data)
+
+    @staticmethod
+    def Read(path: str) -> tuple[dict, dict[str, np.ndarray]]:
+        """The parameters and read-only views of the arrays of a checkpoint file."""
+        with open(path, "rb") as f:
+            magic = f.read(8)
+            if magic != Checkpoint.MAGIC:
+                raise ValueError(f"{path} is not a checkpoint file")
+            version, length = np.frombuffer(f.read(8), dtype="<u4")
+            if version != Checkpoint.VERSION:
+                raise ValueError(f"Unsupported checkpoint version {version}, expected {Checkpoint.VERSION}")
+            header = json.loads(f.read(int(length)).decode("utf-8"))
+
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {}
+        for name, entry in header["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            shape = tuple(entry["shape"])
+            size = int(np.prod(shape)) * dtype.itemsize
+            offset = entry["offset"]
+            arrays[name] = raw[offset:offset + size].view(dtype).reshape(shape)
+        return header["params"], arrays
+
+    @staticmethod
+    def _Align(offset: int) -> int:
+        return -(-offset // Checkpoint.ALIGNMENT) * Checkpoint.ALIGNMENT
@@ -0,0 +1,190 @@
+"""
+Per-particle loop kernels for the simulation step.
+These are written so they run unchanged as plain Python (the reference backend)
+or compiled with numba.njit (the fast backend). Keep them to scalar loops over
+NumPy arrays so numba can type them.
+"""
+import math
+import numpy as np
+
+MIN_DISTANCE = 1e-5
+
+def IntegrateKernel(positions, velocities, gx, gy, gz, dt):
+    for i in range(positions.shape[0]):
+        velocities[i, 0] += gx * dt
+        velocities[i, 1] += gy * dt
+        velocities[i, 2] += gz * dt
+        positions[i, 0] += velocities[i, 0] * dt
+        positions[i, 1] += velocities[i, 1] * dt
+        positions[i, 2] += velocities[i, 2] * dt
+
+def WallKernel(positions, velocities, limit, friction, floorRestitution):
+    for i in range(positions.shape[0]):
+        for axis in range(3):
+            if positions[i, axis] > limit[axis]:
+                positions[i, axis] = limit[axis]
+                velocities[i, axis] *= -friction
+            elif positions[i, axis] < -limit[axis]:
+                positions[i, axis] = -limit[axis]
+                # the floor has its own restitution
+                if axis == 1:
+                    velocities[i, axis] *= -floorRestitution
+                else:
+                    velocities[i, axis] *= -friction
+
+def BuildGridKernel(positions, cellSize, half, cellCount):
+    """
+    Bin particles by linear cell key.
+    Returns (order, cell_keys, cell_start, cell_end) in the same layout as SpatialHash.
+    """
+    n = positions.shape[0]
+    keys = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        key = 0
+        for axis in range(3):
+            c = int(math.floor((positions[i, axis] + half[axis]) / cellSize))
+            c = min(max(c, 0), cellCount[axis] - 1)
+            key = key * cellCount[axis] + c
+        keys[i] = key
+
+    order = np.argsort(keys, kind="mergesort")
+
+    cell_keys  = np.empty(n, dtype=np.int64)
+    cell_start = np.empty(n, dtype=np.int64)
+    cell_end   = np.empty(n, dtype=np.int64)
+    cells = 0
+    for a in range(n):
+        key = keys[order[a]]
+        if cells == 0 or key != cell_keys[cells - 1]:
+            cell_keys[cells] = key
+            cell_start[cells] = a
+            cells += 1
+        cell_end[cells - 1] = a + 1
+
+    return order, cell_keys[:cells], cell_start[:cells], cell_end[:cells]
+
+def CollideCellsKernel(positions, velocities, radius, order, cell_keys, cell_start, cell_end, cellCount, cells, awake, dpos, dvel):
+    """
+    Find every overlapping pair between the given occupied cells and their forward
+    neighbours, accumulating corrections into dpos/dvel instead of applying them.
+    Pairs of two sleeping particles (awake is False for both) are skipped.
+    Deferring the update matches NarrowPhase and lets disjoint sets of cells be
+    processed concurrently. Returns the number of contacts.
+    """
+    diameter = 2.0 * radius
+    ny = cellCount[1]
+    nz = cellCount[2]
+    contacts = 0
+
+    for c in cells:
+        key = cell_keys[c]
+        cx = key // (ny * nz)
+        cy = (key // nz) % ny
+        cz = key % nz
+
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                for dz in range(-1, 2):
+                    # forward half of the neighbourhood, including the cell itself
+                    if not (dx > 0 or (dx == 0 and (dy > 0 or (dy == 0 and dz >= 0)))):
+                        continue
+                    ox = cx + dx
+                    oy = cy + dy
+                    oz = cz + dz
+                    if ox < 0 or oy < 0 or oz < 0 or ox >= cellCount[0] or oy >= ny or oz >= nz:
+                        continue
+
+                    if dx == 0 and dy == 0 and dz == 0:
+                        nc = c
+                    else:
+                        neighbour_key = (ox * ny + oy) * nz + oz
+                        nc = np.searchsorted(cell_keys, neighbour_key)
+                        if nc >= cell_keys.shape[0] or cell_keys[nc] != neighbour_key:
+                            continue
+
+                    for a in range(cell_start[c], cell_end[c]):
+                        i = order[a]
+                        first = a + 1 if nc == c else cell_start[nc]
+                        for b in range(first, cell_end[nc]):
+                            j = order[b]
+                            if not (awake[i] or awake[j]):
+                                continue
+                            ex = positions[j, 0] - positions[i, 0]
+                            ey = positions[j, 1] - positions[i, 1]
+                            ez = positions[j, 2] - positions[i, 2]
+                            d = math.sqrt(ex * ex + ey * ey + ez * ez)
+                            if d >= diameter or d < MIN_DISTANCE:
+                                continue
+
+                            ex /= d
+                            ey /= d
+                            ez /= d
+                            correction = (d - diameter) * 0.5
+                            impulse = ((velocities[j, 0] - velocities[i, 0]) * ex
+                                     + (velocities[j, 1] - velocities[i, 1]) * ey
+                                     + (velocities[j, 2] - velocities[i, 2]) * ez)
+
+                            dpos[i, 0] += ex * correction
+                            dpos[i, 1] += ey * correction
+                            dpos[i, 2] += ez * correction
+                            dpos[j, 0] -= ex * correction
+                            dpos[j, 1] -= ey * correction
+                            dpos[j, 2] -= ez * correction
+                            dvel[i, 0] += ex * impulse
+                            dvel[i, 1] += ey * impulse
+                            dvel[i, 2] += ez * impulse
+                            dvel[j, 0] -= ex * impulse
+                            dvel[j, 1] -= ey * impulse
+                            dvel[j, 2] -= ez * impulse
+                            contacts += 1
+
+    return contacts
+
+def CollidePairsKernel(positions, velocities, radius, pairs_i, pairs_j, awake, dpos, dvel):
+    """
+    Same response as CollideCellsKernel over an explicit list of pairs,
+    e.g. a neighbour list. Returns the number of contacts.
+    """
+    diameter = 2.0 * radius
+    contacts = 0
+    for p in range(pairs_i.shape[0]):
+        i = pairs_i[p]
+        j = pairs_j[p]
+        if not (awake[i] or awake[j]):
+            continue
+        ex = positions[j, 0] - positions[i, 0]
+        ey = positions[j, 1] - positions[i, 1]
+        ez = positions[j, 2] - positions[i, 2]
+        d = math.sqrt(ex * ex + ey * ey + ez * ez)
+        if d >= diameter or d < MIN_DISTANCE:
+            continue
+
+        ex /= d
+        ey /= d
+        ez /= d
+        correction = (d - diameter) * 0.5
+        impulse = ((velocities[j, 0] - velocities[i, 0]) * ex
+                 + (velocities[j, 1] - velocities[i, 1]) * ey
+                 + (velocities[j, 2] - velocities[i, 2]) * ez)
+
+        dpos[i, 0] += ex * correction
+        dpos[i, 1] += ey * correction
+        dpos[i, 2] += ez * correction
+        dpos[j, 0] -= ex * correction
+        dpos[j, 1] -= ey * correction
+        dpos[j, 2] -= ez * correction
+        dvel[i, 0] += ex * impulse
+        dvel[i, 1] += ey * impulse
+        dvel[i, 2] += ez * impulse
+        dvel[j, 0] -= ex * impulse
+        dvel[j, 1] -= ey * impulse
+        dvel[j, 2] -= ez * impulse
+        contacts += 1
+
+    return contacts
+
+def ApplyDeltasKernel(positions, velocities, dpos, dvel):
+    for i in range(positions.shape[0]):
+        for axis in range(3):
+            positions[i, axis] += dpos[i, axis]
+            velocities[i, axis] += dvel[i, axis]
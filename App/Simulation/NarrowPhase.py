@@ -0,0 +1,62 @@
+import numpy as np
+
+class NarrowPhase:
+    """
+    Batched particle-particle collision tests over arrays of candidate pairs.
+
+    ResolveCollisions applies the same positional correction and elastic impulse as
+    Simulation.ResolveCollision, but computes every contact from the state at the
+    start of the call and scatter-adds the results (a Jacobi update).
+    When no particle takes part in more than one contact this matches resolving the
+    pairs one by one to float32 rounding (absolute tolerance 1e-5). A particle with
+    several contacts receives the sum of its corrections instead of having them
+    applied in sequence, so those cases differ from the scalar path by design.
+    """
+    MIN_DISTANCE = 1e-5
+
+    @staticmethod
+    def FindContacts(positions: np.ndarray, pairs_i: np.ndarray, pairs_j: np.ndarray, radius: float):
+        """
+        Distances for every candidate pair and a mask of the pairs that overlap.
+        Returns (mask, impact vectors, distances) for all candidates.
+        """
+        impact = positions[pairs_j] - positions[pairs_i]
+        distance = np.sqrt(np.einsum("ij,ij->i", impact, impact))
+        mask = (distance < 2.0 * radius) & (distance >= NarrowPhase.MIN_DISTANCE)
+        return mask, impact, distance
+
+    @staticmethod
+    def ResolveCollisions(positions: np.ndarray, velocities: np.ndarray,
+                          pairs_i: np.ndarray, pairs_j: np.ndarray, radius: float) -> int:
+        """
+        Separate overlapping pairs and exchange velocity along the contact normal.
+        Updates positions and velocities in place and returns the number of contacts.
+        """
+        mask, impact, distance = NarrowPhase.FindContacts(positions, pairs_i, pairs_j, radius)
+        if not mask.any():
+            return 0
+
+        i = pairs_i[mask]
+        j = pairs_j[mask]
+        normal = impact[mask] / distance[mask, None]
+        diameter = 2.0 * radius
+
+        # push both particles apart by half the overlap each
+        correction = normal * ((distance[mask] - diameter) * 0.5)[:, None]
+
+        # equal masses: dV = n * dot(vj - vi, n) along the corrected impact vector
+        v_diff = velocities[j] - velocities[i]
+        impulse = normal * np.einsum("ij,ij->i", v_diff, normal)[:, None]
+
+        NarrowPhase.ScatterAdd(positions, i, correction)
+        NarrowPhase.ScatterAdd(positions, j, -correction)
+        NarrowPhase.ScatterAdd(velocities, i, impulse)
+        NarrowPhase.ScatterAdd(velocities, j, -impulse)
+        return int(i.size)
+
+    @staticmethod
+    def ScatterAdd(target: np.ndarray, index: np.ndarray, values: np.ndarray):
+        """target[index] += values, accumulating repeated indices."""
+        n = target.shape[0]
+        for axis in range(target.shape[1]):
+            target[:, axis] += np.bincount(index, weights=values[:, axis], minlength=n).astype(target.dtype)
@@ -0,0 +1,254 @@
+import numpy as np
+
+class ParticleStore:
+    """
+    Structure-of-arrays particle storage.
+    Every per-particle attribute lives in its own contiguous float32 array of shape
+    (capacity, 3); only the first `count` rows are live. Capacity grows geometrically
+    so AddParticle is amortised O(1) and whole-array kernels can run on the views.
+    The sleep state (flag, seconds spent calm and the position the particle has
+    been resting at) is kept alongside in the same way.
+
+    Rows can be reordered with Permute, so every particle also has a stable ID given
+    out in insertion order, and IndexOf maps IDs back to their current rows.
+
+    Remove keeps the live rows dense by moving particles from the end into the holes,
+    and the IDs of removed particles go on a free list to be handed out again, so a
+    store that sees as many removals as additions never grows. Every particle also
+    has a remaining lifetime in seconds, infinite unless given. Since IDs come back,
+    every particle also gets a serial number counting all particles ever added, which
+    is never reused and tells a new particle apart from the one that had its ID.
+    """
+    _ATTRIBUTES = ("_positions", "_velocities", "_colors", "_asleep", "_sleep_timers", "_sleep_anchors",
+                   "_lifetimes", "_ids", "_serials")
+
+    def __init__(self, capacity: int = 64):
+        capacity = max(1, int(capacity))
+        self._count = 0
+        self._positions  = np.zeros((capacity, 3), dtype=np.float32)
+        self._velocities = np.zeros((capacity, 3), dtype=np.float32)
+        self._colors     = np.zeros((capacity, 3), dtype=np.float32)
+
+        self._asleep         = np.zeros(capacity, dtype=np.bool_)
+        self._sleep_timers   = np.zeros(capacity, dtype=np.float32)
+        self._sleep_anchors  = np.zeros((capacity, 3), dtype=np.float32)
+
+        self._lifetimes = np.full(capacity, np.inf, dtype=np.float32)
+
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._next_id = 0
+        # row of every ID handed out so far, -1 once the particle is removed
+        self._index_of = np.full(capacity, -1, dtype=np.int64)
+        # stack of removed IDs, sized like _index_of so it can hold every ID
+        self._free_ids = np.zeros(capacity, dtype=np.int64)
+        self._free_count = 0
+
+        self._serials = np.zeros(capacity, dtype=np.int64)
+        self._next_serial = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        return self._positions.shape[0]
+
+    # Views over the live rows, these write straight through to the store
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions[:self._count]
+
+    @property
+    def velocities(self) -> np.ndarray:
+        return self._velocities[:self._count]
+
+    @property
+    def colors(self) -> np.ndarray:
+        return self._colors[:self._count]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._count]
+
+    @property
+    def serials(self) -> np.ndarray:
+        return self._serials[:self._count]
+
+    @property
+    def lifetimes(self) -> np.ndarray:
+        return self._lifetimes[:self._count]
+
+    @property
+    def asleep(self) -> np.ndarray:
+        return self._asleep[:self._count]
+
+    @property
+    def sleep_timers(self) -> np.ndarray:
+        return self._sleep_timers[:self._count]
+
+    @property
+    def sleep_anchors(self) -> np.ndarray:
+        return self._sleep_anchors[:self._count]
+
+    def Reserve(self, capacity: int, exact: bool = False):
+        """
+        Make sure at least `capacity` rows are allocated.
+        Grows to at least double the current capacity to keep appends amortised,
+        or to exactly `capacity` for a pool of fixed size.
+        """
+        if capacity <= self.capacity:
+            return
+
+        new_capacity = int(capacity) if exact else max(int(capacity), self.capacity * 2)
+        for name in self._ATTRIBUTES:
+            old = getattr(self, name)
+            new = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._count] = old[:self._count]
+            setattr(self, name, new)
+
+    def _AssignIds(self, start: int, end: int):
+        """Give rows [start, end) IDs, reusing removed IDs before making new ones."""
+        count = end - start
+        reused = min(count, self._free_count)
+        self._free_count -= reused
+        ids = np.empty(count, dtype=np.int64)
+        ids[:reused] = self._free_ids[self._free_count:self._free_count + reused]
+        ids[reused:] = np.arange(self._next_id, self._next_id + count - reused)
+        self._next_id += count - reused
+
+        if self._next_id > self._index_of.size:
+            size = max(self._next_id, 2 * self._index_of.size)
+            index_of = np.full(size, -1, dtype=np.int64)
+            index_of[:self._index_of.size] = self._index_of
+            self._index_of = index_of
+            free_ids = np.zeros(size, dtype=np.int64)
+            free_ids[:self._free_count] = self._free_ids[:self._free_count]
+            self._free_ids = free_ids
+        self._ids[start:end] = ids
+        self._index_of[ids] = np.arange(start, end)
+        self._serials[start:end] = np.arange(self._next_serial, self._next_serial + count)
+        self._next_serial += count
+
+    def _FreeIds(self, ids: np.ndarray):
+        self._index_of[ids] = -1
+        self._free_ids[self._free_count:self._free_count + len(ids)] = ids
+        self._free_count += len(ids)
+
+    def AddParticle(self, position, velocity, color, lifetime: float = np.inf) -> int:
+        """Append a single particle and return its index."""
+        self.Reserve(self._count + 1)
+        i = self._count
+        self._AssignIds(i, i + 1)
+        self._positions[i]  = position
+        self._velocities[i] = velocity
+        self._colors[i]     = color
+        self._asleep[i] = False
+        self._sleep_timers[i] = 0.0
+        self._sleep_anchors[i]  = position
+        self._lifetimes[i] = lifetime
+        self._count += 1
+        return i
+
+    def AddParticles(self, positions, velocities, colors, lifetimes=np.inf) -> slice:
+        """
+        Append a batch of particles in one copy.
+        Returns the slice of indices the new particles occupy.
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        n = positions.shape[0]
+        self.Reserve(self._count + n)
+
+        start = self._count
+        end = start + n
+        self._AssignIds(start, end)
+        self._positions[start:end]  = positions
+        self._velocities[start:end] = velocities
+        self._colors[start:end]     = colors
+        self._asleep[start:end] = False
+        self._sleep_timers[start:end] = 0.0
+        self._sleep_anchors[start:end]  = positions
+        self._lifetimes[start:end] = lifetimes
+        self._count = end
+        return slice(start, end)
+
+    def Remove(self, rows) -> int:
+        """
+        Remove the particles in `rows` and return how many were removed.
+        The last live particles are moved into the freed rows so the live rows stay
+        dense; every other row keeps its particle. Removed IDs map to row -1.
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if rows.size == 0:
+            return 0
+        if rows[0] < 0 or rows[-1] >= self._count:
+            raise IndexError("particle row out of range")
+
+        keep = self._count - rows.size
+        removed_ids = self._ids[rows].copy()
+
+        # holes below the new end are filled from the survivors past it
+        holes = rows[rows < keep]
+        survivors = np.ones(rows.size, dtype=np.bool_)
+        survivors[rows[rows >= keep] - keep] = False
+        sources = keep + np.flatnonzero(survivors)
+        for name in self._ATTRIBUTES:
+            array = getattr(self, name)
+            array[holes] = array[sources]
+
+        self._FreeIds(removed_ids)
+        self._index_of[self._ids[holes]] = holes
+        self._count = keep
+        return rows.size
+
+    def Permute(self, order: np.ndarray):
+        """
+        Reorder the live rows so row k holds what was row order[k], in every attribute.
+        IDs move with their particles.
+        """
+        order = np.asarray(order)
+        for name in self._ATTRIBUTES:
+            array = getattr(self, name)
+            array[:self._count] = array[order]
+        self._index_of[self.ids] = np.arange(self._count)
+
+    def IndexOf(self, ids) -> np.ndarray:
+        """Current rows of the given particle IDs, -1 for removed particles."""
+        return self._index_of[np.asarray(ids, dtype=np.int64)]
+
+    def GetState(self) -> dict[str, np.ndarray]:
+        """
+        Every live attribute and the ID bookkeeping as named arrays, for saving.
+        The arrays are views into the store, copy them to keep them.
+        """
+        state = {name.lstrip("_"): getattr(self, name)[:self._count] for name in self._ATTRIBUTES}
+        state["next_id"] = np.int64(self._next_id)
+        state["next_serial"] = np.int64(self._next_serial)
+        state["free_ids"] = self._free_ids[:self._free_count]
+        return state
+
+    def SetState(self, state: dict[str, np.ndarray]):
+        """Replace the contents with a state from GetState, one bulk copy per attribute."""
+        count = len(state["positions"])
+        self._count = 0
+        self.Reserve(count)
+        for name in self._ATTRIBUTES:
+            getattr(self, name)[:count] = state[name.lstrip("_")]
+        self._count = count
+
+        self._next_id = int(state["next_id"])
+        self._next_serial = int(state["next_serial"])
+        size = max(self._next_id, self.capacity)
+        self._index_of = np.full(size, -1, dtype=np.int64)
+        self._index_of[self.ids] = np.arange(count)
+        free_ids = np.asarray(state["free_ids"], dtype=np.int64)
+        self._free_ids = np.zeros(size, dtype=np.int64)
+        self._free_ids[:free_ids.size] = free_ids
+        self._free_count = free_ids.size
+
+    def Clear(self):
+        self._FreeIds(self.ids.copy())
+        self._count = 0
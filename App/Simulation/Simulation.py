@@ -1,9 +1,16 @@
 import glm
+import numpy as np
 
-import math
-import random
+import time
+from contextlib import contextmanager
 
-import copy
+from Engine.Core.Profiler import Profiler
+from App.Simulation.ParticleStore import ParticleStore
+from App.Simulation.Backends import CreateBackend, AvailableBackends
+from App.Simulation.SpatialHash import SpatialHash
+from App.Simulation.NarrowPhase import NarrowPhase
+from App.Simulation.Emitter import Emitter
+from App.Simulation.Checkpoint import Checkpoint
 
 class Cell:
     def __init__(self):
@@ -28,7 +35,21 @@ class Cell:
         return self.particles
 
 class Simulation:
-    def __init__(self, particleNumber, particleSize, boundSize, frictionCoefficient):
+    # backend picked by SelectBackend(), checked once per process
+    _selected_backend = None
+
+    # profiler scope names of the step phases
+    _PHASE_SCOPES = {
+        "integrate": "Integrate",
+        "walls": "Walls",
+        "grid": "GridBuild",
+        "narrow_phase": "NarrowPhase",
+        "sleep": "Sleep",
+        "reorder": "Reorder",
+        "kill": "Kill",
+    }
+
+    def __init__(self, particleNumber, particleSize, boundSize, frictionCoefficient, backend="numpy", seed=None, workers=None):
         # Ensure boundSize is always a glm.vec3
         if not isinstance(boundSize, glm.vec3):
             boundSize = glm.vec3(*boundSize)
@@ -39,45 +60,75 @@ class Simulation:
         self._friction_coefficient = frictionCoefficient
         self._velocity_damping = 40.0
         self._gravity = glm.vec3(0, -2.8, 0)
+        self._floor_restitution = 0.8
         
-        self._positions: list[glm.vec3] = []
-        self._velocities: list[glm.vec3] = []
-        self._colors:     list[glm.vec3] = []
+        # positions, velocities and colours live in contiguous float32 arrays, allocated
+        # once for the particle number so emitting and removing never reallocates
+        self._particles = ParticleStore(self._particle_number)
+
+        # particles are removed when their lifetime runs out or they enter a kill zone,
+        # an axis-aligned (min corner, max corner) box
+        self._kill_zones: list[tuple[np.ndarray, np.ndarray]] = []
+        self._removed = 0
+
+        # kernels for integration, walls and collisions
+        if backend == "auto":
+            backend = Simulation.SelectBackend()
+        self._backend = CreateBackend(backend, workers)
+        self._rng = np.random.default_rng(seed)
+
+        # substeps per frame are picked so no particle moves more than
+        # `cfl` radii in one substep, within [min, max]
+        self._cfl = 0.5
+        self._min_substeps = 1
+        self._max_substeps = 8
+        self._last_substeps = 0
+        self._last_max_speed = 0.0
+        self._total_substeps = 0
+        self._frames = 0
+
+        # particles resting on the floor or on a sleeping particle that stay calm for
+        # `_sleep_time` seconds with no restless neighbour fall asleep and are left out
+        # of integration and pair generation; off by default since it changes the
+        # results, turned on with SetSleeping
+        self._sleeping = False
+        self._sleep_velocity = 0.05
+        self._sleep_displacement = 0.25  # in particle radii
+        self._sleep_time = 0.125
+
+        # between full rebuilds the grid only moves particles that changed cell,
+        # the periodic rebuild puts particles back in index order within their cells
+        self._incremental_grid = True
+        self._grid_rebuild_interval = 32
+        self._grid_updates = 0
+        self._grid_moved = 0
+
+        # optional Verlet neighbour list: pairs closer than a diameter plus the skin,
+        # reused until some particle has moved more than half the skin
+        self._neighbour_list = False
+        self._neighbour_skin = 1.0  # in particle radii
+        self._neighbour_pairs = None
+        self._neighbour_origin = None
+        self._neighbour_rebuilds = 0
+
+        # every `_reorder_interval` frames the particle arrays are sorted along a
+        # Z-order curve over the cells, 0 turns it off
+        self._reorder_interval = 0
+
+        # accumulated seconds per step phase, only gathered while timing is enabled
+        self._phase_timing = False
+        self._phase_times: dict[str, float] = {}
 
 
         self._initial_particle_velocity = glm.vec3(0.2, 2, 0)
-        self._emitter_position = glm.vec3(0, 0, 0)
-        self._emission_rate = 10
-        self._emission_interval = 1 / self._emission_rate  # particles per second
-        
-        self.ttl_particles = 0.0
+        # fills the simulation up to the particle number, 10 particles per second by default
+        self._emitter = Emitter(rate=10.0, velocity=self._initial_particle_velocity)
 
-        self._cell_size = self._particle_radius * 12 # self.CalculateOptimalCellSize() # self._particle_radius * 6
-        self._cell_count = glm.vec3(
-            int(math.ceil(self._bound_size.x // self._cell_size)),
-            int(math.ceil(self._bound_size.y // self._cell_size)),
-            int(math.ceil(self._bound_size.z // self._cell_size))
-        )
-        
-        self._grid_template = [
-            [
-                [Cell() for _ in range(int(self._cell_count.z))]
-                for _ in range(int(self._cell_count.y))
-            ]
-            for _ in range(int(self._cell_count.x))
-        ]
-
-        # initialise grid and particle‐cell list correctly
-        self._grid = copy.deepcopy(self._grid_template)
-        self._has_particles: list[glm.vec3] = []
-        
-        self._neighbour_offsets = [
-            glm.vec3(dx, dy, dz)
-            for dx in (-1, 0, 1)
-            for dy in (-1, 0, 1)
-            for dz in (-1, 0, 1)
-            if not (dx == 0 and dy == 0 and dz == 0)
-        ]
+        # cells only need to span the collision range now that empty cells cost nothing
+        self._spatial_hash = SpatialHash(1.0, self._bound_size)
+        self.ResizeGrid(self.CalculateOptimalCellSize())
+        # set by Reconfigure, the grid is re-derived once before the next step
+        self._grid_dirty = False
 
     def CalculateOptimalCellSize(self, scale: float = 1.5) -> float:
         """
@@ -86,6 +137,74 @@ class Simulation:
         """
         return 2.0 * self._particle_radius * scale
 
+    @staticmethod
+    def VerifyBackends(particles: int = 48, frames: int = 30, seed: int = 1234) -> dict[str, float]:
+        """
+        Run the same seeded scene on every available backend.
+        Returns each backend's largest position deviation from the pure-Python reference.
+        """
+        rng = np.random.default_rng(seed)
+        positions  = rng.uniform(-0.25, 0.25, size=(particles, 3))
+        velocities = rng.uniform(-1.0, 1.0, size=(particles, 3))
+
+        trajectories = {}
+        for name in AvailableBackends():
+            sim = Simulation(particles, 0.1, (0.6, 0.6, 0.6), 0.7, backend=name, seed=seed)
+            # a fixed count, so rounding differences cannot change the schedule
+            sim.SetSubstepping(minSubsteps=2, maxSubsteps=2)
+            sim.SetSleeping(False)
+            for position, velocity in zip(positions, velocities):
+                sim.AddParticle(position, velocity)
+            for _ in range(frames):
+                sim.OnUpdate(1 / 240)
+            trajectories[name] = sim.GetPoints().copy()
+
+        reference = trajectories["python"]
+        return {name: float(np.abs(points - reference).max()) for name, points in trajectories.items()}
+
+    @staticmethod
+    def TimeBackend(name: str, particles: int = 2000, steps: int = 5, seed: int = 0) -> float:
+        """Seconds per step of a seeded, randomly filled scene on one backend."""
+        rng = np.random.default_rng(seed)
+        sim = Simulation(particles, 0.02, (1.0, 1.0, 1.0), 0.7, backend=name, seed=seed)
+        sim.SetSleeping(False)
+        sim.AddParticles(rng.uniform(-0.49, 0.49, size=(particles, 3)), rng.uniform(-1.0, 1.0, size=(particles, 3)))
+        # the first step includes JIT compilation and cache warm up
+        sim.OnUpdate(1 / 240)
+        start = time.perf_counter()
+        for _ in range(steps):
+            sim.OnUpdate(1 / 240)
+        return (time.perf_counter() - start) / steps
+
+    @staticmethod
+    def SelectBackend(tolerance: float = 1e-4) -> str:
+        """
+        Pick the fastest of numpy and the numba backends whose trajectories match the
+        reference, timed on a short scene. Both the check and the timing only run the
+        first time this is called.
+        """
+        if Simulation._selected_backend is None:
+            deviations = Simulation.VerifyBackends()
+            for name, deviation in deviations.items():
+                print(f"Backend {name}: max deviation {deviation:.2e}")
+            candidates = ["numpy"] + [name for name in ("numba", "parallel")
+                                      if deviations.get(name, tolerance + 1) <= tolerance]
+            timings = {name: Simulation.TimeBackend(name) for name in candidates}
+            for name, seconds in timings.items():
+                print(f"Backend {name}: {seconds * 1000:.2f} ms per step")
+            Simulation._selected_backend = min(timings, key=timings.get)
+        return Simulation._selected_backend
+
+    def ResizeGrid(self, cellSize: float):
+        """
+        Set the broad phase cell size and re-derive the number of cells per axis.
+        Cells must be at least one particle diameter wide.
+        """
+        self._cell_size = cellSize
+        self._spatial_hash.SetGrid(self._cell_size, self._bound_size)
+        self._grid_updates = 0
+        self._neighbour_pairs = None
+        self._cell_count = glm.vec3(*self._spatial_hash.GetCellCount())
         
     def OnUpdate(self, dt: float):
         """
@@ -94,52 +213,475 @@ class Simulation:
         """
         # if len(self._positions) > 0:
         #    print(self._positions[0])
+
+        if self._grid_dirty:
+            self.RederiveGrid()
+
+        if self._reorder_interval and self._frames % self._reorder_interval == 0:
+            with self._Phase("reorder"):
+                self.Reorder()
         
-        if len(self._positions) < self._particle_number and self.ttl_particles > self._emission_interval:
-            self.AddParticle(self._emitter_position)
-            self.ttl_particles = 0
-        else:
-            self.ttl_particles += dt
-                
+        due = self._emitter.Advance(dt)
+        room = self.GetRoom()
+        if due > 0 and room > 0:
+            self.Emit(min(due, room))
+
         # Update particle positions, velocities, etc. here
-        substep = 2
+        substep = self.ComputeSubsteps(dt)
         substep_size = dt / substep
         for _ in range(substep):
             self.OnUpdateSubstep(substep_size)
-            
+
+        with self._Phase("kill"):
+            self.RemoveDead(dt)
+
+        self._last_substeps = substep
+        self._total_substeps += substep
+        self._frames += 1
+
+    def ComputeSubsteps(self, dt: float) -> int:
+        """
+        Number of substeps for a frame of `dt` seconds.
+        Chosen from the fastest particle, plus what gravity adds over the frame, so it
+        travels at most `cfl` particle radii per substep and cannot tunnel through a neighbour.
+        """
+        velocities = self._particles.velocities
+        max_speed = float(np.sqrt(np.max(np.einsum("ij,ij->i", velocities, velocities)))) if len(velocities) else 0.0
+        self._last_max_speed = max_speed
+
+        travel = (max_speed + glm.length(self._gravity) * dt) * dt
+        reach = self._cfl * max(self._particle_radius, 1e-9)
+        substeps = int(np.ceil(travel / reach))
+        return min(max(substeps, self._min_substeps), self._max_substeps)
+
+    def SetSubstepping(self, cfl: float = None, minSubsteps: int = None, maxSubsteps: int = None):
+        """Set the CFL number and the bounds of the adaptive substep count, None keeps the current value."""
+        cfl = self._cfl if cfl is None else cfl
+        minSubsteps = self._min_substeps if minSubsteps is None else max(1, int(minSubsteps))
+        maxSubsteps = self._max_substeps if maxSubsteps is None else max(1, int(maxSubsteps))
+        if cfl <= 0:
+            raise ValueError("cfl must be positive")
+        if minSubsteps > maxSubsteps:
+            raise ValueError("minSubsteps must not exceed maxSubsteps")
+
+        self._cfl = cfl
+        self._min_substeps = minSubsteps
+        self._max_substeps = maxSubsteps
+
+    def GetStepStats(self) -> dict:
+        """
+        Statistics of the adaptive substepping: the substep count and maximum speed
+        of the last frame, and the mean substeps per frame since the simulation started.
+        """
+        return {
+            "substeps": self._last_substeps,
+            "mean_substeps": self._total_substeps / self._frames if self._frames else 0.0,
+            "max_speed": self._last_max_speed,
+            "cfl": self._cfl,
+            "min_substeps": self._min_substeps,
+            "max_substeps": self._max_substeps,
+            "asleep": self.GetSleepingCount(),
+            "grid_moved": self._grid_moved,
+            "neighbour_rebuilds": self._neighbour_rebuilds,
+            "neighbour_pairs": len(self._neighbour_pairs[0]) if self._neighbour_pairs is not None else 0,
+            "removed": self._removed,
+        }
+
     def AddParticle(self, position: glm.vec3, velocity: glm.vec3 = None):
         """
         Add a new particle to the simulation at the specified position.
         If no velocity is provided, it defaults to the initial particle velocity.
+        Nothing is added once the particle number is reached.
         """
+        if self.GetRoom() <= 0:
+            return
 
-        v = glm.vec3(self._initial_particle_velocity.x, self._initial_particle_velocity.y, self._initial_particle_velocity.z)
-            
-        spawn_pos = glm.vec3(position.x, position.y, position.z)
-        
-        self._positions.append(spawn_pos)
-        self._velocities.append(v)
-        col = glm.vec3(
-            random.uniform(0.0, 1.0),
-            random.uniform(0.0, 1.0),
-            random.uniform(0.0, 1.0)
-            )
-        self._colors.append(col)
+        if velocity is None:
+            velocity = self._initial_particle_velocity
+
+        col = self._rng.uniform(0.0, 1.0, size=3)
+        self._particles.AddParticle(position, velocity, col)
     
+    def Emit(self, count: int):
+        """Add `count` particles from the emitter in one batch."""
+        positions, velocities = self._emitter.Sample(count, self._rng, jitter=0.5 * self._particle_radius)
+        self.AddParticles(positions, velocities, lifetimes=self._emitter.lifetime)
+
+    def Prefill(self, count: int = None, margin: float = 1.0):
+        """
+        Fill the domain with an even lattice of resting particles, up to the particle
+        number by default, so runs can start at full density. `margin` is the gap
+        kept to the walls in particle radii.
+        """
+        room = self.GetRoom()
+        count = room if count is None else min(count, room)
+        if count <= 0:
+            return
+        extents = np.asarray(self._bound_size, dtype=np.float32) - 2.0 * margin * self._particle_radius
+        positions = Emitter.LatticePoints(count, np.maximum(extents, 0.0))
+        self.AddParticles(positions, np.zeros_like(positions))
+
+    def SaveCheckpoint(self, path: str):
+        """
+        Save the complete state to a checkpoint file: the particle arrays, the grid
+        binning, the emitter, every parameter and the RNG state. A simulation loaded
+        from it continues exactly like this one would.
+        """
+        # a pending Reconfigure would otherwise save the cell size of the old particles
+        if self._grid_dirty:
+            self.RederiveGrid()
+
+        params = {
+            "backend": self._backend.name,
+            "particle_number": self._particle_number,
+            "particle_radius": self._particle_radius,
+            "bound_size": list(self._bound_size),
+            "friction_coefficient": self._friction_coefficient,
+            "velocity_damping": self._velocity_damping,
+            "gravity": list(self._gravity),
+            "floor_restitution": self._floor_restitution,
+            "initial_particle_velocity": list(self._initial_particle_velocity),
+            "cfl": self._cfl,
+            "min_substeps": self._min_substeps,
+            "max_substeps": self._max_substeps,
+            "sleeping": self._sleeping,
+            "sleep_velocity": self._sleep_velocity,
+            "sleep_displacement": self._sleep_displacement,
+            "sleep_time": self._sleep_time,
+            "incremental_grid": self._incremental_grid,
+            "grid_rebuild_interval": self._grid_rebuild_interval,
+            "grid_updates": self._grid_updates,
+            "cell_size": self._cell_size,
+            "neighbour_list": self._neighbour_list,
+            "neighbour_skin": self._neighbour_skin,
+            "reorder_interval": self._reorder_interval,
+            "kill_zones": [(lower.tolist(), upper.tolist()) for lower, upper in self._kill_zones],
+            "frames": self._frames,
+            "total_substeps": self._total_substeps,
+            "last_substeps": self._last_substeps,
+            "last_max_speed": self._last_max_speed,
+            "grid_moved": self._grid_moved,
+            "neighbour_rebuilds": self._neighbour_rebuilds,
+            "removed": self._removed,
+            "emitter": self._emitter.GetState(),
+            "rng": self._rng.bit_generator.state,
+        }
+
+        arrays = self._particles.GetState()
+        grid = self._spatial_hash
+        arrays.update(grid_order=grid.order, grid_cell_keys=grid.cell_keys,
+                      grid_cell_start=grid.cell_start, grid_cell_end=grid.cell_end)
+        if self._neighbour_pairs is not None:
+            arrays.update(neighbour_i=self._neighbour_pairs[0], neighbour_j=self._neighbour_pairs[1],
+                          neighbour_origin=self._neighbour_origin)
+
+        Checkpoint.Write(path, params, arrays)
+
+    @staticmethod
+    def LoadCheckpoint(path: str, backend: str = None, workers: int = None) -> "Simulation":
+        """
+        Create a simulation from a file written by SaveCheckpoint.
+        The file is memory-mapped and every array is copied into place in one go.
+        `backend` overrides the backend the checkpoint was saved with.
+        """
+        params, data = Checkpoint.Read(path)
+        sim = Simulation(params["particle_number"], 2.0 * params["particle_radius"], params["bound_size"],
+                         params["friction_coefficient"], backend=backend or params["backend"], workers=workers)
+        sim._velocity_damping = params["velocity_damping"]
+        sim._gravity = glm.vec3(*params["gravity"])
+        sim._floor_restitution = params["floor_restitution"]
+        sim._initial_particle_velocity = glm.vec3(*params["initial_particle_velocity"])
+        sim.SetSubstepping(params["cfl"], params["min_substeps"], params["max_substeps"])
+        sim.SetSleeping(params["sleeping"], params["sleep_velocity"], params["sleep_displacement"], params["sleep_time"])
+        sim.SetIncrementalGrid(params["incremental_grid"], params["grid_rebuild_interval"])
+        sim._neighbour_list = params["neighbour_list"]
+        sim._neighbour_skin = params["neighbour_skin"]
+        sim.SetReordering(params["reorder_interval"])
+        for lower, upper in params["kill_zones"]:
+            sim.AddKillZone(lower, upper)
+        sim._frames = params["frames"]
+        sim._total_substeps = params["total_substeps"]
+        sim._last_substeps = params["last_substeps"]
+        sim._last_max_speed = params["last_max_speed"]
+        sim._grid_moved = params["grid_moved"]
+        sim._neighbour_rebuilds = params["neighbour_rebuilds"]
+        sim._removed = params["removed"]
+        sim._emitter = Emitter.FromState(params["emitter"])
+        sim._rng.bit_generator.state = params["rng"]
+
+        sim._particles.SetState({name: data[name] for name in sim._particles.GetState()})
+
+        sim.ResizeGrid(params["cell_size"])
+        sim._spatial_hash.SetCells(*(np.array(data[name]) for name in
+                                     ("grid_order", "grid_cell_keys", "grid_cell_start", "grid_cell_end")))
+        sim._grid_updates = params["grid_updates"]
+        if "neighbour_i" in data:
+            sim._neighbour_pairs = (np.array(data["neighbour_i"]), np.array(data["neighbour_j"]))
+            sim._neighbour_origin = np.array(data["neighbour_origin"])
+        return sim
+
+    def GetEmitter(self) -> Emitter:
+        return self._emitter
+
+    def SetEmitter(self, emitter: Emitter):
+        self._emitter = emitter
+
+    def AddParticles(self, positions, velocities=None, colors=None, lifetimes=np.inf):
+        """
+        Add a batch of particles in one copy and return how many were added.
+        Velocities default to the initial particle velocity and colours are random,
+        `lifetimes` are in seconds. The batch is cut short at the particle number, so
+        the pool never grows past it.
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        n = min(len(positions), self.GetRoom())
+        if n <= 0:
+            return 0
+
+        if velocities is None:
+            velocities = np.asarray(self._initial_particle_velocity, dtype=np.float32)
+        if colors is None:
+            colors = self._rng.uniform(0.0, 1.0, size=(n, 3))
+        # per-particle rows are cut with the positions, shared values are broadcast
+        velocities, colors, lifetimes = np.asarray(velocities), np.asarray(colors), np.asarray(lifetimes)
+        if velocities.ndim == 2:
+            velocities = velocities[:n]
+        if colors.ndim == 2:
+            colors = colors[:n]
+        if lifetimes.ndim == 1:
+            lifetimes = lifetimes[:n]
+        self._particles.AddParticles(positions[:n], velocities, colors, lifetimes)
+        return n
+
+    def RemoveParticles(self, rows) -> int:
+        """
+        Remove the particles in `rows` and return how many were removed.
+        The last particles move into the freed rows, so rows of other particles can
+        change; refer to particles by ID across a removal. Sleeping particles next to
+        a removed one are woken, they may have been resting on it.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return 0
+
+        asleep = self._particles.asleep
+        if asleep.any():
+            positions = self._particles.positions
+            woken = asleep & self._spatial_hash.IsNear(positions, positions[rows])
+            asleep[woken] = False
+            self._particles.sleep_timers[woken] = 0.0
+
+        removed = self._particles.Remove(rows)
+        self._removed += removed
+
+        # everything indexed by row has to be rebuilt
+        self._grid_updates = 0
+        self._neighbour_pairs = None
+        return removed
+
+    def RemoveDead(self, dt: float = 0.0) -> int:
+        """
+        Age every particle by `dt` and remove the ones whose lifetime ran out or
+        that are inside a kill zone. Returns how many were removed.
+        """
+        lifetimes = self._particles.lifetimes
+        lifetimes -= dt
+        dead = lifetimes <= 0.0
+
+        positions = self._particles.positions
+        for lower, upper in self._kill_zones:
+            dead |= np.all((positions >= lower) & (positions <= upper), axis=1)
+
+        if not dead.any():
+            return 0
+        return self.RemoveParticles(np.flatnonzero(dead))
+
+    def AddKillZone(self, minCorner, maxCorner):
+        """Remove every particle that enters the box between the two corners."""
+        lower = np.asarray(minCorner, dtype=np.float32)
+        upper = np.asarray(maxCorner, dtype=np.float32)
+        if np.any(lower > upper):
+            raise ValueError("minCorner must not exceed maxCorner")
+        self._kill_zones.append((lower, upper))
+
+    def GetKillZones(self) -> list[tuple[np.ndarray, np.ndarray]]:
+        return list(self._kill_zones)
+
+    def ClearKillZones(self):
+        self._kill_zones.clear()
+
     def OnUpdateSubstep(self, dt: float):
-        for i in range(len(self._positions)):
-            self._velocities[i] += self._gravity * dt
-        
-        # Update positions
-        for i in range(len(self._positions)):
-            self._positions[i] += self._velocities[i] * dt
-        
-        # Handle collisions
-        for i in range(len(self._positions)):
-            self.CheckWallCollisions(i)
-        
-        # self.FindCollisions()
-        self.CreateGrid()
+        with Profiler.Scope("SimSubstep"):
+            with self._Phase("integrate"):
+                self.Integrate(dt)
+            
+            # Handle collisions
+            with self._Phase("walls"):
+                self.CheckWallCollisions()
+            
+            # self.FindCollisions()
+            self.CreateGrid()
+
+            if self._sleeping:
+                with self._Phase("sleep"):
+                    self.UpdateSleep(dt)
+
+    @contextmanager
+    def _Phase(self, name: str):
+        """
+        Time the block as a profiler scope, and add it to the named phase when
+        this simulation's phase timing is enabled.
+        """
+        with Profiler.Scope(self._PHASE_SCOPES[name]):
+            if not self._phase_timing:
+                yield
+                return
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self._phase_times[name] = self._phase_times.get(name, 0.0) + time.perf_counter() - start
+
+    def SetPhaseTiming(self, enabled: bool):
+        self._phase_timing = enabled
+
+    def GetPhaseTimes(self) -> dict[str, float]:
+        """
+        Seconds spent in each phase since the last reset: integrate, walls,
+        grid (binning) and narrow_phase (pair search and collision response).
+        """
+        return dict(self._phase_times)
+
+    def ResetPhaseTimes(self):
+        self._phase_times.clear()
+
+    def Integrate(self, dt: float):
+        """
+        Apply gravity and advance every awake particle by one explicit Euler step.
+        Runs as whole-array operations over the particle store.
+        """
+        asleep = self._particles.asleep
+        if not asleep.any():
+            self._backend.Integrate(self._particles.positions, self._particles.velocities, self._gravity, dt)
+            return
+
+        # gather the awake particles, step them and scatter them back
+        awake = np.flatnonzero(~asleep)
+        positions  = self._particles.positions[awake]
+        velocities = self._particles.velocities[awake]
+        self._backend.Integrate(positions, velocities, self._gravity, dt)
+        self._particles.positions[awake]  = positions
+        self._particles.velocities[awake] = velocities
+
+    def UpdateSleep(self, dt: float):
+        """
+        Advance the sleep state after a substep.
+        A particle is calm while it is slower than the sleep velocity and has not left
+        its resting place by more than the sleep displacement. Awake particles calm for
+        the sleep time fall asleep if they are supported, resting on the floor or on a
+        sleeping particle, and no cell next to them holds a restless particle; a particle
+        at the top of a throw is calm for a moment but not supported.
+        Sleeping particles that are no longer calm, because a contact pushed them, wake up.
+        """
+        particles = self._particles
+        positions = particles.positions
+        velocities = particles.velocities
+        asleep = particles.asleep
+        timers = particles.sleep_timers
+        anchors = particles.sleep_anchors
+
+        speed = np.einsum("ij,ij->i", velocities, velocities)
+        moved = positions - anchors
+        moved = np.einsum("ij,ij->i", moved, moved)
+        displacement = self._sleep_displacement * self._particle_radius
+        calm = (speed < self._sleep_velocity ** 2) & (moved < displacement ** 2)
+
+        asleep &= calm
+        timers[:] = np.where(calm, timers + dt, 0.0)
+        anchors[~calm] = positions[~calm]
+
+        ready = ~asleep & (timers >= self._sleep_time)
+        if not ready.any():
+            return
+        # calm but unsupported particles do not hold their neighbours awake, the
+        # particle they rest on has to fall asleep first
+        restless = ~asleep & ~ready
+        ready &= self._IsSupported(ready)
+        if not ready.any():
+            return
+
+        # the grid was built this substep, its cells are at least a diameter wide
+        blocked = self._spatial_hash.DilateCells(self._spatial_hash.CellsContaining(restless))
+        falling = ready & ~blocked[self._spatial_hash.ParticleCells()]
+        asleep |= falling
+        velocities[falling] = 0.0
+        anchors[falling] = positions[falling]
+
+    def _IsSupported(self, candidates: np.ndarray) -> np.ndarray:
+        """
+        For every particle, whether it is set in `candidates` and touches the floor or a
+        sleeping particle, within the sleep displacement. Uses the grid of this substep.
+        """
+        positions = self._particles.positions
+        slack = self._sleep_displacement * self._particle_radius
+        floor = -0.5 * self._bound_size.y + self._particle_radius + slack
+        supported = candidates & (positions[:, 1] <= floor)
+
+        asleep = self._particles.asleep
+        rest = candidates & ~supported
+        if not rest.any() or not asleep.any():
+            return supported
+
+        grid = self._spatial_hash
+        pairs_i, pairs_j = grid.FindCandidatePairs(grid.CellsContaining(rest))
+        _, _, distance = NarrowPhase.FindContacts(positions, pairs_i, pairs_j, self._particle_radius)
+        touching = distance < 2.0 * self._particle_radius + slack
+        pairs_i, pairs_j = pairs_i[touching], pairs_j[touching]
+        supported[pairs_i[rest[pairs_i] & asleep[pairs_j]]] = True
+        supported[pairs_j[rest[pairs_j] & asleep[pairs_i]]] = True
+        return supported
+
+    def SetIncrementalGrid(self, enabled: bool = True, rebuildInterval: int = None):
+        """
+        Keep the grid between substeps and only re-bin particles that changed cell,
+        with a full rebuild every `rebuildInterval` substeps.
+        """
+        self._incremental_grid = enabled
+        if rebuildInterval is not None:
+            self._grid_rebuild_interval = max(1, int(rebuildInterval))
+        self._grid_updates = 0
+
+    def SetSleeping(self, enabled: bool = True, velocity: float = None, displacement: float = None, time: float = None):
+        """
+        Turn sleeping on or off and set its thresholds, None keeps the current value.
+        `displacement` is in particle radii, `time` is how many seconds a particle has to
+        stay calm, so it does not depend on the substep count.
+        """
+        self._sleeping = enabled
+        if velocity is not None:
+            self._sleep_velocity = velocity
+        if displacement is not None:
+            self._sleep_displacement = displacement
+        if time is not None:
+            self._sleep_time = max(0.0, float(time))
+        if not enabled:
+            self.WakeAll()
+
+    def WakeAll(self):
+        self._particles.asleep[:] = False
+        self._particles.sleep_timers[:] = 0.0
+        self._particles.sleep_anchors[:] = self._particles.positions
+
+    def IsSleeping(self) -> bool:
+        """Whether resting particles are allowed to fall asleep."""
+        return self._sleeping
+
+    def GetRoom(self) -> int:
+        """How many more particles fit before the particle number is reached."""
+        return max(0, self._particle_number - self._particles.count)
+
+    def GetSleepingCount(self) -> int:
+        return int(np.count_nonzero(self._particles.asleep))
         
 
 
@@ -149,53 +691,39 @@ class Simulation:
         This method should be called after updating particle positions.
         """
         
-        for i in range(len(self._positions)):
-            for j in range(i+1, len(self._positions)):
+        for i in range(self._particles.count):
+            for j in range(i+1, self._particles.count):
                 if self.IsColliding(i, j):
                     self.ResolveCollision(i, j)
             self.CheckWallCollisions(i)
                 
-    def CheckWallCollisions(self, i: int):
-        """
-        Check if a particle is colliding with the walls of the simulation bounds.
-        If it is, adjust its position to keep it within bounds.
-        """
-       
-        half    = self._bound_size * 0.5
-        limit_x = half.x - self._particle_radius
-        limit_y = half.y - self._particle_radius
-        limit_z = half.z - self._particle_radius
-
-        # X axis
-        if   self._positions[i].x >  limit_x:
-            self._positions[i].x  =  limit_x
-            self._velocities[i].x *= -self._friction_coefficient
-        elif self._positions[i].x < -limit_x:
-            self._positions[i].x  = -limit_x
-            self._velocities[i].x *= -self._friction_coefficient
-
-        # Y axis
-        if   self._positions[i].y >  limit_y:
-            self._positions[i].y  =  limit_y
-            self._velocities[i].y *= -self._friction_coefficient
-        elif self._positions[i].y < -limit_y:
-            self._positions[i].y  = -limit_y
-            self._velocities[i].y *= -0.8
-
-        # Z axis
-        if   self._positions[i].z >  limit_z:
-            self._positions[i].z  =  limit_z
-            self._velocities[i].z *= -self._friction_coefficient
-        elif self._positions[i].z < -limit_z:
-            self._positions[i].z  = -limit_z
-            self._velocities[i].z *= -self._friction_coefficient
+    def CheckWallCollisions(self, i: int = None):
+        """
+        Check if particles are colliding with the walls of the simulation bounds.
+        If they are, clamp them back inside and reflect their velocity.
+        With no index every particle is handled in a single array pass.
+        """
+        if i is None:
+            rows = slice(0, self._particles.count)
+        else:
+            rows = slice(i, i + 1)
+
+        limit = np.asarray(self._bound_size, dtype=np.float32) * 0.5 - self._particle_radius
+        self._backend.CollideWalls(
+            self._particles.positions[rows],
+            self._particles.velocities[rows],
+            limit,
+            self._friction_coefficient,
+            self._floor_restitution,
+        )
 
 
     def IsColliding(self, p1: int, p2: int) -> bool:
         """
         Check if two particles are colliding based on their positions.
         """
-        distance = glm.distance(self._positions[p1], self._positions[p2])
+        positions = self._particles.positions
+        distance = np.linalg.norm(positions[p2] - positions[p1])
         #print(f"Distance between particles {p1} and {p2}: {distance}")
         return distance < 2 * self._particle_radius
     
@@ -204,109 +732,264 @@ class Simulation:
         Resolve a collision between two particles by adjusting their positions.
         This is a simple elastic collision resolution.
         """
-        point1 = self._positions[p1]
-        point2 = self._positions[p2]
+        positions  = self._particles.positions
+        velocities = self._particles.velocities
         mass = 1.0
 
-        impact_vector = point2 - point1
-        d = glm.length(impact_vector)
+        impact_vector = positions[p2] - positions[p1]
+        d = float(np.linalg.norm(impact_vector))
 
         if d < 1e-5:
             return
 
         if d < self._particle_radius * 2:
             overlap = d - (self._particle_radius * 2)
-            dir = glm.normalize(impact_vector) * (overlap * 0.5)
-            self._positions[p1] += dir
-            self._positions[p2] -= dir
+            dir = impact_vector / d * (overlap * 0.5)
+            positions[p1] += dir
+            positions[p2] -= dir
+            impact_vector = impact_vector / d * (self._particle_radius * 2)  # Correct impact vector
             d = self._particle_radius * 2
-            impact_vector = glm.normalize(impact_vector) * d  # Correct impact vector
 
         mSum = mass + mass
-        vDiff = self._velocities[p2] - self._velocities[p1]
+        vDiff = velocities[p2] - velocities[p1]
 
-        num = glm.dot(vDiff, impact_vector)
+        num = float(np.dot(vDiff, impact_vector))
         den = mSum * d * d
 
         dVa = impact_vector * (2 * mass * num / den)
-        self._velocities[p1] += dVa
+        velocities[p1] += dVa
 
         dVb = impact_vector * (-2 * mass * num / den)
-        self._velocities[p2] += dVb
+        velocities[p2] += dVb
 
     def CreateGrid(self):
-        self._grid = copy.deepcopy(self._grid_template)
-
-        for idx, pos in enumerate(self._positions):
-            cx, cy, cz = self.GetCellIndex(pos)
-            if not (0 <= cx < self._cell_count.x and
-                    0 <= cy < self._cell_count.y and
-                    0 <= cz < self._cell_count.z):
-                continue
-            self._grid[cx][cy][cz].AddParticle(idx)
-
-        # no _has_particles, so loop over all cells instead
-        for x in range(int(self._cell_count.x)):
-            for y in range(int(self._cell_count.y)):
-                for z in range(int(self._cell_count.z)):
-                    if not self._grid[x][y][z].IsEmpty():
-                        self.CheckNeighboringCells(x, y, z)
+        """
+        Bin the particles into the spatial hash and resolve every overlapping
+        candidate pair it produces.
+        In neighbour list mode the grid is only rebuilt together with the list.
+        """
+        # the awake mask only pays off once some particles are asleep
+        asleep = self._particles.asleep
+        awake = ~asleep if self._sleeping and asleep.any() else None
+        if self._neighbour_list:
+            self.UpdateNeighbourList()
+            with self._Phase("narrow_phase"):
+                self._backend.CollidePairs(
+                    self._particles.positions,
+                    self._particles.velocities,
+                    self._particle_radius,
+                    *self._neighbour_pairs,
+                    awake,
+                )
+            with self._Phase("walls"):
+                self.CheckWallCollisions()
+            return
 
-        
-    def CheckNeighboringCells(self, cx: int, cy: int, cz: int):
-        particles = self._grid[cx][cy][cz].GetParticles()
-        cellListSize = len(particles)
-
-        for i in range(cellListSize):
-            p1 = particles[i]
-            for j in range(i + 1, cellListSize):
-                p2 = particles[j]
-                if self.IsColliding(p1, p2):
-                    self.ResolveCollision(p1, p2)
-            self.CheckWallCollisions(p1)
-
-        for offset in self._neighbour_offsets:
-            nx, ny, nz = cx + int(offset.x), cy + int(offset.y), cz + int(offset.z)
-            if not (0 <= nx < self._cell_count.x and
-                    0 <= ny < self._cell_count.y and
-                    0 <= nz < self._cell_count.z):
-                continue
-
-            for p1 in particles:
-                for p2 in self._grid[nx][ny][nz].GetParticles():
-                    if self.IsColliding(p1, p2):
-                        self.ResolveCollision(p1, p2)
- 
-                           
-    def GetCellIndex(self, position: glm.vec3) -> glm.vec3:
+        with self._Phase("grid"):
+            if self._incremental_grid and 0 < self._grid_updates < self._grid_rebuild_interval:
+                self._grid_moved = self._spatial_hash.Update(self._particles.positions)
+                self._grid_updates += 1
+            else:
+                self._backend.BuildGrid(self._spatial_hash, self._particles.positions)
+                self._grid_moved = self._particles.count
+                self._grid_updates = 1
+
+        with self._Phase("narrow_phase"):
+            self._backend.Collide(
+                self._spatial_hash,
+                self._particles.positions,
+                self._particles.velocities,
+                self._particle_radius,
+                awake,
+            )
+
+        # collision response can push particles back through the walls
+        with self._Phase("walls"):
+            self.CheckWallCollisions()
+
+    def UpdateNeighbourList(self, force: bool = False) -> bool:
+        """
+        Rebuild the neighbour list when it is missing, the particle count changed or
+        a particle moved more than half the skin since the last build, so no pair can
+        have come into contact unseen. Returns True when it was rebuilt.
+        """
+        positions = self._particles.positions
+        skin = self._neighbour_skin * self._particle_radius
+        if not force and self._neighbour_pairs is not None and len(self._neighbour_origin) == len(positions):
+            moved = positions - self._neighbour_origin
+            if len(moved) == 0 or np.einsum("ij,ij->i", moved, moved).max() <= (0.5 * skin) ** 2:
+                return False
+
+        with self._Phase("grid"):
+            self._backend.BuildGrid(self._spatial_hash, positions)
+            self._grid_updates = 0
+
+            pairs_i, pairs_j = self._spatial_hash.FindCandidatePairs()
+            _, _, distance = NarrowPhase.FindContacts(positions, pairs_i, pairs_j, self._particle_radius)
+            near = distance < 2.0 * self._particle_radius + skin
+            self._neighbour_pairs = (pairs_i[near], pairs_j[near])
+            self._neighbour_origin = positions.copy()
+
+        self._neighbour_rebuilds += 1
+        return True
+
+    def Reorder(self):
+        """
+        Sort every per-particle array by the Morton code of the particle's cell, so
+        particles close in space are close in memory for the grid and pair passes.
+        Particle IDs follow their particles, see GetIds and GetIndexOf.
+        """
+        if self._particles.count < 2:
+            return
+        keys = self._spatial_hash.ComputeMortonKeys(self._particles.positions)
+        self._particles.Permute(np.argsort(keys, kind="stable"))
+
+        # everything indexed by row has to be rebuilt
+        self._grid_updates = 0
+        self._neighbour_pairs = None
+
+    def SetReordering(self, interval: int):
+        """Reorder the particles every `interval` frames, 0 turns it off."""
+        self._reorder_interval = max(0, int(interval))
+
+    def SetNeighbourList(self, enabled: bool = True, skin: float = None):
+        """
+        Resolve collisions from a Verlet neighbour list instead of the grid every substep.
+        `skin` is the margin around a diameter in particle radii; the cells are widened
+        to cover a diameter plus the skin if needed.
+        """
+        self._neighbour_list = enabled
+        if skin is not None:
+            if skin <= 0:
+                raise ValueError("skin must be positive")
+            self._neighbour_skin = skin
+        self._neighbour_pairs = None
+
+        if enabled:
+            reach = (2.0 + self._neighbour_skin) * self._particle_radius
+            if self._cell_size < reach:
+                self.ResizeGrid(reach)
+
+    def GetCellIndex(self, position) -> tuple[int, int, int]:
         """
         Get the grid cell index for a given position.
         """
-        cell_x = int((position.x + self._bound_size.x * 0.5) / self._cell_size)
-        cell_y = int((position.y + self._bound_size.y * 0.5) / self._cell_size)
-        cell_z = int((position.z + self._bound_size.z * 0.5) / self._cell_size)
+        cell_x = int((position[0] + self._bound_size.x * 0.5) / self._cell_size)
+        cell_y = int((position[1] + self._bound_size.y * 0.5) / self._cell_size)
+        cell_z = int((position[2] + self._bound_size.z * 0.5) / self._cell_size)
         
         return cell_x, cell_y, cell_z
         
                     
                     
     ## ACCESSED OUT OF CLASS    
-    def GetPoints(self) -> list[glm.vec3]:
-        return self._positions
+    def GetPoints(self) -> np.ndarray:
+        """
+        Live (n, 3) float32 C-contiguous view of the positions, not a copy.
+        It is laid out the way Mesh.SetInstanceData uploads it, so it can be handed
+        to the renderer as is. The view is only valid until particles are added.
+        """
+        return self._particles.positions
+
+    def GetIds(self) -> np.ndarray:
+        """
+        Stable ID of the particle in every row. Rows change when the particles are
+        reordered, IDs do not, so keep IDs to refer to particles across frames.
+        """
+        return self._particles.ids
+
+    def GetSerials(self) -> np.ndarray:
+        """
+        Serial number of the particle in every row. Unlike IDs these are never handed
+        out again, so a particle that took over a removed particle's ID has another serial.
+        """
+        return self._particles.serials
+
+    def GetIndexOf(self, ids) -> np.ndarray:
+        """Current rows of the given particle IDs."""
+        return self._particles.IndexOf(ids)
 
-    def GetColors(self) -> list[glm.vec3]:
-        return self._colors
+    def GetVelocities(self) -> np.ndarray:
+        return self._particles.velocities
+
+    def GetColors(self) -> np.ndarray:
+        """Live (n, 3) float32 view of the colours, same layout as GetPoints."""
+        return self._particles.colors
+
+    def Reconfigure(self, particleNumber: int = None, particleSize: float = None, boundSize=None,
+                    frictionCoefficient: float = None):
+        """
+        Change parameters of the running simulation in place, None keeps the current value.
+        The particles are kept; lowering the particle number removes the last rows, which
+        after removals and reordering are not necessarily the newest particles.
+        A new particle size or bound size only marks the grid, its dimensions are
+        re-derived once before the next step however many changes come in between,
+        so scrubbing a slider does not rebuild anything per change.
+        """
+        if particleNumber is not None:
+            self._particle_number = max(0, int(particleNumber))
+            self._particles.Reserve(self._particle_number, exact=True)
+            excess = self._particles.count - self._particle_number
+            if excess > 0:
+                self.RemoveParticles(np.arange(self._particle_number, self._particles.count))
+
+        if particleSize is not None and particleSize / 2 != self._particle_radius:
+            self._particle_radius = particleSize / 2
+            self._grid_dirty = True
+
+        if boundSize is not None:
+            if not isinstance(boundSize, glm.vec3):
+                boundSize = glm.vec3(*boundSize)
+            if boundSize != self._bound_size:
+                self._bound_size = boundSize
+                self._grid_dirty = True
+
+        if frictionCoefficient is not None:
+            self._friction_coefficient = frictionCoefficient
+
+        if self._grid_dirty:
+            # resting contacts and wall distances are no longer valid
+            self._neighbour_pairs = None
+            self.WakeAll()
+
+    def RederiveGrid(self):
+        """
+        Fit the cells to the current particle size and bounds, widened for the
+        neighbour list when it is on. Called by OnUpdate after Reconfigure.
+        """
+        cell_size = self.CalculateOptimalCellSize()
+        if self._neighbour_list:
+            cell_size = max(cell_size, (2.0 + self._neighbour_skin) * self._particle_radius)
+        self.ResizeGrid(cell_size)
+        self._grid_dirty = False
+
+    def SetParticleNumber(self, particleNumber: int):
+        self.Reconfigure(particleNumber=particleNumber)
 
     def SetParticleSize(self, size: float):
-        self._particle_radius = size
+        """Set the particle diameter."""
+        self.Reconfigure(particleSize=size)
 
     def SetBoundSize(self, boundSize):
-        if not isinstance(boundSize, glm.vec3):
-            boundSize = glm.vec3(*boundSize)
-        self._bound_size = boundSize
+        self.Reconfigure(boundSize=boundSize)
 
     def SetFrictionCoefficient(self, m: float):
         self._friction_coefficient = m
 
+    def GetFrictionCoefficient(self) -> float:
+        return self._friction_coefficient
+
+    def GetParticleNumber(self) -> int:
+        return self._particle_number
+
+    def GetParticleSize(self) -> float:
+        return 2.0 * self._particle_radius
+
+    def GetBoundSize(self) -> glm.vec3:
+        return glm.vec3(self._bound_size)
+
+    def GetCellSize(self) -> float:
+        return self._cell_size
+
     def GetParticleCount(self) -> int:
-        return len(self._positions)
\ No newline at end of file
+        return self._particles.count
\ No newline at end of file
@@ -0,0 +1,229 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from Engine.Core.FixedTimestep import FixedTimestep
+
+class SnapshotBuffer:
+    """
+    Double-buffered copies of the particle state for rendering.
+    Publish overwrites the older of the two states, so the buffer always holds the
+    last two steps, and Interpolate blends between them. Both take the lock, so the
+    simulation can publish from another thread while the renderer reads.
+    When the particle IDs are published too, a reordering of the particles between
+    the two states is undone so every particle is blended with itself. The IDs must
+    not be reused within a particle's life; pass Simulation.GetSerials, a particle
+    that took over a removed particle's ID would otherwise be blended with it.
+    Statistics published alongside let the UI read them without touching the simulation.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._positions = [np.zeros((0, 3), dtype=np.float32) for _ in range(2)]
+        self._colors = [np.zeros((0, 3), dtype=np.float32) for _ in range(2)]
+        self._counts = [0, 0]
+        self._ids = [None, None]
+        self._current = 0
+        self._version = 0
+        self._time = 0.0
+        self._interval = 0.0
+        self._stats = {}
+
+        # render side output, reused between frames
+        self._out_positions = np.zeros((0, 3), dtype=np.float32)
+        self._out_colors = np.zeros((0, 3), dtype=np.float32)
+
+    @staticmethod
+    def _Fit(array: np.ndarray, count: int) -> np.ndarray:
+        if len(array) >= count:
+            return array
+        return np.zeros((max(count, 2 * len(array)), 3), dtype=np.float32)
+
+    def Publish(self, positions: np.ndarray, colors: np.ndarray, ids: np.ndarray = None, stats: dict = None):
+        """Copy a new state in, the previous current state becomes the older one."""
+        count = len(positions)
+        with self._lock:
+            back = 1 - self._current
+            self._positions[back] = self._Fit(self._positions[back], count)
+            self._colors[back] = self._Fit(self._colors[back], count)
+            self._positions[back][:count] = positions
+            self._colors[back][:count] = colors
+            self._counts[back] = count
+            self._ids[back] = None if ids is None else np.array(ids)
+
+            older = self._current
+            if ids is not None and self._ids[older] is not None:
+                self._AlignOlder(older, back)
+            self._current = back
+            if stats is not None:
+                self._stats = stats
+            self._version += 1
+            now = time.perf_counter()
+            if self._version > 1:
+                self._interval = now - self._time
+            self._time = now
+
+    def _AlignOlder(self, older: int, newer: int):
+        """Put the older state in the row order of the newer one, matched by ID."""
+        older_ids = self._ids[older]
+        newer_ids = self._ids[newer]
+        common = min(len(older_ids), len(newer_ids))
+        if len(older_ids) == 0 or np.array_equal(older_ids[:common], newer_ids[:common]):
+            return
+
+        sorter = np.argsort(older_ids)
+        found = np.minimum(np.searchsorted(older_ids, newer_ids, sorter=sorter), len(older_ids) - 1)
+        rows = sorter[found]
+        matched = older_ids[rows] == newer_ids
+
+        # particles without an older state are drawn at their newer position
+        aligned = self._positions[newer][:len(newer_ids)].copy()
+        aligned[matched] = self._positions[older][rows[matched]]
+        self._positions[older] = self._Fit(self._positions[older], len(aligned))
+        self._positions[older][:len(aligned)] = aligned
+        self._counts[older] = len(aligned)
+        self._ids[older] = newer_ids
+
+    def Interpolate(self, alpha: float = 1.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Positions blended `alpha` of the way from the older to the newer state, and
+        the newer colours. Particles that only exist in the newer state are not
+        blended. The returned arrays are reused by the next call.
+        """
+        with self._lock:
+            current = self._current
+            count = self._counts[current]
+            common = min(count, self._counts[1 - current])
+
+            self._out_positions = self._Fit(self._out_positions, count)
+            self._out_colors = self._Fit(self._out_colors, count)
+            positions = self._out_positions[:count]
+            colors = self._out_colors[:count]
+
+            newer = self._positions[current]
+            older = self._positions[1 - current]
+            np.subtract(newer[:common], older[:common], out=positions[:common])
+            positions[:common] *= np.float32(alpha)
+            positions[:common] += older[:common]
+            positions[common:] = newer[common:count]
+            colors[:] = self._colors[current][:count]
+
+        return positions, colors
+
+    def GetCount(self) -> int:
+        return self._counts[self._current]
+
+    def GetStats(self) -> dict:
+        """Simulation.GetStepStats as of the last Publish that passed them."""
+        with self._lock:
+            return self._stats
+
+    def GetVersion(self) -> int:
+        """Number of states published so far."""
+        return self._version
+
+    def GetPublishTime(self) -> float:
+        """perf_counter time of the last Publish."""
+        return self._time
+
+    def GetPublishInterval(self) -> float:
+        """Seconds between the last two Publish calls, 0 before the second one."""
+        return self._interval
+
+class SimulationThread:
+    """
+    Steps a Simulation at a fixed timestep on a background thread and publishes every
+    step to a SnapshotBuffer, so rendering never waits on a slow step.
+    Anything that touches the simulation from another thread has to go through Submit,
+    the callables run on the simulation thread between steps.
+    """
+    def __init__(self, sim, snapshots: SnapshotBuffer, step: float = 1 / 240, maxSteps: int = 4):
+        self._sim = sim
+        self._snapshots = snapshots
+        self._timestep = FixedTimestep(step, maxSteps)
+        self._commands = deque()
+        self._paused = False
+        self._steps = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def Start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._Run, name="ParticleFlowSimulation", daemon=True)
+        self._thread.start()
+
+    def Stop(self):
+        """Stop the thread after the current step, waiting for it to finish."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+        # nothing else steps the simulation now, run what is left on this thread
+        while self._commands:
+            self._commands.popleft()()
+
+    def IsRunning(self) -> bool:
+        return self._thread is not None
+
+    def Submit(self, command):
+        """Run `command()` on the simulation thread before the next step."""
+        self._commands.append(command)
+
+    def SetSimulation(self, sim):
+        self.Submit(lambda: setattr(self, "_sim", sim))
+
+    def SetPaused(self, paused: bool):
+        if paused != self._paused:
+            self.Submit(lambda: setattr(self, "_paused", paused))
+
+    def GetStepCount(self) -> int:
+        return self._steps
+
+    def GetAlpha(self) -> float:
+        """
+        How far the current moment is past the last publish, as a fraction of the time
+        between the last two publishes. Steps that take longer than the fixed step are
+        published further apart, and the blend stretches over that interval.
+        """
+        elapsed = time.perf_counter() - self._snapshots.GetPublishTime()
+        # never shorter than a step, a publish after commands can follow one closely
+        interval = max(self._snapshots.GetPublishInterval(), self._timestep.GetStep())
+        return min(elapsed / interval, 1.0)
+
+    def _Publish(self):
+        self._snapshots.Publish(self._sim.GetPoints(), self._sim.GetColors(), self._sim.GetSerials(),
+                                self._sim.GetStepStats())
+
+    def _Run(self):
+        step = self._timestep.GetStep()
+        last = time.perf_counter()
+
+        while not self._stop.is_set():
+            if self._commands:
+                while self._commands:
+                    self._commands.popleft()()
+                # also collapses the interpolation onto one state while paused
+                self._Publish()
+
+            now = time.perf_counter()
+            steps = self._timestep.Advance(now - last)
+            last = now
+            if self._paused:
+                self._timestep.Reset()
+                steps = 0
+
+            for _ in range(steps):
+                self._sim.OnUpdate(step)
+                self._steps += 1
+            # catching up runs several steps, only the last one is ever shown
+            if steps > 0:
+                self._Publish()
+
+            if steps == 0:
+                self._stop.wait(step * (1.0 - self._timestep.GetAlpha()))
@@ -0,0 +1,262 @@
+import numpy as np
+
+class SpatialHash:
+    """
+    Uniform-grid broad phase built by sorting particles on their linear cell key.
+    No per-cell objects are allocated: occupied cells are described by the
+    `cell_keys`, `cell_start` and `cell_end` arrays, which index into `order`
+    (particle indices sorted by cell). Build cost scales with particle count,
+    not with the number of cells in the domain.
+    """
+    # 13 of the 26 neighbour offsets; together with the cell itself every
+    # adjacent cell pair is visited exactly once
+    _HALF_OFFSETS = np.array([
+        (dx, dy, dz)
+        for dx in (-1, 0, 1)
+        for dy in (-1, 0, 1)
+        for dz in (-1, 0, 1)
+        if (dx, dy, dz) > (0, 0, 0)
+    ], dtype=np.int64)
+
+    # Update falls back to a full sort once this share of the particles changed cell
+    REBUILD_FRACTION = 0.125
+
+    def __init__(self, cellSize: float, boundSize):
+        self.order      = np.empty(0, dtype=np.int64)
+        self.cell_keys  = np.empty(0, dtype=np.int64)
+        self.cell_start = np.empty(0, dtype=np.int64)
+        self.cell_end   = np.empty(0, dtype=np.int64)
+
+        self.SetGrid(cellSize, boundSize)
+
+    def SetGrid(self, cellSize: float, boundSize):
+        """Set the cell size and domain, deriving the number of cells per axis."""
+        self._cell_size = float(cellSize)
+        self._bound_size = np.array([boundSize[0], boundSize[1], boundSize[2]], dtype=np.float64)
+        self._cell_count = np.maximum(1, (self._bound_size // self._cell_size).astype(np.int64))
+
+        # keys from the old grid mean nothing in the new one
+        self._particle_keys = None
+
+    def GetCellCount(self) -> tuple[int, int, int]:
+        return tuple(int(c) for c in self._cell_count)
+
+    @property
+    def cell_size(self) -> float:
+        return self._cell_size
+
+    @property
+    def bound_size(self) -> np.ndarray:
+        return self._bound_size
+
+    @property
+    def cell_count(self) -> np.ndarray:
+        return self._cell_count
+
+    def ComputeCellCoords(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Integer (x, y, z) cell coordinates for every position.
+        Positions outside the domain are clamped into the border cells.
+        """
+        coords = np.floor((positions + self._bound_size * 0.5) / self._cell_size).astype(np.int64)
+        np.clip(coords, 0, self._cell_count - 1, out=coords)
+        return coords
+
+    def ComputeCellKeys(self, positions: np.ndarray) -> np.ndarray:
+        """Linear cell key for every position, computed in one pass."""
+        return self._LinearKeys(self.ComputeCellCoords(positions))
+
+    def ComputeMortonKeys(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Z-order (Morton) code of every position's cell, interleaving the bits of the
+        x, y and z cell coordinates. Sorting by it keeps cells that are close in space
+        close in memory.
+        """
+        coords = self.ComputeCellCoords(positions).astype(np.uint64)
+        return (self._SpreadBits(coords[:, 0]) << np.uint64(2)) | (self._SpreadBits(coords[:, 1]) << np.uint64(1)) | self._SpreadBits(coords[:, 2])
+
+    @staticmethod
+    def _SpreadBits(v: np.ndarray) -> np.ndarray:
+        """Put two zero bits after each of the low 21 bits."""
+        v = v & np.uint64(0x1FFFFF)
+        v = (v | (v << np.uint64(32))) & np.uint64(0x1F00000000FFFF)
+        v = (v | (v << np.uint64(16))) & np.uint64(0x1F0000FF0000FF)
+        v = (v | (v << np.uint64(8)))  & np.uint64(0x100F00F00F00F00F)
+        v = (v | (v << np.uint64(4)))  & np.uint64(0x10C30C30C30C30C3)
+        v = (v | (v << np.uint64(2)))  & np.uint64(0x1249249249249249)
+        return v
+
+    def _LinearKeys(self, coords: np.ndarray) -> np.ndarray:
+        ny, nz = self._cell_count[1], self._cell_count[2]
+        return (coords[:, 0] * ny + coords[:, 1]) * nz + coords[:, 2]
+
+    def _KeysToCoords(self, keys: np.ndarray) -> np.ndarray:
+        ny, nz = self._cell_count[1], self._cell_count[2]
+        return np.stack((keys // (ny * nz), (keys // nz) % ny, keys % nz), axis=1)
+
+    def Build(self, positions: np.ndarray):
+        """Bin every particle into its cell."""
+        keys = self.ComputeCellKeys(positions)
+        order = np.argsort(keys, kind="stable")
+        self._SetSorted(order, keys[order], keys)
+
+    def Update(self, positions: np.ndarray) -> int:
+        """
+        Re-bin only the particles whose cell changed since the last Build or Update.
+        They are taken out of the sorted order and inserted again at their new key,
+        so nothing is re-sorted; within a cell particles drift out of index order
+        until the next Build. Returns the number of particles that changed cell.
+        """
+        keys = self.ComputeCellKeys(positions)
+        if self._particle_keys is None or self._particle_keys.size != keys.size:
+            self.Build(positions)
+            return keys.size
+
+        moved = np.flatnonzero(keys != self._particle_keys)
+        if moved.size == 0:
+            return 0
+        if moved.size > self.REBUILD_FRACTION * keys.size:
+            self.Build(positions)
+            return moved.size
+
+        # drop the movers from the sorted order ...
+        keep = np.ones(keys.size, dtype=bool)
+        keep[np.isin(self.order, moved, assume_unique=True)] = False
+        order = self.order[keep]
+        sorted_keys = self._particle_keys[order]
+
+        # ... and insert them after the particles already in their new cell
+        new_keys = keys[moved]
+        by_key = np.argsort(new_keys, kind="stable")
+        moved, new_keys = moved[by_key], new_keys[by_key]
+        at = np.searchsorted(sorted_keys, new_keys, side="right")
+
+        self._SetSorted(np.insert(order, at, moved), np.insert(sorted_keys, at, new_keys), keys)
+        return moved.size
+
+    def _SetSorted(self, order, sorted_keys, keys):
+        """Derive the cell ranges from particles sorted by key."""
+        # a new cell begins wherever the sorted key changes
+        boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+        cell_start = np.concatenate(([0], boundaries)) if sorted_keys.size else boundaries
+        cell_end   = np.concatenate((boundaries, [sorted_keys.size])) if sorted_keys.size else boundaries
+
+        self.order      = order
+        self.cell_keys  = sorted_keys[cell_start]
+        self.cell_start = cell_start
+        self.cell_end   = cell_end
+        self._particle_keys = keys
+
+    def SetCells(self, order, cell_keys, cell_start, cell_end):
+        """Store a binning produced elsewhere, e.g. by a compiled kernel."""
+        self.order      = order
+        self.cell_keys  = cell_keys
+        self.cell_start = cell_start
+        self.cell_end   = cell_end
+
+        # the key of every particle, so a later Update knows who changed cell
+        self._particle_keys = np.empty(order.size, dtype=np.int64)
+        self._particle_keys[order] = np.repeat(cell_keys, cell_end - cell_start)
+
+    # all 26 neighbour offsets and the cell itself
+    _FULL_OFFSETS = np.concatenate((-_HALF_OFFSETS[::-1], [(0, 0, 0)], _HALF_OFFSETS))
+
+    def CellsContaining(self, mask: np.ndarray) -> np.ndarray:
+        """For every occupied cell, whether it holds any particle set in the per-particle `mask`."""
+        if self.cell_start.size == 0:
+            return np.zeros(0, dtype=bool)
+        return np.logical_or.reduceat(mask[self.order], self.cell_start)
+
+    def DilateCells(self, cellMask: np.ndarray) -> np.ndarray:
+        """For every occupied cell, whether it or any of its 26 neighbours is set in `cellMask`."""
+        result = np.zeros(self.cell_keys.size, dtype=bool)
+        coords = self._KeysToCoords(self.cell_keys[cellMask])
+        for offset in self._FULL_OFFSETS:
+            neighbour = coords + offset
+            valid = np.all((neighbour >= 0) & (neighbour < self._cell_count), axis=1)
+            keys = self._LinearKeys(neighbour[valid])
+            found = np.minimum(np.searchsorted(self.cell_keys, keys), self.cell_keys.size - 1)
+            result[found[self.cell_keys[found] == keys]] = True
+        return result
+
+    def ParticleCells(self) -> np.ndarray:
+        """Index into the occupied cell arrays for every particle."""
+        cells = np.empty(self.order.size, dtype=np.int64)
+        cells[self.order] = np.repeat(np.arange(self.cell_keys.size), self.cell_end - self.cell_start)
+        return cells
+
+    def IsNear(self, positions: np.ndarray, sources: np.ndarray) -> np.ndarray:
+        """
+        For every position, whether it lies in the cell of one of `sources` or a cell
+        next to it. Works from the positions alone, the built grid is not used.
+        """
+        coords = self.ComputeCellCoords(sources)
+        near = (coords[None] + self._FULL_OFFSETS[:, None]).reshape(-1, 3)
+        valid = np.all((near >= 0) & (near < self._cell_count), axis=1)
+        return np.isin(self.ComputeCellKeys(positions), self._LinearKeys(near[valid]))
+
+    def FindCandidatePairs(self, activeCells: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Candidate pairs (i, j) from every occupied cell and its 26 neighbours.
+        Each unordered pair of particles in adjacent cells appears exactly once.
+        With `activeCells`, a per occupied cell mask, cell pairs where neither
+        cell is active are skipped before they are expanded.
+        """
+        counts = self.cell_end - self.cell_start
+        pairs_i = []
+        pairs_j = []
+
+        # pairs inside the same cell
+        cells = np.arange(self.cell_keys.size) if activeCells is None else np.flatnonzero(activeCells)
+        i, j = self._ExpandPairs(self.cell_start[cells], counts[cells], self.cell_start[cells], counts[cells], sameCell=True)
+        pairs_i.append(i)
+        pairs_j.append(j)
+
+        # pairs with each forward neighbour, looked up among the occupied cells only
+        coords = self._KeysToCoords(self.cell_keys)
+        for offset in self._HALF_OFFSETS:
+            neighbour = coords + offset
+            valid = np.all((neighbour >= 0) & (neighbour < self._cell_count), axis=1)
+            if not valid.any():
+                continue
+
+            cells = np.flatnonzero(valid)
+            keys = self._LinearKeys(neighbour[cells])
+            found = np.searchsorted(self.cell_keys, keys)
+            found = np.minimum(found, self.cell_keys.size - 1)
+            hit = self.cell_keys[found] == keys
+            if not hit.any():
+                continue
+
+            a = cells[hit]
+            b = found[hit]
+            if activeCells is not None:
+                active = activeCells[a] | activeCells[b]
+                a, b = a[active], b[active]
+            i, j = self._ExpandPairs(self.cell_start[a], counts[a], self.cell_start[b], counts[b])
+            pairs_i.append(i)
+            pairs_j.append(j)
+
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+    def _ExpandPairs(self, startA, countA, startB, countB, sameCell: bool = False):
+        """
+        Expand every (cell A, cell B) block into the cross product of their particles.
+        For a cell paired with itself only the upper triangle is kept.
+        """
+        sizes = countA * countB
+        total = int(sizes.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        block = np.repeat(np.arange(sizes.size), sizes)
+        local = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        width = countB[block]
+        a = local // width
+        b = local - a * width
+
+        if sameCell:
+            keep = a < b
+            block, a, b = block[keep], a[keep], b[keep]
+
+        return self.order[startA[block] + a], self.order[startB[block] + b]
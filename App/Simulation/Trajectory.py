@@ -0,0 +1,336 @@
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 64 byte file header, updated in place while recording
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("particles", "<u4"),   # particle capacity of every frame
+    ("capacity", "<u8"),    # frames the file has room for
+    ("frames", "<u8"),      # frames written so far
+    ("dt", "<f8"),          # seconds between recorded frames
+    ("particle_size", "<f8"),  # particle diameter, 0 when unknown
+    ("reserved", "V16"),
+])
+# S8 fields drop trailing NULs when read, so the magic has none
+MAGIC = b"PFTRAJ"
+VERSION = 1
+
+def FrameDtype(particles: int) -> np.dtype:
+    """
+    Layout of one fixed-size frame: the simulation step it was taken at, the number
+    of live particles, and their IDs, positions and velocities padded to `particles`.
+    """
+    return np.dtype([
+        ("step", "<i8"),
+        ("count", "<i8"),
+        ("ids", "<i8", (particles,)),
+        ("positions", "<f4", (particles, 3)),
+        ("velocities", "<f4", (particles, 3)),
+    ])
+
+class TrajectoryRecorder:
+    """
+    Streams frames of particle state into a preallocated, memory-mapped file.
+    Record copies the state into one of two snapshot buffers and returns, a
+    background thread writes the buffer into the file; Record only waits when the
+    writer is two frames behind. The file doubles when it runs out of frames and is
+    trimmed to the written frames by Close. Read it back with TrajectoryReader.
+    """
+    def __init__(self, path: str, particles: int, dt: float, frames: int = 256, particleSize: float = 0.0):
+        self._path = path
+        self._particles = max(1, int(particles))
+        self._frame_dtype = FrameDtype(self._particles)
+        self._written = 0
+        self._truncated = False
+
+        header = np.zeros((), dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["particles"] = self._particles
+        header["dt"] = dt
+        header["particle_size"] = particleSize
+        with open(path, "wb") as f:
+            f.write(header.tobytes())
+        self._header = np.memmap(path, dtype=HEADER_DTYPE, mode="r+", shape=())
+        self._frames = None
+        self._Resize(max(1, int(frames)))
+
+        self._free = queue.Queue()
+        self._filled = queue.Queue()
+        for _ in range(2):
+            self._free.put(np.zeros((), dtype=self._frame_dtype))
+        self._error = None
+        self._thread = threading.Thread(target=self._Run, name="TrajectoryWriter", daemon=True)
+        self._thread.start()
+
+    def _Resize(self, frames: int):
+        if self._frames is not None:
+            self._frames.flush()
+            self._frames = None
+        with open(self._path, "r+b") as f:
+            f.truncate(HEADER_DTYPE.itemsize + frames * self._frame_dtype.itemsize)
+        self._header["capacity"] = frames
+        if frames > 0:
+            self._frames = np.memmap(self._path, dtype=self._frame_dtype, mode="r+",
+                                     offset=HEADER_DTYPE.itemsize, shape=(frames,))
+
+    def Record(self, step: int, positions: np.ndarray, velocities: np.ndarray, ids: np.ndarray = None):
+        """Queue one frame. Particles beyond the capacity are left out."""
+        if self._error is not None:
+            raise self._error
+        count = len(positions)
+        if count > self._particles:
+            if not self._truncated:
+                print(f"Trajectory {self._path} holds {self._particles} particles, recording the first only")
+                self._truncated = True
+            count = self._particles
+
+        buffer = self._free.get()
+        buffer["step"] = step
+        buffer["count"] = count
+        buffer["ids"][:count] = np.arange(count) if ids is None else ids[:count]
+        buffer["positions"][:count] = positions[:count]
+        buffer["velocities"][:count] = velocities[:count]
+        self._filled.put(buffer)
+
+    def _Run(self):
+        while True:
+            buffer = self._filled.get()
+            if buffer is None:
+                return
+            try:
+                if self._written == len(self._frames):
+                    self._Resize(2 * self._written)
+                self._frames[self._written] = buffer
+                self._written += 1
+                self._header["frames"] = self._written
+            except OSError as error:
+                # surfaced by the next Record or Close
+                self._error = error
+            self._free.put(buffer)
+
+    def GetFrameCount(self) -> int:
+        """Frames written to the file so far."""
+        return self._written
+
+    def Close(self):
+        """Write the queued frames, trim the file and close it."""
+        if self._thread is None:
+            return
+        self._filled.put(None)
+        self._thread.join()
+        self._thread = None
+
+        self._Resize(self._written)
+        self._header.flush()
+        self._header = None
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+        return False
+
+class TrajectoryReader:
+    """
+    Random access to the frames of a file written by TrajectoryRecorder.
+    The file is memory-mapped read-only and every accessor returns a view into it,
+    so recordings larger than memory can be analysed frame by frame.
+    """
+    def __init__(self, path: str):
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if header.size == 0 or header[0]["magic"] != MAGIC:
+            raise ValueError(f"{path} is not a trajectory file")
+        header = header[0]
+        if header["version"] != VERSION:
+            raise ValueError(f"Unsupported trajectory version {header['version']}, expected {VERSION}")
+
+        self._dt = float(header["dt"])
+        self._particle_size = float(header["particle_size"])
+        self._particles = int(header["particles"])
+        frame_dtype = FrameDtype(self._particles)
+        count = int(header["frames"])
+        if count == 0:
+            self._frames = np.zeros(0, dtype=frame_dtype)
+        else:
+            self._frames = np.memmap(path, dtype=frame_dtype, mode="r", offset=HEADER_DTYPE.itemsize, shape=(count,))
+
+    def __len__(self):
+        return len(self._frames)
+
+    def GetDt(self) -> float:
+        """Seconds between two recorded frames."""
+        return self._dt
+
+    def GetParticleCapacity(self) -> int:
+        return self._particles
+
+    def GetParticleSize(self) -> float:
+        """Particle diameter of the recorded run, 0 if the recording does not say."""
+        return self._particle_size
+
+    def GetStep(self, k: int) -> int:
+        return int(self._frames["step"][k])
+
+    def GetCount(self, k: int) -> int:
+        return int(self._frames["count"][k])
+
+    def GetFrame(self, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Positions and velocities of frame `k`, as views into the file."""
+        count = self.GetCount(k)
+        return self._frames["positions"][k, :count], self._frames["velocities"][k, :count]
+
+    def GetIds(self, k: int) -> np.ndarray:
+        return self._frames["ids"][k, :self.GetCount(k)]
+
+    def Touch(self, k: int) -> int:
+        """Read one value from every page of frame `k`, so the OS has it in memory."""
+        frame = self._frames[k:k + 1].view(np.uint8)
+        return int(frame[::4096].sum())
+
+    def Close(self):
+        self._frames = None
+
+class TrajectoryPlayer:
+    """
+    Plays a recording back on its own clock, at any speed and in either direction.
+    Advance moves the clock and returns the frame to show; the frame's arrays are
+    views into the file, so showing one costs no more than uploading it. A worker
+    thread touches the next `prefetch` frames in the playback direction so their
+    pages are read from disk before they are needed.
+    """
+    # colour of every particle ID, so particles keep their colour across reordering
+    _PALETTE = np.random.default_rng(0).uniform(0.0, 1.0, size=(4096, 3)).astype(np.float32)
+
+    def __init__(self, reader: TrajectoryReader, speed: float = 1.0, loop: bool = True, prefetch: int = 8):
+        if len(reader) == 0:
+            raise ValueError("The recording has no frames")
+        self._reader = reader
+        self._speed = speed
+        self._loop = loop
+        self._paused = False
+        self._time = 0.0
+        self._frame = 0
+
+        self._colors_frame = None
+        self._colors = np.zeros((0, 3), dtype=np.float32)
+
+        self._prefetch = max(0, int(prefetch))
+        self._warm = OrderedDict()
+        self._wake = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._Prefetch, name="TrajectoryPrefetch", daemon=True)
+        self._thread.start()
+
+    def GetFrameCount(self) -> int:
+        return len(self._reader)
+
+    def GetFrameIndex(self) -> int:
+        return self._frame
+
+    def GetReader(self) -> TrajectoryReader:
+        return self._reader
+
+    def GetSpeed(self) -> float:
+        return self._speed
+
+    def SetSpeed(self, speed: float):
+        """Playback speed relative to recorded time, negative plays backwards."""
+        self._speed = speed
+
+    def IsPaused(self) -> bool:
+        return self._paused
+
+    def SetPaused(self, paused: bool):
+        self._paused = paused
+
+    def SetLooping(self, loop: bool):
+        self._loop = loop
+
+    def Seek(self, frame: int):
+        self._time = min(max(int(frame), 0), len(self._reader) - 1) * self._reader.GetDt()
+        self._SetFrame(self._FrameAt(self._time))
+
+    def Advance(self, seconds: float) -> int:
+        """Move the clock on by `seconds` of wall time and return the frame to show."""
+        if not self._paused:
+            self._time += seconds * self._speed
+            duration = len(self._reader) * self._reader.GetDt()
+            if self._loop:
+                self._time %= duration
+            else:
+                self._time = min(max(self._time, 0.0), duration - self._reader.GetDt())
+            self._SetFrame(self._FrameAt(self._time))
+        return self._frame
+
+    def _FrameAt(self, time: float) -> int:
+        return min(max(int(time / self._reader.GetDt()), 0), len(self._reader) - 1)
+
+    def _SetFrame(self, frame: int):
+        if frame == self._frame:
+            return
+        with self._wake:
+            self._frame = frame
+            self._wake.notify()
+
+    def GetFrame(self) -> tuple[np.ndarray, np.ndarray]:
+        """Positions and velocities of the current frame, as views into the file."""
+        return self._reader.GetFrame(self._frame)
+
+    def GetIds(self) -> np.ndarray:
+        return self._reader.GetIds(self._frame)
+
+    def GetColors(self) -> np.ndarray:
+        """A colour for every particle of the current frame, picked by ID."""
+        if self._colors_frame != self._frame:
+            ids = self.GetIds()
+            self._colors = np.take(self._PALETTE, ids % len(self._PALETTE), axis=0)
+            self._colors_frame = self._frame
+        return self._colors
+
+    def _Upcoming(self, frame: int) -> list[int]:
+        step = -1 if self._speed < 0 else 1
+        count = len(self._reader)
+        frames = [frame + step * k for k in range(1, self._prefetch + 1)]
+        if self._loop:
+            return [f % count for f in frames]
+        return [f for f in frames if 0 <= f < count]
+
+    def _Prefetch(self):
+        last = None
+        while True:
+            with self._wake:
+                while not self._stop and self._frame == last:
+                    self._wake.wait()
+                if self._stop:
+                    return
+                last = self._frame
+
+            for frame in self._Upcoming(last):
+                if self._stop or self._frame != last:
+                    break
+                if frame in self._warm:
+                    self._warm.move_to_end(frame)
+                    continue
+                self._reader.Touch(frame)
+                self._warm[frame] = True
+                if len(self._warm) > 4 * max(1, self._prefetch):
+                    self._warm.popitem(last=False)
+
+    def Close(self):
+        """Stop the prefetch thread and close the recording."""
+        if self._thread is None:
+            return
+        with self._wake:
+            self._stop = True
+            self._wake.notify()
+        self._thread.join()
+        self._thread = None
+        self._reader.Close()
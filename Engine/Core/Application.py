@@ -3,18 +3,22 @@ from Engine.Core.Layer import *
 from Engine.Renderer.Renderer import *
 from Engine.Core.DeltaTime import DeltaTime
 from Engine.Core.UI import UI
+from Engine.Core.Profiler import Profiler
+from Engine.Core.FixedTimestep import FixedTimestep
 
 import glfw
 
     
 class Application:
-    def __init__(self, width = 800, height = 600, title = "ParticleFlow"):
+    def __init__(self, width = 800, height = 600, title = "ParticleFlow", fixedStep = 1 / 240, maxFixedSteps = 4):
         self._window = Window(width, height, title)
         self._ui = UI()
         
         self._layer_stack = LayerStack()
         self._Running = True
         self._last_frame_time = 0.0
+        # layers get OnFixedUpdate at this rate, however fast frames are rendered
+        self._timestep = FixedTimestep(fixedStep, maxFixedSteps)
 
     def EndApplication(self):
         self._Running = False
@@ -22,34 +26,36 @@ class Application:
     def GetWindow(self):
         return self._window
 
+    def GetTimestep(self) -> FixedTimestep:
+        return self._timestep
+
     def Run(self):
         print("Created Application") 
         self._ui.InitUI(self._window.GetWindow())
         
-        fps_cap = 60.0
-        dt = 1.0 / fps_cap
-        last_update_time = 0.0
-        
+        self._last_frame_time = glfw.get_time()
+
         while self._window.WindowOpen() and self._Running:
             time = glfw.get_time()
             deltaTime = DeltaTime(time - self._last_frame_time)
             self._last_frame_time = time
 
-            # if last_update_time < dt:
-            #     last_update_time += deltaTime.GetSeconds()
-            #     continue
-# 
-            # tDt = DeltaTime(dt)
-            
-            # clear + buffer swap
-            self._window.Clear()
-            # update layers if any
-            self._ui.BeginFrame()
-            self._layer_stack.OnUpdate(deltaTime)
-            self._layer_stack.OnUI(deltaTime)
-
-            # draw triangle
-            self._ui.EndFrame()
-            self._window.OnUpdate()
+            with Profiler.Scope("Frame"):
+                # clear + buffer swap
+                self._window.Clear()
+                # update layers if any
+                self._ui.BeginFrame()
+                with Profiler.Scope("LayerFixedUpdate"):
+                    for _ in range(self._timestep.Advance(deltaTime.GetSeconds())):
+                        self._layer_stack.OnFixedUpdate(DeltaTime(self._timestep.GetStep()))
+                with Profiler.Scope("LayerUpdate"):
+                    self._layer_stack.OnUpdate(deltaTime, self._timestep.GetAlpha())
+                with Profiler.Scope("LayerUI"):
+                    self._layer_stack.OnUI(deltaTime)
+
+                # draw triangle
+                self._ui.EndFrame()
+                self._window.OnUpdate()
+            Profiler.EndFrame()
 
         self._window.CloseWindow()
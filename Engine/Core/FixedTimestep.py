@@ -0,0 +1,57 @@
+class FixedTimestep:
+    """
+    Accumulates frame time and hands it out in fixed steps.
+
+        steps = timestep.Advance(frameSeconds)
+        for _ in range(steps):
+            Step(timestep.GetStep())
+        Render(timestep.GetAlpha())
+
+    At most `maxSteps` steps are taken per frame. When a frame would need more, the
+    surplus time is dropped so a slow step cannot snowball into ever longer frames.
+    """
+    def __init__(self, step: float = 1 / 240, maxSteps: int = 4):
+        self._step = step
+        self._max_steps = max(1, int(maxSteps))
+        self._accumulator = 0.0
+        self._dropped = 0.0
+
+    def GetStep(self) -> float:
+        return self._step
+
+    def SetStep(self, step: float):
+        self._step = step
+        self._accumulator = min(self._accumulator, step)
+
+    def GetMaxSteps(self) -> int:
+        return self._max_steps
+
+    def SetMaxSteps(self, maxSteps: int):
+        self._max_steps = max(1, int(maxSteps))
+
+    def Advance(self, frameSeconds: float) -> int:
+        """Add a frame's time and return the number of fixed steps to take."""
+        self._accumulator += max(0.0, frameSeconds)
+        steps = int(self._accumulator // self._step)
+
+        if steps > self._max_steps:
+            # keep the fractional part so interpolation stays continuous
+            surplus = (steps - self._max_steps) * self._step
+            self._dropped += surplus
+            self._accumulator -= surplus
+            steps = self._max_steps
+
+        self._accumulator -= steps * self._step
+        return steps
+
+    def GetAlpha(self) -> float:
+        """How far the current frame is between the last two steps, in [0, 1)."""
+        return min(self._accumulator / self._step, 1.0)
+
+    def GetDroppedTime(self) -> float:
+        """Total seconds skipped because of the catch-up cap."""
+        return self._dropped
+
+    def Reset(self):
+        self._accumulator = 0.0
+        self._dropped = 0.0
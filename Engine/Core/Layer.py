@@ -18,8 +18,16 @@ class Layer:
         # Override in subclass if needed
         pass
 
-    def OnUpdate(self, dt):
-        """Called every frame to update the layer logic."""
+    def OnFixedUpdate(self, dt):
+        """Called zero or more times per frame with a fixed timestep, before OnUpdate."""
+        # Override in subclass if needed
+        pass
+
+    def OnUpdate(self, dt, alpha=1.0):
+        """
+        Called every frame to update the layer logic.
+        `alpha` is how far the frame is between the last two fixed updates.
+        """
         # Override in subclass if needed
         pass
 
@@ -53,10 +61,15 @@ class LayerStack:
             layer.OnDetach()
             layer.attached = False
 
-    def OnUpdate(self, dt):
+    def OnFixedUpdate(self, dt):
+        """Call on_fixed_update for each layer in insertion order."""
+        for layer in self._layers:
+            layer.OnFixedUpdate(dt)
+
+    def OnUpdate(self, dt, alpha=1.0):
         """Call on_update for each layer in insertion order."""
         for layer in self._layers:
-            layer.OnUpdate(dt)
+            layer.OnUpdate(dt, alpha)
 
     def OnEvent(self, event):
         """Dispatch an event to layers in reverse order until handled."""
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+
+class _Scope:
+    __slots__ = ("_name", "_start")
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        Profiler._Record(self._name, self._start, time.perf_counter_ns())
+        return False
+
+class _RingBuffer:
+    """Fixed-size history of the most recent samples of one scope, in milliseconds."""
+    def __init__(self, capacity: int):
+        self.samples = np.zeros(capacity, dtype=np.float64)
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+        self.calls = 0
+
+    def Push(self, value: float):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.samples.size
+        self.count = min(self.count + 1, self.samples.size)
+        self.total += value
+        self.calls += 1
+
+    def Values(self) -> np.ndarray:
+        return self.samples[:self.count]
+
+class Profiler:
+    """
+    Named scoped timers for the hot paths of the frame loop, switched on at runtime.
+
+        with Profiler.Scope("Grid"):
+            ...
+
+    While disabled a scope is a shared no-op context, so instrumentation can stay in
+    place. While enabled every scope pushes its duration into a ring buffer holding
+    the last `history` samples, and a Chrome trace of a window of frames can be captured.
+    """
+    _enabled = False
+    _history = 240
+    _buffers: dict[str, _RingBuffer] = {}
+    _lock = threading.Lock()
+    _null_scope = nullcontext()
+
+    # Chrome trace capture
+    _trace_events: list[dict] = None
+    _trace_frames_left = 0
+    _trace_path = None
+    _trace_origin = 0
+
+    @staticmethod
+    def Enable(enabled: bool = True):
+        Profiler._enabled = enabled
+
+    @staticmethod
+    def IsEnabled() -> bool:
+        return Profiler._enabled
+
+    @staticmethod
+    def SetHistory(samples: int):
+        """Number of samples kept per scope, clears the existing history."""
+        Profiler._history = max(1, int(samples))
+        Profiler.Reset()
+
+    @staticmethod
+    def Reset():
+        with Profiler._lock:
+            Profiler._buffers = {}
+
+    @staticmethod
+    def Scope(name: str):
+        if not Profiler._enabled:
+            return Profiler._null_scope
+        return _Scope(name)
+
+    @staticmethod
+    def _Record(name: str, start: int, end: int):
+        with Profiler._lock:
+            buffer = Profiler._buffers.get(name)
+            if buffer is None:
+                buffer = Profiler._buffers[name] = _RingBuffer(Profiler._history)
+            buffer.Push((end - start) / 1e6)
+
+            if Profiler._trace_events is not None:
+                Profiler._trace_events.append({
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start - Profiler._trace_origin) / 1e3,
+                    "dur": (end - start) / 1e3,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                })
+
+    @staticmethod
+    def GetStats() -> dict[str, dict[str, float]]:
+        """
+        Rolling statistics per scope over the kept history, in milliseconds:
+        last, min, avg and p99, plus the total time and calls since the last reset.
+        """
+        stats = {}
+        with Profiler._lock:
+            for name, buffer in Profiler._buffers.items():
+                values = buffer.Values()
+                last = buffer.samples[(buffer.index - 1) % buffer.samples.size]
+                stats[name] = {
+                    "last": float(last),
+                    "min": float(values.min()),
+                    "avg": float(values.mean()),
+                    "p99": float(np.percentile(values, 99)),
+                    "total": buffer.total,
+                    "calls": buffer.calls,
+                }
+        return stats
+
+    @staticmethod
+    def CaptureTrace(frames: int, path: str):
+        """
+        Record every scope for the next `frames` frames and write them to `path`
+        as Chrome trace JSON (open in chrome://tracing or Perfetto).
+        Enables the profiler if it is off.
+        """
+        Profiler.Enable(True)
+        with Profiler._lock:
+            Profiler._trace_events = []
+            Profiler._trace_frames_left = max(1, int(frames))
+            Profiler._trace_path = path
+            Profiler._trace_origin = time.perf_counter_ns()
+
+    @staticmethod
+    def IsCapturing() -> bool:
+        return Profiler._trace_events is not None
+
+    @staticmethod
+    def EndFrame():
+        """Mark the end of a frame, finishing a trace capture once its window is over."""
+        if Profiler._trace_events is None:
+            return
+        Profiler._trace_frames_left -= 1
+        if Profiler._trace_frames_left > 0:
+            return
+
+        with Profiler._lock:
+            events = Profiler._trace_events
+            path = Profiler._trace_path
+            Profiler._trace_events = None
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Wrote profiler trace to {path}")
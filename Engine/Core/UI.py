@@ -1,6 +1,8 @@
 import imgui
 from imgui.integrations.glfw import GlfwRenderer
 
+from Engine.Core.Profiler import Profiler
+
 class UI:
     def __init__(self):
         self._impl = None
@@ -80,4 +82,32 @@ class UI:
         changed, new_val = imgui.slider_int(label, old, min_value, max_value)
         if changed:
             UI._state[label] = new_val
-        return new_val
\ No newline at end of file
+        return new_val
+
+    @staticmethod
+    def ProfilerStats(tracePath: str = "trace.json", traceFrames: int = 120):
+        """Profiler toggle, rolling per-scope timings and a button to capture a Chrome trace."""
+        enabled, changed = UI.Checkbox("Enable Profiler", Profiler.IsEnabled())
+        if changed:
+            Profiler.Enable(enabled)
+            Profiler.Reset()
+
+        if Profiler.IsCapturing():
+            UI.Text("Capturing trace...")
+        elif UI.Button(f"Capture Trace ({traceFrames} frames)"):
+            Profiler.CaptureTrace(traceFrames, tracePath)
+
+        stats = Profiler.GetStats()
+        if not stats:
+            return
+
+        imgui.columns(4, "profiler_stats")
+        for header in ("Scope", "min (ms)", "avg (ms)", "p99 (ms)"):
+            UI.Text(header)
+            imgui.next_column()
+        imgui.separator()
+        for name, scope in stats.items():
+            for value in (name, f"{scope['min']:.3f}", f"{scope['avg']:.3f}", f"{scope['p99']:.3f}"):
+                UI.Text(value)
+                imgui.next_column()
+        imgui.columns(1)
@@ -23,6 +23,65 @@ class VertexBuffer:
     # def __del__(self): 
     #     glDeleteBuffers(1, [self.id])
 
+class DynamicVertexBuffer:
+    """
+    Persistent OpenGL VBO for data rewritten every frame.
+    Storage grows geometrically and is only re-allocated when it has to grow,
+    updates go through glBufferSubData.
+    Growing discards the old contents, so callers re-upload everything after Reserve returns True.
+    """
+    def __init__(self, capacity: int = 0, usage=GL_DYNAMIC_DRAW):
+        self.id = glGenBuffers(1)
+        self.capacity = 0
+        self._usage = usage
+        if capacity > 0:
+            self.Reserve(capacity)
+
+    def Bind(self): 
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        
+    def Unbind(self): 
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def Reserve(self, size: int) -> bool:
+        """Make sure at least `size` bytes are allocated, returns True if the storage was re-allocated."""
+        if size <= self.capacity:
+            return False
+        self.capacity = max(int(size), self.capacity * 2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity, None, self._usage)
+        return True
+
+    def Orphan(self):
+        """Hand the current storage back to the driver so a full rewrite does not wait on the GPU."""
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        glBufferData(GL_ARRAY_BUFFER, self.capacity, None, self._usage)
+
+    def Upload(self, data, offset: int = 0):
+        """Copy a contiguous array into the buffer at a byte offset."""
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        glBufferSubData(GL_ARRAY_BUFFER, offset, data.nbytes, data)
+
+class UniformBuffer:
+    """
+    OpenGL UBO of a fixed size, bound to a uniform block binding point.
+    Every program whose block is bound to the same point reads the same buffer,
+    so data shared across programs is uploaded once.
+    """
+    def __init__(self, size: int, binding: int, usage=GL_DYNAMIC_DRAW):
+        self.id = glGenBuffers(1)
+        self.size = int(size)
+        self.binding = binding
+        glBindBuffer(GL_UNIFORM_BUFFER, self.id)
+        glBufferData(GL_UNIFORM_BUFFER, self.size, None, usage)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        glBindBufferBase(GL_UNIFORM_BUFFER, binding, self.id)
+
+    def Upload(self, data, offset: int = 0):
+        """Copy a contiguous array into the buffer at a byte offset."""
+        glBindBuffer(GL_UNIFORM_BUFFER, self.id)
+        glBufferSubData(GL_UNIFORM_BUFFER, offset, data.nbytes, data)
+
 class VertexArray:
     """
     Wraps an OpenGL VAO for attribute state.
@@ -33,14 +33,16 @@ class Camera:
         self._max_dist = 100.0
         self._scroll_offset = 0.0
 
-    def GetViewMatrix(self) -> glm.mat4:
+    def GetPosition(self) -> glm.vec3:
         rad_yaw   = glm.radians(self.yaw)
         rad_pitch = glm.radians(self.pitch)
         x = self.distance * glm.cos(rad_pitch) * glm.cos(rad_yaw)
         y = self.distance * glm.sin(rad_pitch)
         z = self.distance * glm.cos(rad_pitch) * glm.sin(rad_yaw)
-        eye = glm.vec3(x, y, z) + self.pivot
-        return glm.lookAt(eye, self.pivot, glm.vec3(0,1,0))
+        return glm.vec3(x, y, z) + self.pivot
+
+    def GetViewMatrix(self) -> glm.mat4:
+        return glm.lookAt(self.GetPosition(), self.pivot, glm.vec3(0,1,0))
 
     def GetProjectionMatrix(self) -> glm.mat4:
         return glm.perspective(glm.radians(self.fov), self.aspect, self.near, self.far)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from Engine.Renderer.Buffers import UniformBuffer
+from Engine.Renderer.Camera import Camera
+from Engine.Renderer.Shader import Shader
+
+class CameraUniforms:
+    """
+    Per-frame camera data in a std140 uniform buffer, read by every program that
+    declares the block
+
+        layout(std140) uniform Camera {
+            mat4 uView;
+            mat4 uProj;
+            vec4 uCameraPosition;   // w unused
+        };
+
+    The block is packed into a float32 array and uploaded only when it differs from
+    the last upload, so a still camera costs no driver calls.
+    """
+    BLOCK = "Camera"
+    SIZE = 144
+
+    def __init__(self):
+        self._buffer = UniformBuffer(self.SIZE, Shader.UNIFORM_BLOCK_BINDINGS[self.BLOCK])
+        self._data = np.zeros(self.SIZE // 4, dtype=np.float32)
+        self._uploaded = None
+
+    def Update(self, camera: Camera) -> bool:
+        """Pack the camera's matrices and position and upload them if they changed."""
+        # the raw bytes of a glm matrix are column-major, as std140 expects
+        self._data[0:16] = np.frombuffer(camera.GetViewMatrix().to_bytes(), dtype=np.float32)
+        self._data[16:32] = np.frombuffer(camera.GetProjectionMatrix().to_bytes(), dtype=np.float32)
+        self._data[32:35] = camera.GetPosition()
+        self._data[35] = 1.0
+        if self._uploaded is not None and np.array_equal(self._data, self._uploaded):
+            return False
+        self._buffer.Upload(self._data)
+        self._uploaded = self._data.copy()
+        return True
@@ -3,12 +3,17 @@ from OpenGL.GL import *
 import ctypes
 
 import math
-import glm
+import numpy as np
 
 class Mesh:
     """
     Simple mesh with a position-only VBO and VAO.
     """
+    # bytes per instance in each vec3 stream
+    INSTANCE_STRIDE = 3 * ctypes.sizeof(ctypes.c_float)
+    # bytes per instance in the radius stream
+    RADIUS_STRIDE = ctypes.sizeof(ctypes.c_float)
+
     def __init__(self, vertices: list[float]):
         self.vbo = VertexBuffer(vertices)
         self.vao = VertexArray()
@@ -20,68 +25,162 @@ class Mesh:
         self.vao.Unbind()
         self.vertex_count = len(vertices) // 3
 
+        # persistent per-instance streams, created on first SetInstanceData
+        self._inst_points = None
+        self._inst_colors = None
+        self._inst_capacity = 0
+        self.instance_count = 0
+
+        # optional per-instance radius stream, created on the first SetInstanceData with radii
+        self._inst_radii = None
+        self._radii_capacity = 0
+        self._radii_count = 0
+        # radius shared by every instance, None when the last radii were per instance
+        self._radius = None
+
     def Bind(self):   
         self.vao.Bind()
     
     def Unbind(self): 
         self.vao.Unbind()
         
-    def SetInstanceData(self,
-                    points: list[glm.vec3],
-                    colors: list[glm.vec3]):
-        # 1) One instance per vec3 in points
-        count = len(points)
-        assert len(colors) == count
+    def _ReserveInstances(self, count: int) -> bool:
+        """
+        Create the instance streams on first use and grow them to hold `count`
+        instances. Returns True when the GPU storage was re-allocated.
+        """
+        if self._inst_points is None:
+            self._inst_points = DynamicVertexBuffer()
+            self._inst_colors = DynamicVertexBuffer()
 
-        # 2) Clean up old buffer if present
-        if hasattr(self, '_inst_vbo'):
-            glDeleteBuffers(1, [self._inst_vbo])
-        self._inst_vbo = glGenBuffers(1)
+            # Attributes point at the buffer objects, so they survive re-allocation
+            self.vao.Bind()
 
-        # 3) Prepare interleaved float data: 3 + 3 + 1 = 7 floats per instance
-        floats_per = 6
-        total = count * floats_per
-        ArrayType = GLfloat * total
+            # aInstancePoint → location=1, tightly packed vec3 stream
+            self._inst_points.Bind()
+            self.vao.AddAttribute(1, 3, GL_FLOAT, GL_FALSE, self.INSTANCE_STRIDE, ctypes.c_void_p(0))
+            glVertexAttribDivisor(1, 1)
 
-        inter = []
-        for i in range(count):
-            # expand each glm.vec3 into its x,y,z
-            inter += [points[i].x, points[i].y, points[i].z]
-            inter += [colors[i].x, colors[i].y, colors[i].z]
+            # aInstanceColor → location=2, tightly packed vec3 stream
+            self._inst_colors.Bind()
+            self.vao.AddAttribute(2, 3, GL_FLOAT, GL_FALSE, self.INSTANCE_STRIDE, ctypes.c_void_p(0))
+            glVertexAttribDivisor(2, 1)
 
-        buf = ArrayType(*inter)
+            self.vao.Unbind()
+            self._inst_colors.Unbind()
 
-        # 4) Upload to GPU
-        glBindBuffer(GL_ARRAY_BUFFER, self._inst_vbo)
-        glBufferData(GL_ARRAY_BUFFER,
-                     ctypes.sizeof(buf),
-                     buf,
-                     GL_DYNAMIC_DRAW)
+        if count <= self._inst_capacity:
+            return False
 
-        # 5) Configure per-instance vertex attributes
-        self.vao.Bind()
-        stride = floats_per * ctypes.sizeof(ctypes.c_float)
+        self._inst_capacity = max(count, self._inst_capacity * 2)
+        self._inst_points.Reserve(self._inst_capacity * self.INSTANCE_STRIDE)
+        self._inst_colors.Reserve(self._inst_capacity * self.INSTANCE_STRIDE)
+        return True
 
-        # aInstancePoint → location=1, vec3 at offset 0
-        glEnableVertexAttribArray(1)
-        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(0))
-        glVertexAttribDivisor(1, 1)
+    def _ReserveRadii(self) -> bool:
+        """Create the radius stream on first use and grow it with the other streams."""
+        if self._inst_radii is None:
+            self._inst_radii = DynamicVertexBuffer()
 
-        # aInstanceColor → location=2, vec3 at offset 3*sizeof(float)
-        off = 3 * ctypes.sizeof(ctypes.c_float)
-        glEnableVertexAttribArray(2)
-        glVertexAttribPointer(2, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(off))
-        glVertexAttribDivisor(2, 1)
+            # aInstanceRadius → location=3, tightly packed float stream
+            self.vao.Bind()
+            self._inst_radii.Bind()
+            self.vao.AddAttribute(3, 1, GL_FLOAT, GL_FALSE, self.RADIUS_STRIDE, ctypes.c_void_p(0))
+            glVertexAttribDivisor(3, 1)
+            self.vao.Unbind()
+            self._inst_radii.Unbind()
 
-        # aInstanceRadius → location=3, float at offset 6*sizeof(float)
-        
+        if self._inst_capacity <= self._radii_capacity:
+            return False
+        self._radii_capacity = self._inst_capacity
+        self._inst_radii.Reserve(self._radii_capacity * self.RADIUS_STRIDE)
+        return True
 
-        self.vao.Unbind()
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
+    def _UploadRadii(self, radii, count: int, start: int, end: int):
+        previous = self._radii_count
+        full = self._ReserveRadii() or previous < self.instance_count
+        if np.ndim(radii) == 0:
+            # one radius for every instance, only uploaded again when it changes
+            value = float(radii)
+            start = 0 if full or value != self._radius else min(previous, count)
+            end = count
+            data = np.full(end - start, value, dtype=np.float32)
+            self._radius = value
+        else:
+            data = np.ascontiguousarray(np.asarray(radii, dtype=np.float32).reshape(-1))
+            assert len(data) == count
+            if full or self._radius is not None:
+                start, end = 0, count
+            data = data[start:end]
+            self._radius = None
+
+        if end > start:
+            if start == 0 and end == count:
+                self._inst_radii.Orphan()
+            self._inst_radii.Upload(data, start * self.RADIUS_STRIDE)
+            self._inst_radii.Unbind()
+        self._radii_count = count
+
+    @staticmethod
+    def _AsInstanceStream(data) -> np.ndarray:
+        """
+        View instance data as a contiguous (n, 3) float32 array.
+        NumPy arrays and buffer-protocol objects already in that layout are used
+        in place; anything else (e.g. a list of glm.vec3) is converted.
+        """
+        return np.ascontiguousarray(np.asarray(data, dtype=np.float32).reshape(-1, 3))
+
+    def SetInstanceData(self, points, colors, dirtyRange: tuple[int, int] = None, radii=None):
+        """
+        Update the per-instance points and colours.
+        Points and colours are separate vec3 streams, so contiguous float32 (n, 3)
+        arrays (such as Simulation.GetPoints()) go straight to glBufferSubData with
+        no intermediate copy. `dirtyRange` limits the upload to the instances
+        [start, end) that changed; instances added since the last call are always uploaded.
+        `radii` fills the aInstanceRadius stream, either one radius per instance or a
+        single radius for all of them, which is only uploaded when it changes.
+        """
+        # 1) One instance per point
+        points = self._AsInstanceStream(points)
+        colors = self._AsInstanceStream(colors)
+        count = len(points)
+        assert len(colors) == count
+        previous = self.instance_count
 
-        # 6) Store count for instanced draw
+        # 2) Grow the buffers if needed, re-allocated buffers need a full upload
+        grew = self._ReserveInstances(count)
+        if dirtyRange is None or grew:
+            start, end = 0, count
+        else:
+            start, end = dirtyRange
+            if count > previous:
+                # extend the dirty range over the new instances
+                start = min(start, previous) if end > start else previous
+                end = count
+            end = min(end, count)
+
+        # 3) Upload each stream, orphaning first when the whole buffer is rewritten
+        if end > start:
+            for buffer, data in ((self._inst_points, points), (self._inst_colors, colors)):
+                if start == 0 and end == count:
+                    buffer.Orphan()
+                buffer.Upload(data[start:end], start * self.INSTANCE_STRIDE)
+            self._inst_colors.Unbind()
+        if radii is not None:
+            self._UploadRadii(radii, count, start, end)
+
+        # 4) Store count for instanced draw
         self.instance_count = count
 
+    @staticmethod
+    def GenerateQuad(size: float = 1.0) -> list[float]:
+        """
+        Two counter-clockwise triangles covering [-size, size] in the xy plane, as a
+        flat list of (x, y, z) vertices.
+        """
+        corners = [(-1, -1), (1, -1), (1, 1), (-1, -1), (1, 1), (-1, 1)]
+        return [coordinate for x, y in corners for coordinate in (x * size, y * size, 0.0)]
+
     @staticmethod
     def GenerateUVSphere(stacks: int, slices: int, radius: float = 1.0) -> list[float]:
         """
@@ -121,4 +220,64 @@ class Mesh:
                 vertices += [x11, y1, z11]
                 vertices += [x01, y0, z01]
 
-        return vertices
\ No newline at end of file
+        return vertices
+
+
+class MeshLOD:
+    """
+    Several resolutions of one mesh, finest first, drawn as one instanced draw per level.
+    SetInstanceData buckets the instances every frame by their distance to the eye:
+    level k takes the instances closer than distances[k] * scale that no finer level
+    took, the last level takes the rest. Each level's instances are uploaded as one
+    contiguous range to that level's Mesh, so far away instances cost few vertices.
+    """
+    def __init__(self, levels: list[list[float]], distances: list[float]):
+        if len(distances) != len(levels) - 1:
+            raise ValueError(f"{len(levels)} levels need {len(levels) - 1} distances, got {len(distances)}")
+        if np.any(np.diff(distances) < 0):
+            raise ValueError("LOD distances must be ascending")
+        self.meshes = [Mesh(vertices) for vertices in levels]
+        self.distances = np.asarray(distances, dtype=np.float32)
+
+        # instances sorted by level, reused between frames
+        self._points = np.zeros((0, 3), dtype=np.float32)
+        self._colors = np.zeros((0, 3), dtype=np.float32)
+        self._counts = np.zeros(len(levels), dtype=np.int64)
+
+    @property
+    def instance_count(self) -> int:
+        return sum(mesh.instance_count for mesh in self.meshes)
+
+    def GetLevelCounts(self) -> list[int]:
+        """Instances drawn at every level, finest first."""
+        return [mesh.instance_count for mesh in self.meshes]
+
+    def GetLevels(self, points, eye, scale: float = 1.0) -> np.ndarray:
+        """Level of every point, as uint8 so the stable sort by level is a radix sort."""
+        offset = np.asarray(points, dtype=np.float32).reshape(-1, 3) - np.asarray(eye, dtype=np.float32)
+        distance2 = np.einsum("ij,ij->i", offset, offset)
+        limits = (self.distances * np.float32(scale)) ** 2
+        return np.searchsorted(limits, distance2, side="right").astype(np.uint8)
+
+    def SetInstanceData(self, points, colors, eye, scale: float = 1.0):
+        points = Mesh._AsInstanceStream(points)
+        colors = Mesh._AsInstanceStream(colors)
+        count = len(points)
+        assert len(colors) == count
+
+        levels = self.GetLevels(points, eye, scale)
+        order = np.argsort(levels, kind="stable")
+        self._counts = np.bincount(levels, minlength=len(self.meshes))
+
+        if len(self._points) < count:
+            capacity = max(count, 2 * len(self._points))
+            self._points = np.zeros((capacity, 3), dtype=np.float32)
+            self._colors = np.zeros((capacity, 3), dtype=np.float32)
+        np.take(points, order, axis=0, out=self._points[:count])
+        np.take(colors, order, axis=0, out=self._colors[:count])
+
+        start = 0
+        for mesh, level_count in zip(self.meshes, self._counts):
+            end = start + int(level_count)
+            mesh.SetInstanceData(self._points[start:end], self._colors[start:end])
+            start = end
@@ -1,6 +1,6 @@
 # renderer.py
 from Engine.Renderer.Shader import Shader
-from Engine.Renderer.Mesh import Mesh
+from Engine.Renderer.Mesh import Mesh, MeshLOD
 from OpenGL.GL import *
 
 class Renderer:
@@ -23,6 +23,11 @@ class Renderer:
             return
         
         self.shader.Use()
-        self.mesh.Bind()
-        glDrawArraysInstanced(GL_TRIANGLES, 0, self.mesh.vertex_count, count)
-        self.mesh.Unbind()
\ No newline at end of file
+        # a MeshLOD is drawn with one instanced draw per level
+        meshes = self.mesh.meshes if isinstance(self.mesh, MeshLOD) else [self.mesh]
+        for mesh in meshes:
+            if mesh.instance_count <= 0:
+                continue
+            mesh.Bind()
+            glDrawArraysInstanced(GL_TRIANGLES, 0, mesh.vertex_count, mesh.instance_count)
+            mesh.Unbind()
\ No newline at end of file
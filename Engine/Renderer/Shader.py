@@ -1,13 +1,26 @@
 from OpenGL.GL import *
 from glm import value_ptr
+import glm
 import os
 
+from Engine.Renderer.ShaderCache import ShaderCache
+
 class Shader:
     """
     Loads, compiles, and links a GLSL vertex+fragment shader from files.
-    Provides uniform-setting helpers.
+    Provides uniform-setting helpers. With a ShaderCache the linked program is
+    loaded from its cached binary when there is one.
+
+    The active uniforms are looked up once after linking, and every upload helper
+    skips the GL call when the uniform already holds the value, so setting the same
+    uniforms every frame only costs driver calls for the ones that changed.
+    Uniform blocks named in UNIFORM_BLOCK_BINDINGS are bound to their binding point
+    at link time, so every program declaring e.g. the `Camera` block reads the same
+    UniformBuffer.
     """
-    def __init__(self, vertex_path: str, fragment_path: str):
+    UNIFORM_BLOCK_BINDINGS = {"Camera": 0}
+
+    def __init__(self, vertex_path: str, fragment_path: str, cache: ShaderCache = None):
         # Read source
         vertex_src   = self._LoadSource(vertex_path)
         fragment_src = self._LoadSource(fragment_path)
@@ -15,6 +28,24 @@ class Shader:
         # Create program handle
         self.handle = glCreateProgram()
 
+        # A cached binary replaces compiling and linking, on a miss the program is built and cached
+        self.from_cache = False
+        if cache is not None:
+            name = f"{os.path.basename(vertex_path)}-{os.path.basename(fragment_path)}"
+            key = cache.Key(vertex_src, fragment_src)
+            self.from_cache = cache.Load(self.handle, name, key)
+
+        if not self.from_cache:
+            self._Build(vertex_src, fragment_src, vertex_path, fragment_path, cache)
+            if cache is not None:
+                cache.Store(self.handle, name, key)
+
+        self._uniforms = self._FindUniforms()
+        # last value uploaded to every uniform
+        self._values = {}
+        self._BindUniformBlocks()
+
+    def _Build(self, vertex_src: str, fragment_src: str, vertex_path: str, fragment_path: str, cache: ShaderCache):
         # Compile and attach
         vert = self._CompileShader(vertex_src, GL_VERTEX_SHADER, vertex_path)
         frag = self._CompileShader(fragment_src, GL_FRAGMENT_SHADER, fragment_path)
@@ -22,6 +53,8 @@ class Shader:
         glAttachShader(self.handle, frag)
 
         # Link and check
+        if cache is not None:
+            cache.Prepare(self.handle)
         glLinkProgram(self.handle)
         link_status = glGetProgramiv(self.handle, GL_LINK_STATUS)
         if link_status != GL_TRUE:
@@ -49,29 +82,59 @@ class Shader:
             raise RuntimeError(f"Error compiling {type_name} shader ({path}):\n{error}")
         return shader
 
+    def _FindUniforms(self) -> dict[str, int]:
+        """Location of every active uniform outside a uniform block, by name."""
+        uniforms = {}
+        for i in range(glGetProgramiv(self.handle, GL_ACTIVE_UNIFORMS)):
+            name, _, _ = glGetActiveUniform(self.handle, i)
+            name = name.decode() if isinstance(name, bytes) else name
+            # arrays are reported as "name[0]", upload helpers address them by name
+            if name.endswith("[0]"):
+                name = name[:-3]
+            location = glGetUniformLocation(self.handle, name)
+            if location != -1:
+                uniforms[name] = location
+        return uniforms
+
+    def _BindUniformBlocks(self):
+        for name, binding in self.UNIFORM_BLOCK_BINDINGS.items():
+            index = glGetUniformBlockIndex(self.handle, name)
+            if index != GL_INVALID_INDEX:
+                glUniformBlockBinding(self.handle, index, binding)
+
+    def GetUniformLocation(self, name: str) -> int:
+        """Cached location of a uniform, -1 if the program has no such active uniform."""
+        return self._uniforms.get(name, -1)
+
+    def _Changed(self, name: str, value) -> bool:
+        """Whether `value` differs from the last upload to `name`, recording it if so."""
+        if name not in self._uniforms:
+            return False
+        if name in self._values and self._values[name] == value:
+            return False
+        self._values[name] = value
+        return True
+
     def Use(self):
         """Bind this shader program for rendering."""
         glUseProgram(self.handle)
 
     def UploadInt(self, name: str, value: int):
-        loc = glGetUniformLocation(self.handle, name)
-        if loc != -1:
-            glUniform1i(loc, value)
+        if self._Changed(name, int(value)):
+            glUniform1i(self._uniforms[name], value)
 
     def UploadFloat(self, name: str, value: float):
-        loc = glGetUniformLocation(self.handle, name)
-        if loc != -1:
-            glUniform1f(loc, value)
+        if self._Changed(name, float(value)):
+            glUniform1f(self._uniforms[name], value)
 
     def UploadVec3(self, name: str, value):
-        loc = glGetUniformLocation(self.handle, name)
-        if loc != -1:
-            glUniform3f(loc, value[0], value[1], value[2])
+        if self._Changed(name, (float(value[0]), float(value[1]), float(value[2]))):
+            glUniform3f(self._uniforms[name], value[0], value[1], value[2])
 
     def UploadMat4(self, name: str, mat, transpose=False):
-        loc = glGetUniformLocation(self.handle, name)
-        if loc == -1:
+        # keep a copy, glm matrices are mutable
+        if not self._Changed(name, (glm.mat4(mat), transpose)):
             return
         # convert glm.mat4 to float* via value_ptr
         ptr = value_ptr(mat)
-        glUniformMatrix4fv(loc, 1, GL_TRUE if transpose else GL_FALSE, ptr)
\ No newline at end of file
+        glUniformMatrix4fv(self._uniforms[name], 1, GL_TRUE if transpose else GL_FALSE, ptr)
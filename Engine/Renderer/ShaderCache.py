@@ -0,0 +1,115 @@
+from OpenGL.GL import *
+from OpenGL.error import GLError
+import ctypes
+import hashlib
+import os
+
+import numpy as np
+
+class ShaderCache:
+    """
+    On-disk cache of linked program binaries, so a program is compiled once per
+    driver rather than on every launch.
+
+    Every program has one entry, `<directory>/<name>.bin`, holding the key it was
+    built for, the binary format and the binary. The key hashes the source text and
+    the driver's vendor, renderer and version strings, so editing a shader or
+    updating the driver turns the entry into a miss, and the entry is overwritten
+    by the next Store. Load reports a miss for anything it cannot use, including a
+    binary the driver rejects, and the caller compiles from source as usual.
+    """
+    # bump when the entry layout changes
+    FORMAT = 1
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._supported = None
+        self._driver = None
+
+    def IsSupported(self) -> bool:
+        """Whether the driver can hand out and take back program binaries."""
+        if self._supported is None:
+            self._supported = (bool(glGetProgramBinary) and bool(glProgramBinary)
+                               and glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0)
+        return self._supported
+
+    def _Driver(self) -> list[str]:
+        if self._driver is None:
+            self._driver = []
+            for name in (GL_VENDOR, GL_RENDERER, GL_VERSION):
+                value = glGetString(name)
+                self._driver.append(value.decode() if isinstance(value, bytes) else str(value))
+        return self._driver
+
+    def Key(self, *sources: str) -> str:
+        """Hash of the shader sources and the driver that builds them."""
+        digest = hashlib.sha256(f"ParticleFlow shader cache {self.FORMAT}".encode())
+        for text in self._Driver() + list(sources):
+            # length prefixed so the boundaries between the parts are part of the hash
+            data = text.encode("utf-8")
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def GetPath(self, name: str) -> str:
+        return os.path.join(self._directory, f"{name}.bin")
+
+    def Prepare(self, program: int):
+        """Ask the driver to keep the binary of `program` retrievable, call before linking."""
+        if self.IsSupported():
+            glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+
+    def Load(self, program: int, name: str, key: str) -> bool:
+        """Link `program` from the cached binary; False on a miss or if the driver rejects it."""
+        if not self.IsSupported():
+            return False
+        path = self.GetPath(name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+
+        header = len(key) + 4
+        if len(data) <= header or data[:len(key)] != key.encode("ascii"):
+            return False
+        binary_format = int.from_bytes(data[len(key):header], "little")
+        binary = np.frombuffer(data, dtype=np.uint8, offset=header)
+        try:
+            glProgramBinary(program, binary_format, binary.ctypes.data_as(ctypes.c_void_p), len(binary))
+            linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+        except GLError:
+            linked = False
+        if not linked:
+            # the driver no longer takes it, the entry is rebuilt from source
+            print(f"Shader cache entry {path} rejected by the driver, recompiling")
+        return linked
+
+    def Store(self, program: int, name: str, key: str) -> bool:
+        """Write the binary of the linked `program` to the cache; False if there is none."""
+        if not self.IsSupported():
+            return False
+        size = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if size <= 0:
+            return False
+        binary = np.empty(size, dtype=np.uint8)
+        length = GLsizei(0)
+        binary_format = GLenum(0)
+        glGetProgramBinary(program, size, ctypes.byref(length), ctypes.byref(binary_format),
+                           binary.ctypes.data_as(ctypes.c_void_p))
+        if length.value <= 0:
+            return False
+
+        path = self.GetPath(name)
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            # written next to the entry and renamed, so a crash never leaves half an entry
+            with open(path + ".tmp", "wb") as f:
+                f.write(key.encode("ascii"))
+                f.write(int(binary_format.value).to_bytes(4, "little"))
+                f.write(binary[:length.value].tobytes())
+            os.replace(path + ".tmp", path)
+        except OSError as error:
+            print(f"Could not write shader cache entry {path}: {error}")
+            return False
+        return True
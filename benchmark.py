@@ -0,0 +1,170 @@
+"""
+Simulation step throughput benchmarks.
+Runs Simulation.OnUpdate headless over a matrix of particle counts, particle sizes
+and bound sizes with fixed seeds, and reports steps/sec, per-phase time and peak
+memory. Results can be saved as JSON to compare runs across commits:
+
+    python benchmark.py --out bench.json
+    python benchmark.py --counts 1000 10000 --sizes 0.02 --bounds 2.4 --backend numba
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from App.Simulation.Simulation import Simulation
+
+PHASES = ("integrate", "walls", "grid", "narrow_phase", "sleep", "reorder", "kill")
+
+# random fills denser than this overlap so much the scene stops being meaningful
+MAX_VOLUME_FRACTION = 0.5
+
+class Benchmark:
+    """
+    One benchmark scene: a box filled with particles at uniformly random positions
+    and velocities from a fixed seed, stepped at a fixed dt.
+    With `reorderInterval` the particles are sorted in Morton order every that many
+    steps; the random fill starts with no locality at all, so this shows its full effect.
+    `fill="lattice"` starts from an even, overlap-free lattice at rest instead.
+    """
+    def __init__(self, particles: int, particleSize: float, boundSize: float,
+                 backend: str = "numpy", seed: int = 0, dt: float = 1 / 240, reorderInterval: int = 0,
+                 fill: str = "random"):
+        self.particles = particles
+        self.particle_size = particleSize
+        self.bound_size = boundSize
+        self.backend = backend
+        self.seed = seed
+        self.dt = dt
+        self.reorder_interval = reorderInterval
+        self.fill = fill
+
+    def VolumeFraction(self) -> float:
+        radius = self.particle_size / 2
+        return self.particles * (4 / 3) * np.pi * radius ** 3 / self.bound_size ** 3
+
+    def CreateSimulation(self) -> Simulation:
+        sim = Simulation(self.particles, self.particle_size, (self.bound_size,) * 3, 0.7,
+                         backend=self.backend, seed=self.seed)
+        sim.SetReordering(self.reorder_interval)
+        if self.fill == "lattice":
+            sim.Prefill()
+            return sim
+
+        rng = np.random.default_rng(self.seed)
+        limit = self.bound_size / 2 - self.particle_size / 2
+        sim.AddParticles(
+            rng.uniform(-limit, limit, size=(self.particles, 3)),
+            rng.uniform(-1.0, 1.0, size=(self.particles, 3)),
+        )
+        return sim
+
+    def Run(self, steps: int, warmup: int = 2) -> dict:
+        result = {
+            "particles": self.particles,
+            "particle_size": self.particle_size,
+            "bound_size": self.bound_size,
+            "backend": self.backend,
+            "seed": self.seed,
+            "reorder_interval": self.reorder_interval,
+            "fill": self.fill,
+            "volume_fraction": self.VolumeFraction(),
+        }
+        if result["volume_fraction"] > MAX_VOLUME_FRACTION:
+            result["skipped"] = "volume fraction too high"
+            return result
+
+        sim = self.CreateSimulation()
+
+        # warm up caches and JIT compilation before timing
+        for _ in range(warmup):
+            sim.OnUpdate(self.dt)
+
+        sim.SetPhaseTiming(True)
+        sim.ResetPhaseTimes()
+        start = time.perf_counter()
+        for _ in range(steps):
+            sim.OnUpdate(self.dt)
+        elapsed = time.perf_counter() - start
+        phases = sim.GetPhaseTimes()
+
+        # memory is measured in a separate pass, tracemalloc slows the step down
+        sim.SetPhaseTiming(False)
+        tracemalloc.start()
+        sim.OnUpdate(self.dt)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result.update({
+            "steps": steps,
+            "seconds": elapsed,
+            "steps_per_second": steps / elapsed,
+            "phase_ms_per_step": {name: phases.get(name, 0.0) / steps * 1000 for name in PHASES},
+            "mean_substeps": sim.GetStepStats()["mean_substeps"],
+            "asleep": sim.GetSleepingCount(),
+            "peak_memory_bytes": peak,
+        })
+        return result
+
+def GitCommit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def RunMatrix(counts, sizes, bounds, backend="numpy", steps=10, seed=0, reorderInterval=0, fill="random") -> dict:
+    results = []
+    for bound in bounds:
+        for size in sizes:
+            for count in counts:
+                result = Benchmark(count, size, bound, backend, seed, reorderInterval=reorderInterval, fill=fill).Run(steps)
+                results.append(result)
+                PrintResult(result)
+
+    return {
+        "commit": GitCommit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": results,
+    }
+
+def PrintResult(result: dict):
+    scene = f"n={result['particles']:>6} size={result['particle_size']:<6} bound={result['bound_size']:<5}"
+    if "skipped" in result:
+        print(f"{scene} skipped ({result['skipped']})")
+        return
+    phases = " ".join(f"{name}={ms:.2f}ms" for name, ms in result["phase_ms_per_step"].items())
+    print(f"{scene} {result['steps_per_second']:8.1f} steps/s  {phases}  "
+          f"peak={result['peak_memory_bytes'] / 2**20:.1f}MiB")
+
+def Main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Benchmark Simulation.OnUpdate throughput.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.01, 0.02, 0.05])
+    parser.add_argument("--bounds", type=float, nargs="+", default=[1.2, 2.4])
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reorder-interval", type=int, default=0,
+                        help="sort the particles in Morton order every N steps, 0 to disable")
+    parser.add_argument("--fill", choices=("random", "lattice"), default="random",
+                        help="start from random positions and velocities or a lattice at rest")
+    parser.add_argument("--out", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = RunMatrix(args.counts, args.sizes, args.bounds, args.backend, args.steps, args.seed,
+                       args.reorder_interval, args.fill)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == "__main__":
+    Main()
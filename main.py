@@ -1,5 +1,11 @@
+import argparse
+
 from App.App import App
 
 if __name__ == "__main__":
-    app = App()
+    parser = argparse.ArgumentParser(description="ParticleFlow")
+    parser.add_argument("--replay", help="play back a trajectory recorded with python -m run --recording")
+    args = parser.parse_args()
+
+    app = App(replay=args.replay)
     app.Run()
\ No newline at end of file
@@ -0,0 +1,266 @@
+"""
+Headless simulation runner.
+Builds a Simulation from command line or JSON config parameters and steps it at a
+fixed dt with no window, OpenGL context or ImGui. Usage:
+
+    python -m run --particles 2000 --frames 600 --stats stats.json
+    python -m run --config sweep.json --seconds 10 --trajectory run.npz --record-every 4
+    python -m run --particles 100000 --seconds 60 --recording run.traj --checkpoint end.ckpt
+    python -m run --resume end.ckpt --seconds 60
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from App.Simulation.Simulation import Simulation
+from App.Simulation.Trajectory import TrajectoryRecorder
+
+# Same defaults as the interactive ParticleFlowLayer
+DEFAULTS = {
+    "particles": 100,
+    "particle_size": 0.05,
+    "bound_size": [1.2, 1.2, 1.2],
+    "friction": 0.7,
+    "backend": "numpy",
+    "workers": None,
+    "seed": 0,
+    "cfl": 0.5,
+    "min_substeps": 1,
+    "max_substeps": 8,
+    "sleeping": False,
+    "incremental_grid": True,
+    "neighbour_list": False,
+    "reorder_interval": 0,
+    "prefill": False,
+    "emitter_shape": "point",
+    "emitter_rate": 10.0,
+    "emitter_burst": 1,
+    "lifetime": None,
+    "outflow": False,
+    "dt": 1 / 240,
+    "frames": None,
+    "seconds": None,
+    "stats": None,
+    "trajectory": None,
+    "recording": None,
+    "record_every": 1,
+    "checkpoint": None,
+    "resume": None,
+}
+
+class HeadlessRunner:
+    """
+    Steps a Simulation at a fixed timestep and gathers statistics,
+    optionally keeping a copy of the particle state every `recordEvery` frames.
+    With a `recorder` the frames are streamed to its file instead of kept in memory.
+    """
+    def __init__(self, sim: Simulation, dt: float, recordEvery: int = 0, recorder: TrajectoryRecorder = None):
+        self._sim = sim
+        self._dt = dt
+        self._record_every = recordEvery
+        self._recorder = recorder
+        self._frames = 0
+        self._wall_time = 0.0
+
+        self._recorded_frames: list[int] = []
+        self._recorded_positions: list[np.ndarray] = []
+        self._recorded_velocities: list[np.ndarray] = []
+
+    def Run(self, frames: int) -> dict:
+        """Step the simulation `frames` times and return the statistics."""
+        start = time.perf_counter()
+        for _ in range(frames):
+            self._sim.OnUpdate(self._dt)
+            self._frames += 1
+            if self._record_every and self._frames % self._record_every == 0:
+                self._Record()
+        self._wall_time += time.perf_counter() - start
+        return self.GetStats()
+
+    def _Record(self):
+        if self._recorder is not None:
+            self._recorder.Record(self._frames, self._sim.GetPoints(), self._sim.GetVelocities(), self._sim.GetIds())
+            return
+        self._recorded_frames.append(self._frames)
+        self._recorded_positions.append(self._sim.GetPoints().copy())
+        self._recorded_velocities.append(self._sim.GetVelocities().copy())
+
+    def GetStats(self) -> dict:
+        velocities = self._sim.GetVelocities()
+        points = self._sim.GetPoints()
+        speeds = np.linalg.norm(velocities, axis=1) if len(velocities) else np.zeros(1)
+        step_stats = self._sim.GetStepStats()
+
+        return {
+            "frames": self._frames,
+            "dt": self._dt,
+            "sim_time": self._frames * self._dt,
+            "wall_time": self._wall_time,
+            "frames_per_second": self._frames / self._wall_time if self._wall_time > 0 else 0.0,
+            "particle_count": self._sim.GetParticleCount(),
+            "mean_speed": float(speeds.mean()),
+            "max_speed": float(speeds.max()),
+            "kinetic_energy": float(0.5 * np.sum(velocities.astype(np.float64) ** 2)),
+            "bounds_min": points.min(axis=0).tolist() if len(points) else None,
+            "bounds_max": points.max(axis=0).tolist() if len(points) else None,
+            "substeps": step_stats["substeps"],
+            "mean_substeps": step_stats["mean_substeps"],
+            "asleep": step_stats["asleep"],
+            "removed": step_stats["removed"],
+        }
+
+    def SaveTrajectory(self, path: str):
+        """
+        Save the recorded frames to a .npz file.
+        The particle count grows while emitting, so frames are padded with NaN and
+        `counts` holds the live particle count of each frame.
+        """
+        frames = len(self._recorded_positions)
+        capacity = max((len(p) for p in self._recorded_positions), default=0)
+        positions  = np.full((frames, capacity, 3), np.nan, dtype=np.float32)
+        velocities = np.full((frames, capacity, 3), np.nan, dtype=np.float32)
+        counts = np.zeros(frames, dtype=np.int64)
+
+        for k, (p, v) in enumerate(zip(self._recorded_positions, self._recorded_velocities)):
+            counts[k] = len(p)
+            positions[k, :len(p)]  = p
+            velocities[k, :len(v)] = v
+
+        np.savez_compressed(
+            path,
+            frame=np.array(self._recorded_frames, dtype=np.int64),
+            counts=counts,
+            positions=positions,
+            velocities=velocities,
+            dt=np.float64(self._dt),
+        )
+
+def BuildSimulation(params: dict) -> Simulation:
+    sim = Simulation(
+        params["particles"],
+        params["particle_size"],
+        params["bound_size"],
+        params["friction"],
+        backend=params["backend"],
+        seed=params["seed"],
+        workers=params["workers"],
+    )
+    sim.SetSubstepping(params["cfl"], params["min_substeps"], params["max_substeps"])
+    sim.SetSleeping(params["sleeping"])
+    sim.SetIncrementalGrid(params["incremental_grid"])
+    sim.SetNeighbourList(params["neighbour_list"])
+    sim.SetReordering(params["reorder_interval"])
+
+    emitter = sim.GetEmitter()
+    emitter.SetShape(params["emitter_shape"])
+    emitter.rate = params["emitter_rate"]
+    emitter.burst = params["emitter_burst"]
+    if params["lifetime"]:
+        emitter.lifetime = params["lifetime"]
+    if params["outflow"]:
+        # open floor: particles within one diameter of it leave the domain
+        floor = -0.5 * params["bound_size"][1] + params["particle_size"]
+        sim.AddKillZone((-np.inf, -np.inf, -np.inf), (np.inf, floor, np.inf))
+    if params["prefill"]:
+        sim.Prefill()
+    return sim
+
+def ParseArgs(argv=None) -> dict:
+    """
+    Merge parameters from defaults, an optional JSON config and the command line,
+    in increasing order of priority.
+    """
+    parser = argparse.ArgumentParser(description="Run the ParticleFlow simulation without a window.")
+    parser.add_argument("--config", help="JSON file with any of the parameters below")
+    parser.add_argument("--particles", type=int)
+    parser.add_argument("--particle-size", type=float)
+    parser.add_argument("--bound-size", type=float, nargs="+", help="one value for a cube or x y z")
+    parser.add_argument("--friction", type=float)
+    parser.add_argument("--backend", help="python, numpy, numba, parallel or auto")
+    parser.add_argument("--workers", type=int, help="threads for the parallel backend")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--dt", type=float, help="fixed timestep in seconds")
+    parser.add_argument("--cfl", type=float, help="largest move per substep, in particle radii")
+    parser.add_argument("--min-substeps", type=int)
+    parser.add_argument("--max-substeps", type=int)
+    parser.add_argument("--sleeping", action=argparse.BooleanOptionalAction, default=None,
+                        help="let resting particles sleep")
+    parser.add_argument("--incremental-grid", action=argparse.BooleanOptionalAction, default=None,
+                        help="only re-bin particles that changed cell between full grid rebuilds")
+    parser.add_argument("--neighbour-list", action=argparse.BooleanOptionalAction, default=None,
+                        help="reuse a Verlet neighbour list across substeps")
+    parser.add_argument("--reorder-interval", type=int, help="sort the particles in Morton order every N frames")
+    parser.add_argument("--prefill", action=argparse.BooleanOptionalAction, default=None,
+                        help="start with the domain filled by a lattice of particles")
+    parser.add_argument("--emitter-shape", help="point, disc, box or lattice")
+    parser.add_argument("--emitter-rate", type=float, help="emission events per second")
+    parser.add_argument("--emitter-burst", type=int, help="particles per emission event")
+    parser.add_argument("--lifetime", type=float, help="seconds emitted particles live, forever when not given")
+    parser.add_argument("--outflow", action=argparse.BooleanOptionalAction, default=None,
+                        help="remove particles that reach the floor")
+    parser.add_argument("--frames", type=int, help="number of steps to run")
+    parser.add_argument("--seconds", type=float, help="simulated time to run, used when --frames is not given")
+    parser.add_argument("--stats", help="write statistics to this JSON file")
+    parser.add_argument("--trajectory", help="write recorded frames to this .npz file")
+    parser.add_argument("--recording", help="stream recorded frames to this memory-mapped trajectory file")
+    parser.add_argument("--record-every", type=int, help="record every Nth frame")
+    parser.add_argument("--checkpoint", help="save the final state to this checkpoint file")
+    parser.add_argument("--resume", help="continue from this checkpoint instead of building a new simulation")
+    args = vars(parser.parse_args(argv))
+
+    params = dict(DEFAULTS)
+    config = args.pop("config")
+    if config:
+        with open(config, "r", encoding="utf-8") as f:
+            params.update(json.load(f))
+    params.update({key: value for key, value in args.items() if value is not None})
+
+    # covers both --bound-size and the config file value
+    bound = np.ravel(params["bound_size"])
+    if len(bound) not in (1, 3):
+        parser.error(f"bound_size takes 1 value for a cube or 3 for x y z, got {len(bound)}")
+    if len(bound) == 1:
+        bound = [bound[0]] * 3
+    params["bound_size"] = [float(b) for b in bound]
+
+    if params["frames"] is None:
+        seconds = params["seconds"] if params["seconds"] is not None else 1.0
+        params["frames"] = int(round(seconds / params["dt"]))
+    return params
+
+def Main(argv=None) -> dict:
+    params = ParseArgs(argv)
+    if params["resume"]:
+        sim = Simulation.LoadCheckpoint(params["resume"], workers=params["workers"])
+    else:
+        sim = BuildSimulation(params)
+
+    recorder = None
+    if params["recording"]:
+        recorder = TrajectoryRecorder(params["recording"], sim.GetParticleNumber(), params["dt"] * params["record_every"],
+                                      particleSize=sim.GetParticleSize())
+    record_every = params["record_every"] if params["trajectory"] or recorder else 0
+    runner = HeadlessRunner(sim, params["dt"], record_every, recorder)
+    try:
+        stats = runner.Run(params["frames"])
+    finally:
+        if recorder is not None:
+            recorder.Close()
+    stats["params"] = params
+
+    if params["checkpoint"]:
+        sim.SaveCheckpoint(params["checkpoint"])
+    if params["trajectory"]:
+        runner.SaveTrajectory(params["trajectory"])
+    if params["stats"]:
+        with open(params["stats"], "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+
+    print(f"{stats['frames']} frames, {stats['particle_count']} particles, "
+          f"{stats['frames_per_second']:.1f} frames/s")
+    return stats
+
+if __name__ == "__main__":
+    Main()
@@ -1,13 +1,68 @@
 import unittest
-import math
+import contextlib
+import ctypes
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
 import glm
-import copy
 import glfw
+import numpy as np
 
 from App.Simulation.Simulation import Simulation, Cell
+from App.Simulation.ParticleStore import ParticleStore
+from App.Simulation.SpatialHash import SpatialHash
+from App.Simulation.NarrowPhase import NarrowPhase
+from App.Simulation import Backends
+from App.Simulation.Emitter import Emitter
+from App.Simulation.SimulationThread import SimulationThread, SnapshotBuffer
+from App.Simulation.Checkpoint import Checkpoint
+from App.Simulation.Trajectory import TrajectoryRecorder, TrajectoryReader, TrajectoryPlayer
+import run
+import benchmark
 from Engine.Renderer.Camera import Camera
 from Engine.Core.DeltaTime import DeltaTime
-from Engine.Renderer.Mesh import Mesh
+from Engine.Core.FixedTimestep import FixedTimestep
+from Engine.Core.Layer import Layer, LayerStack
+from Engine.Core.Profiler import Profiler
+from Engine.Renderer.Mesh import Mesh, MeshLOD
+from Engine.Renderer.Renderer import Renderer
+import Engine.Renderer.Renderer as renderer_module
+import Engine.Renderer.Mesh as mesh_module
+import Engine.Renderer.Buffers as buffers_module
+import Engine.Renderer.Shader as shader_module
+from Engine.Renderer.Shader import Shader
+from Engine.Renderer.CameraUniforms import CameraUniforms
+import Engine.Renderer.ShaderCache as shader_cache_module
+from Engine.Renderer.ShaderCache import ShaderCache
+
+class GLTestCase(unittest.TestCase):
+    """
+    Base for tests that run GL code without a context. _PatchGL replaces GL entry
+    points of a module with recorders of every call, restored after the test.
+    A recorder returns whatever _GLResult gives for the call, 1 unless overridden.
+    """
+    def _PatchGL(self, module, names):
+        if not hasattr(self, "calls"):
+            self.calls = []
+        for name in names:
+            self.addCleanup(setattr, module, name, getattr(module, name))
+            setattr(module, name, self._Recorder(name))
+
+    def _Recorder(self, name):
+        def record(*args):
+            self.calls.append((name, args))
+            return self._GLResult(name, args)
+        return record
+
+    def _GLResult(self, name, args):
+        return 1
+
+    def _Calls(self, name):
+        return [args for call, args in self.calls if call == name]
 
 class TestCamera(unittest.TestCase):
     def setUp(self):
@@ -159,6 +214,361 @@ class TestGenerateUVSphere(unittest.TestCase):
             self.assertAlmostEqual(v, e)
 
 
+class TestMeshInstanceBuffer(GLTestCase):
+    GL_FUNCTIONS = ("glGenBuffers", "glBindBuffer", "glBufferData", "glBufferSubData",
+                    "glGenVertexArrays", "glBindVertexArray", "glEnableVertexAttribArray",
+                    "glVertexAttribPointer", "glVertexAttribDivisor")
+
+    def setUp(self):
+        # Replace the GL entry points in both modules with recorders
+        for module in (mesh_module, buffers_module):
+            self._PatchGL(module, self.GL_FUNCTIONS)
+        self.mesh = Mesh(Mesh.GenerateUVSphere(2, 3))
+        self.calls.clear()
+
+    def test_attributes_configured_once(self):
+        points = np.zeros((10, 3), dtype=np.float32)
+        for _ in range(3):
+            self.mesh.SetInstanceData(points, points)
+        self.assertEqual(len(self._Calls("glGenBuffers")), 2)
+        self.assertEqual(len(self._Calls("glVertexAttribPointer")), 2)
+        self.assertEqual(self.mesh.instance_count, 10)
+
+    def test_buffer_grows_geometrically(self):
+        for count in range(1, 65):
+            points = np.zeros((count, 3), dtype=np.float32)
+            self.mesh.SetInstanceData(points, points)
+        # 1, 2, 4, ..., 64 instances, plus one orphan per full upload, for both streams
+        allocations = [args for args in self._Calls("glBufferData") if args[2] is None]
+        self.assertEqual(len(allocations) - 2 * 64, 2 * 7)
+
+    def test_dirty_range_upload(self):
+        points = np.arange(30, dtype=np.float32).reshape(10, 3)
+        colors = np.ones((10, 3), dtype=np.float32)
+        self.mesh.SetInstanceData(points, colors)
+        self.calls.clear()
+
+        points[4] = -1.0
+        self.mesh.SetInstanceData(points, colors, dirtyRange=(4, 5))
+        uploads = self._Calls("glBufferSubData")
+        self.assertEqual(len(uploads), 2)
+        _, offset, size, data = uploads[0]
+        self.assertEqual((offset, size), (4 * 12, 12))
+        np.testing.assert_allclose(data[0], (-1, -1, -1))
+        # no orphaning for a partial update
+        self.assertEqual(self._Calls("glBufferData"), [])
+
+    def test_new_instances_always_uploaded(self):
+        points = np.zeros((8, 3), dtype=np.float32)
+        self.mesh.SetInstanceData(points, points)
+        self.mesh.SetInstanceData(points[:6], points[:6])
+        self.calls.clear()
+        self.mesh.SetInstanceData(points, points, dirtyRange=(0, 0))
+        _, offset, size, _ = self._Calls("glBufferSubData")[0]
+        self.assertEqual((offset, size), (6 * 12, 2 * 12))
+
+    def test_simulation_views_upload_without_copies(self):
+        sim = Simulation(10, 0.1, (1.0, 1.0, 1.0), 0.5)
+        sim.AddParticles(np.zeros((10, 3)))
+        points, colors = sim.GetPoints(), sim.GetColors()
+        self.mesh.SetInstanceData(points, colors)
+
+        uploads = [args[3] for args in self._Calls("glBufferSubData")]
+        self.assertTrue(np.shares_memory(uploads[0], points))
+        self.assertTrue(np.shares_memory(uploads[1], colors))
+
+    def test_accepts_buffer_protocol_and_glm(self):
+        points = np.ones((3, 3), dtype=np.float32)
+        self.mesh.SetInstanceData(memoryview(points), [glm.vec3(0.5)] * 3)
+        uploads = [args[3] for args in self._Calls("glBufferSubData")]
+        self.assertTrue(np.shares_memory(uploads[0], points))
+        np.testing.assert_allclose(uploads[1], 0.5)
+
+    def test_shared_radius_uploaded_on_change(self):
+        points = np.zeros((10, 3), dtype=np.float32)
+        self.mesh.SetInstanceData(points, points, radii=0.05)
+        # the radius stream is a third buffer with a float attribute at location 3
+        self.assertEqual(len(self._Calls("glGenBuffers")), 3)
+        self.assertEqual(self._Calls("glVertexAttribDivisor")[-1], (3, 1))
+        radii = self._Calls("glBufferSubData")[-1][3]
+        np.testing.assert_allclose(radii, np.full(10, 0.05))
+
+        self.calls.clear()
+        self.mesh.SetInstanceData(points, points, dirtyRange=(0, 0), radii=0.05)
+        self.assertEqual(self._Calls("glBufferSubData"), [])
+
+        # new instances only get the radius written for them
+        more = np.zeros((12, 3), dtype=np.float32)
+        self.mesh.SetInstanceData(more, more, radii=0.05)
+        self.mesh.SetInstanceData(points, points, radii=0.05)
+        self.mesh.SetInstanceData(more, more, dirtyRange=(0, 0), radii=0.05)
+        _, offset, size, _ = self._Calls("glBufferSubData")[-1]
+        self.assertEqual((offset, size), (10 * 4, 2 * 4))
+
+        self.calls.clear()
+        self.mesh.SetInstanceData(more, more, dirtyRange=(0, 0), radii=0.1)
+        _, offset, size, data = self._Calls("glBufferSubData")[-1]
+        self.assertEqual((offset, size), (0, 12 * 4))
+        np.testing.assert_allclose(data, 0.1)
+
+    def test_per_instance_radii_follow_dirty_range(self):
+        points = np.zeros((8, 3), dtype=np.float32)
+        radii = np.linspace(0.1, 0.8, 8, dtype=np.float32)
+        self.mesh.SetInstanceData(points, points, radii=radii)
+        self.calls.clear()
+
+        radii[5] = 2.0
+        self.mesh.SetInstanceData(points, points, dirtyRange=(5, 6), radii=radii)
+        _, offset, size, data = self._Calls("glBufferSubData")[-1]
+        self.assertEqual((offset, size), (5 * 4, 4))
+        self.assertTrue(np.shares_memory(data, radii))
+
+    def test_quad_covers_unit_square(self):
+        quad = np.array(Mesh.GenerateQuad(), dtype=np.float32).reshape(-1, 3)
+        self.assertEqual(len(quad), 6)
+        np.testing.assert_array_equal(np.abs(quad[:, :2]), 1.0)
+        # both triangles wind counter-clockwise, so culling keeps them facing the camera
+        for a, b, c in quad.reshape(2, 3, 3):
+            self.assertGreater(np.cross(b - a, c - a)[2], 0.0)
+
+    def _Lod(self):
+        return MeshLOD([Mesh.GenerateUVSphere(4, 8), Mesh.GenerateUVSphere(3, 6), Mesh.GenerateUVSphere(2, 3)],
+                       [1.0, 3.0])
+
+    def test_lod_buckets_by_distance(self):
+        lod = self._Lod()
+        points = np.array([[0, 0, 5.0], [0, 0, 0.5], [2.0, 0, 0], [0, 0, 0.9], [0, 2.9, 0]], dtype=np.float32)
+        colors = np.arange(15, dtype=np.float32).reshape(5, 3)
+        lod.SetInstanceData(points, colors, eye=(0, 0, 0))
+        self.assertEqual(lod.GetLevelCounts(), [2, 2, 1])
+        self.assertEqual(lod.instance_count, 5)
+
+        # each level gets its instances as one contiguous upload, in their original order
+        uploads = [args[3] for args in self._Calls("glBufferSubData")]
+        np.testing.assert_array_equal(uploads[0], points[[1, 3]])
+        np.testing.assert_array_equal(uploads[1], colors[[1, 3]])
+        np.testing.assert_array_equal(uploads[2], points[[2, 4]])
+        np.testing.assert_array_equal(uploads[4], points[[0]])
+
+        # the distances scale with the particle size
+        np.testing.assert_array_equal(lod.GetLevels(points, (0, 0, 0), scale=10.0), [0, 0, 0, 0, 0])
+        lod.SetInstanceData(points, colors, eye=(0, 0, 5.0))
+        self.assertEqual(lod.GetLevelCounts(), [1, 0, 4])
+
+    def test_lod_rejects_bad_distances(self):
+        with self.assertRaises(ValueError):
+            MeshLOD([Mesh.GenerateUVSphere(2, 3)] * 3, [1.0])
+        with self.assertRaises(ValueError):
+            MeshLOD([Mesh.GenerateUVSphere(2, 3)] * 3, [2.0, 1.0])
+
+    def test_renderer_draws_each_lod_once(self):
+        self._PatchGL(renderer_module, ("glDrawArraysInstanced",))
+        lod = self._Lod()
+        points = np.array([[0, 0, 0.5], [0, 0, 0.6], [0, 0, 9.0]], dtype=np.float32)
+        lod.SetInstanceData(points, points, eye=(0, 0, 0))
+        shader = type("FakeShader", (), {"Use": lambda self: None})()
+        Renderer(shader, lod).DrawInstanced()
+        # the empty middle level is skipped
+        self.assertEqual([(args[2], args[3]) for args in self._Calls("glDrawArraysInstanced")],
+                         [(lod.meshes[0].vertex_count, 2), (lod.meshes[2].vertex_count, 1)])
+
+class TestShader(GLTestCase):
+    SHADER_FUNCTIONS = ("glCreateProgram", "glCreateShader", "glShaderSource", "glCompileShader",
+                        "glGetShaderiv", "glAttachShader", "glLinkProgram", "glGetProgramiv",
+                        "glDeleteShader", "glGetActiveUniform", "glGetUniformLocation",
+                        "glGetUniformBlockIndex", "glUniformBlockBinding", "glUseProgram",
+                        "glUniform1i", "glUniform1f", "glUniform3f", "glUniformMatrix4fv")
+    BUFFER_FUNCTIONS = ("glGenBuffers", "glBindBuffer", "glBufferData", "glBufferSubData", "glBindBufferBase")
+    # active uniforms of the fake program, the Camera block members are not listed
+    UNIFORMS = [b"uParticleRadii", b"uLights[0]", b"uTint"]
+
+    def setUp(self):
+        self._PatchGL(shader_module, self.SHADER_FUNCTIONS)
+        self._PatchGL(buffers_module, self.BUFFER_FUNCTIONS)
+
+        self._dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for stage in ("vert", "frag"):
+            path = os.path.join(self._dir.name, f"test.{stage}")
+            with open(path, "w") as f:
+                f.write("#version 330 core\n")
+            self.paths.append(path)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _GLResult(self, name, args):
+        if name == "glGetProgramiv" and args[1] == shader_module.GL_ACTIVE_UNIFORMS:
+            return len(self.UNIFORMS)
+        if name == "glGetActiveUniform":
+            return self.UNIFORMS[args[1]], 1, 0
+        if name == "glGetUniformLocation":
+            return [u.decode().removesuffix("[0]") for u in self.UNIFORMS].index(args[1]) + 10
+        if name == "glGetUniformBlockIndex":
+            return 0
+        return 1
+
+    def test_uniforms_introspected_once(self):
+        shader = Shader(*self.paths)
+        self.assertEqual(len(self._Calls("glGetUniformLocation")), len(self.UNIFORMS))
+        self.assertEqual(shader.GetUniformLocation("uLights"), 11)
+        self.assertEqual(shader.GetUniformLocation("uMissing"), -1)
+
+        self.calls.clear()
+        for k in range(5):
+            shader.UploadFloat("uParticleRadii", 0.1 * k)
+            shader.UploadVec3("uTint", (k, 0, 0))
+            shader.UploadFloat("uMissing", k)
+        self.assertEqual(self._Calls("glGetUniformLocation"), [])
+        self.assertEqual([args[0] for args in self._Calls("glUniform1f")], [10] * 5)
+
+    def test_redundant_uploads_skipped(self):
+        shader = Shader(*self.paths)
+        self.calls.clear()
+        matrix = glm.mat4(1.0)
+        for _ in range(3):
+            shader.UploadFloat("uParticleRadii", 0.05)
+            shader.UploadMat4("uTint", matrix)
+        self.assertEqual(len(self._Calls("glUniform1f")), 1)
+        self.assertEqual(len(self._Calls("glUniformMatrix4fv")), 1)
+
+        # changing the matrix in place still counts as a change
+        matrix[3][0] = 2.0
+        shader.UploadMat4("uTint", matrix)
+        shader.UploadMat4("uTint", matrix, transpose=True)
+        self.assertEqual(len(self._Calls("glUniformMatrix4fv")), 3)
+
+    def test_camera_block_bound(self):
+        Shader(*self.paths)
+        binding = Shader.UNIFORM_BLOCK_BINDINGS["Camera"]
+        self.assertEqual([args[1:] for args in self._Calls("glUniformBlockBinding")], [(0, binding)])
+
+    def test_camera_uniforms_upload_on_change(self):
+        uniforms = CameraUniforms()
+        self.assertEqual(self._Calls("glBindBufferBase")[0][1], Shader.UNIFORM_BLOCK_BINDINGS["Camera"])
+        self.assertEqual(self._Calls("glBufferData")[0][1], CameraUniforms.SIZE)
+
+        camera = Camera()
+        self.assertTrue(uniforms.Update(camera))
+        self.assertFalse(uniforms.Update(camera))
+        camera.yaw += 10.0
+        self.assertTrue(uniforms.Update(camera))
+
+        uploads = self._Calls("glBufferSubData")
+        self.assertEqual(len(uploads), 2)
+        _, offset, size, data = uploads[-1]
+        self.assertEqual((offset, size), (0, CameraUniforms.SIZE))
+        # column-major view matrix, then the projection, then the eye position
+        view = np.array(camera.GetViewMatrix().to_list(), dtype=np.float32)
+        np.testing.assert_allclose(data[0:16].reshape(4, 4), view, atol=1e-6)
+        np.testing.assert_allclose(data[32:35], camera.GetPosition(), atol=1e-6)
+
+class TestShaderCache(GLTestCase):
+    SHADER_FUNCTIONS = ("glCreateProgram", "glCreateShader", "glShaderSource", "glCompileShader",
+                        "glGetShaderiv", "glAttachShader", "glLinkProgram", "glGetProgramiv",
+                        "glDeleteShader", "glGetUniformBlockIndex", "glUniformBlockBinding")
+    CACHE_FUNCTIONS = ("glGetString", "glGetIntegerv", "glGetProgramiv", "glProgramParameteri",
+                       "glGetProgramBinary", "glProgramBinary")
+    BINARY = b"linked program"
+
+    def setUp(self):
+        self.driver = {shader_cache_module.GL_VENDOR: b"Vendor", shader_cache_module.GL_RENDERER: b"Renderer",
+                       shader_cache_module.GL_VERSION: b"4.5"}
+        self.formats = 1
+        self.accept = True
+        self.loaded = None
+        self._PatchGL(shader_module, self.SHADER_FUNCTIONS)
+        self._PatchGL(shader_cache_module, self.CACHE_FUNCTIONS)
+
+        self._dir = tempfile.TemporaryDirectory()
+        self.cache = ShaderCache(os.path.join(self._dir.name, "cache"))
+        self.paths = []
+        for stage in ("vert", "frag"):
+            path = os.path.join(self._dir.name, f"test.{stage}")
+            self._WriteSource(path, "#version 330 core\n")
+            self.paths.append(path)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _WriteSource(self, path, text):
+        with open(path, "w") as f:
+            f.write(text)
+
+    def _GLResult(self, name, args):
+        if name == "glGetString":
+            return self.driver[args[0]]
+        if name == "glGetIntegerv":
+            return self.formats
+        if name == "glGetProgramiv":
+            if args[1] == shader_module.GL_ACTIVE_UNIFORMS:
+                return 0
+            if args[1] == shader_cache_module.GL_PROGRAM_BINARY_LENGTH:
+                return len(self.BINARY)
+            # a loaded binary links only if the driver accepts it
+            return self.accept if self.loaded is not None else True
+        if name == "glGetProgramBinary":
+            args[2]._obj.value = len(self.BINARY)
+            args[3]._obj.value = 7
+            ctypes.memmove(args[4], self.BINARY, len(self.BINARY))
+        if name == "glProgramBinary":
+            self.loaded = (args[1], ctypes.string_at(args[2], args[3]))
+        if name == "glLinkProgram":
+            self.loaded = None
+        if name == "glGetUniformBlockIndex":
+            return shader_module.GL_INVALID_INDEX
+        return 1
+
+    def _Compiles(self):
+        return len(self._Calls("glCompileShader"))
+
+    def test_key_covers_sources_and_driver(self):
+        key = self.cache.Key("vertex", "fragment")
+        self.assertEqual(key, ShaderCache(self._dir.name).Key("vertex", "fragment"))
+        self.assertNotEqual(key, self.cache.Key("vertex ", "fragment"))
+        self.assertNotEqual(key, self.cache.Key("vertexf", "ragment"))
+
+        self.driver[shader_cache_module.GL_VERSION] = b"4.6"
+        self.assertNotEqual(key, ShaderCache(self._dir.name).Key("vertex", "fragment"))
+
+    def test_miss_compiles_and_stores_then_hit_loads(self):
+        shader = Shader(*self.paths, cache=self.cache)
+        self.assertFalse(shader.from_cache)
+        self.assertEqual(self._Compiles(), 2)
+        self.assertTrue(os.path.isfile(self.cache.GetPath("test.vert-test.frag")))
+
+        self.calls.clear()
+        shader = Shader(*self.paths, cache=self.cache)
+        self.assertTrue(shader.from_cache)
+        self.assertEqual(self._Compiles(), 0)
+        self.assertEqual(self.loaded, (7, self.BINARY))
+
+    def test_changed_source_replaces_entry(self):
+        Shader(*self.paths, cache=self.cache)
+        self._WriteSource(self.paths[1], "#version 330 core\n// edited\n")
+        self.calls.clear()
+        shader = Shader(*self.paths, cache=self.cache)
+        self.assertFalse(shader.from_cache)
+        self.assertEqual(self._Compiles(), 2)
+        self.assertIsNone(self.loaded)
+        self.assertEqual(os.listdir(os.path.dirname(self.cache.GetPath("x"))), ["test.vert-test.frag.bin"])
+        self.assertTrue(Shader(*self.paths, cache=self.cache).from_cache)
+
+    def test_rejected_binary_falls_back_to_source(self):
+        Shader(*self.paths, cache=self.cache)
+        self.accept = False
+        self.calls.clear()
+        shader = Shader(*self.paths, cache=self.cache)
+        self.assertFalse(shader.from_cache)
+        self.assertEqual(self._Compiles(), 2)
+
+    def test_unsupported_driver_compiles(self):
+        self.formats = 0
+        for _ in range(2):
+            self.assertFalse(Shader(*self.paths, cache=self.cache).from_cache)
+        self.assertEqual(self._Compiles(), 4)
+        self.assertFalse(os.path.exists(self.cache.GetPath("test.vert-test.frag")))
+
 class TestDeltaTime(unittest.TestCase):
     def test_get_seconds_zero(self):
         dt = DeltaTime(0)
@@ -188,6 +598,87 @@ class TestDeltaTime(unittest.TestCase):
         dt = DeltaTime(-1.2)
         self.assertAlmostEqual(dt.GetMilliseconds(), -1200)
 
+class TestFixedTimestep(unittest.TestCase):
+    def test_steps_accumulate_across_frames(self):
+        timestep = FixedTimestep(0.01, 10)
+        self.assertEqual(timestep.Advance(0.004), 0)
+        self.assertEqual(timestep.Advance(0.004), 0)
+        self.assertEqual(timestep.Advance(0.004), 1)
+        self.assertAlmostEqual(timestep.GetAlpha(), 0.2)
+
+    def test_catch_up_is_capped(self):
+        timestep = FixedTimestep(0.01, 4)
+        self.assertEqual(timestep.Advance(0.105), 4)
+        self.assertAlmostEqual(timestep.GetDroppedTime(), 0.06)
+        self.assertAlmostEqual(timestep.GetAlpha(), 0.5)
+        self.assertEqual(timestep.Advance(0.0), 0)
+
+    def test_layer_stack_fixed_update(self):
+        calls = []
+        class Recorder(Layer):
+            def OnFixedUpdate(self, dt):
+                calls.append(("fixed", dt))
+            def OnUpdate(self, dt, alpha=1.0):
+                calls.append(("update", alpha))
+
+        stack = LayerStack()
+        stack.PushLayer(Recorder())
+        stack.OnFixedUpdate(0.01)
+        stack.OnUpdate(0.016, 0.25)
+        self.assertEqual(calls, [("fixed", 0.01), ("update", 0.25)])
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        Profiler.SetHistory(4)
+
+    def tearDown(self):
+        Profiler.Enable(False)
+        Profiler.SetHistory(240)
+
+    def test_disabled_scope_records_nothing(self):
+        Profiler.Enable(False)
+        with Profiler.Scope("Frame"):
+            pass
+        self.assertEqual(Profiler.GetStats(), {})
+
+    def test_stats_over_ring_buffer(self):
+        Profiler.Enable(True)
+        for _ in range(6):
+            with Profiler.Scope("Frame"):
+                pass
+        stats = Profiler.GetStats()["Frame"]
+        self.assertEqual(stats["calls"], 6)
+        self.assertLessEqual(stats["min"], stats["avg"])
+        self.assertLessEqual(stats["avg"], stats["p99"])
+        # only the last 4 samples are kept
+        self.assertEqual(Profiler._buffers["Frame"].count, 4)
+
+    def test_simulation_phases_are_scoped(self):
+        Profiler.Enable(True)
+        sim = Simulation(10, 0.1, (1.0, 1.0, 1.0), 0.5)
+        sim.AddParticle(glm.vec3(0.0))
+        sim.OnUpdate(1 / 240)
+        stats = Profiler.GetStats()
+        for name in ("SimSubstep", "Integrate", "Walls", "GridBuild", "NarrowPhase"):
+            self.assertIn(name, stats)
+        self.assertEqual(stats["SimSubstep"]["calls"], sim.GetStepStats()["substeps"])
+
+    def test_capture_chrome_trace(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            Profiler.CaptureTrace(2, path)
+            for _ in range(3):
+                with Profiler.Scope("Frame"):
+                    with Profiler.Scope("Draw"):
+                        pass
+                Profiler.EndFrame()
+            self.assertFalse(Profiler.IsCapturing())
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+
+        self.assertEqual([e["name"] for e in events], ["Draw", "Frame", "Draw", "Frame"])
+        self.assertTrue(all(e["ph"] == "X" and e["dur"] >= 0 for e in events))
+
 class TestCell(unittest.TestCase):
     def setUp(self):
         self.cell = Cell()
@@ -210,6 +701,738 @@ class TestCell(unittest.TestCase):
         self.cell.Clear()
         self.assertTrue(self.cell.IsEmpty())
 
+class TestParticleStore(unittest.TestCase):
+    def setUp(self):
+        self.store = ParticleStore(capacity=2)
+
+    def test_add_particle_views(self):
+        self.assertEqual(len(self.store), 0)
+        i = self.store.AddParticle((1, 2, 3), (4, 5, 6), (0.1, 0.2, 0.3))
+        self.assertEqual(i, 0)
+        self.assertEqual(self.store.positions.shape, (1, 3))
+        self.assertEqual(self.store.positions.dtype, np.float32)
+        np.testing.assert_allclose(self.store.velocities[0], (4, 5, 6))
+
+    def test_growth_is_geometric_and_keeps_data(self):
+        for k in range(5):
+            self.store.AddParticle((k, 0, 0), (0, k, 0), (0, 0, k))
+        # 2 -> 4 -> 8
+        self.assertEqual(self.store.capacity, 8)
+        self.assertEqual(self.store.count, 5)
+        np.testing.assert_allclose(self.store.positions[:, 0], range(5))
+        np.testing.assert_allclose(self.store.colors[:, 2], range(5))
+        self.assertTrue(self.store.positions.flags["C_CONTIGUOUS"])
+
+    def test_add_particles_bulk(self):
+        self.store.AddParticle((9, 9, 9), (0, 0, 0), (0, 0, 0))
+        rows = self.store.AddParticles(np.ones((10, 3)), np.zeros((10, 3)), np.full((10, 3), 0.5))
+        self.assertEqual(rows, slice(1, 11))
+        self.assertEqual(self.store.count, 11)
+        np.testing.assert_allclose(self.store.positions[0], (9, 9, 9))
+        np.testing.assert_allclose(self.store.colors[1:], 0.5)
+
+    def test_views_write_through(self):
+        self.store.AddParticle((0, 0, 0), (0, 0, 0), (0, 0, 0))
+        self.store.positions[0] += 1.0
+        np.testing.assert_allclose(self.store.positions[0], (1, 1, 1))
+
+    def test_permute_keeps_ids(self):
+        positions = np.arange(15, dtype=np.float32).reshape(5, 3)
+        self.store.AddParticles(positions, np.zeros((5, 3)), positions)
+        np.testing.assert_array_equal(self.store.ids, np.arange(5))
+
+        self.store.Permute([4, 2, 0, 1, 3])
+        np.testing.assert_array_equal(self.store.ids, [4, 2, 0, 1, 3])
+        np.testing.assert_allclose(self.store.positions, self.store.colors)
+        np.testing.assert_array_equal(self.store.IndexOf([0, 4]), [2, 0])
+        np.testing.assert_allclose(self.store.positions[self.store.IndexOf(4)], positions[4])
+
+    def test_remove_swaps_from_the_end(self):
+        positions = np.arange(18, dtype=np.float32).reshape(6, 3)
+        self.store.AddParticles(positions, np.zeros((6, 3)), positions)
+
+        self.assertEqual(self.store.Remove([1, 4]), 2)
+        self.assertEqual(self.store.count, 4)
+        # row 1 is filled from the last row, row 4 was past the new end
+        np.testing.assert_array_equal(self.store.ids, [0, 5, 2, 3])
+        np.testing.assert_allclose(self.store.positions, positions[[0, 5, 2, 3]])
+        np.testing.assert_allclose(self.store.positions, self.store.colors)
+        np.testing.assert_array_equal(self.store.IndexOf([5, 1, 4]), [1, -1, -1])
+
+    def test_removed_ids_are_reused_without_growth(self):
+        self.store.AddParticles(np.zeros((8, 3)), np.zeros((8, 3)), np.zeros((8, 3)), lifetimes=2.0)
+        capacity = self.store.capacity
+        for _ in range(50):
+            self.store.Remove([0, 3, 5])
+            self.store.AddParticles(np.ones((3, 3)), np.zeros((3, 3)), np.zeros((3, 3)))
+        self.assertEqual(self.store.capacity, capacity)
+        self.assertEqual(sorted(self.store.ids), list(range(8)))
+        np.testing.assert_array_equal(self.store.IndexOf(self.store.ids), np.arange(8))
+        # lifetimes move with their particles, the last batch had none
+        np.testing.assert_array_equal(np.isinf(self.store.lifetimes), self.store.positions[:, 0] == 1.0)
+        self.assertGreaterEqual(np.count_nonzero(np.isinf(self.store.lifetimes)), 3)
+
+class TestEmitter(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_rate_carries_fractions_between_frames(self):
+        emitter = Emitter(rate=10.0, burst=3)
+        counts = [emitter.Advance(1 / 60) for _ in range(60)]
+        self.assertEqual(sum(counts), 30)
+        emitter.Burst(7)
+        self.assertEqual(emitter.Advance(0.0), 7)
+
+    def test_shapes_stay_inside(self):
+        emitter = Emitter(shape="disc", position=(1.0, 2.0, 3.0), radius=0.5, velocitySpread=0.1)
+        positions, velocities = emitter.Sample(500, self.rng)
+        self.assertEqual(positions.dtype, np.float32)
+        offset = positions - (1.0, 2.0, 3.0)
+        self.assertTrue(np.all(np.hypot(offset[:, 0], offset[:, 2]) <= 0.5 + 1e-6))
+        np.testing.assert_allclose(offset[:, 1], 0.0, atol=1e-6)
+        self.assertTrue(np.all(np.abs(velocities - (0.2, 2.0, 0.0)) <= 0.1 + 1e-6))
+
+        emitter.SetShape("box")
+        emitter.extents = np.array([1.0, 2.0, 4.0])
+        positions, _ = emitter.Sample(500, self.rng)
+        self.assertTrue(np.all(np.abs(positions - (1.0, 2.0, 3.0)) <= (0.5, 1.0, 2.0)))
+
+        with self.assertRaises(ValueError):
+            emitter.SetShape("sphere")
+
+    def test_point_burst_spreads_out(self):
+        positions, _ = Emitter().Sample(50, self.rng, jitter=0.01)
+        self.assertEqual(len(np.unique(positions, axis=0)), 50)
+        self.assertTrue(np.all(np.abs(positions) <= 0.01 + 1e-7))
+        # a single particle is emitted exactly at the point
+        np.testing.assert_array_equal(Emitter().Sample(1, self.rng, jitter=0.01)[0], [[0.0, 0.0, 0.0]])
+
+        sim = Simulation(50, 0.05, (1.0, 1.0, 1.0), 0.5, seed=1)
+        sim.SetEmitter(Emitter(rate=0.0, burst=50, velocity=(0.0, 0.0, 0.0)))
+        sim.GetEmitter().Burst()
+        sim.OnUpdate(1 / 240)
+        self.assertEqual(len(np.unique(sim.GetPoints(), axis=0)), 50)
+        for _ in range(240):
+            sim.OnUpdate(1 / 240)
+        # overlaps are pushed apart towards a diameter
+        offset = sim.GetPoints()[:, None, :] - sim.GetPoints()[None, :, :]
+        distance = np.linalg.norm(offset, axis=2) + np.eye(50)
+        self.assertGreater(distance.min(), 0.5 * 0.05)
+
+    def test_lattice_points_are_even_and_distinct(self):
+        points = Emitter.LatticePoints(27, (3.0, 3.0, 3.0))
+        np.testing.assert_allclose(np.unique(points), (-1.0, 0.0, 1.0))
+
+        points = Emitter.LatticePoints(100, (1.0, 1.0, 1.0))
+        self.assertEqual(len(np.unique(points, axis=0)), 100)
+        self.assertTrue(np.all(np.abs(points) < 0.5))
+        # spread over the whole box, not packed into one end
+        np.testing.assert_allclose(points.mean(axis=0), 0.0, atol=0.05)
+
+class TestSpatialHash(unittest.TestCase):
+    def setUp(self):
+        self.hash = SpatialHash(0.5, (4.0, 4.0, 4.0))
+        rng = np.random.default_rng(7)
+        self.positions = rng.uniform(-2.0, 2.0, size=(300, 3)).astype(np.float32)
+
+    def test_cell_ranges_cover_sorted_particles(self):
+        self.hash.Build(self.positions)
+        keys = self.hash.ComputeCellKeys(self.positions)
+        self.assertEqual(self.hash.cell_end[-1], len(self.positions))
+        for key, start, end in zip(self.hash.cell_keys, self.hash.cell_start, self.hash.cell_end):
+            self.assertTrue(np.all(keys[self.hash.order[start:end]] == key))
+
+    def test_candidates_match_brute_force(self):
+        self.hash.Build(self.positions)
+        pairs_i, pairs_j = self.hash.FindCandidatePairs()
+        found = {(min(i, j), max(i, j)) for i, j in zip(pairs_i.tolist(), pairs_j.tolist())}
+        # no duplicates and no self pairs
+        self.assertEqual(len(found), len(pairs_i))
+        self.assertTrue(np.all(pairs_i != pairs_j))
+
+        # every pair closer than one cell must be a candidate
+        diff = self.positions[:, None, :] - self.positions[None, :, :]
+        dist = np.linalg.norm(diff, axis=2)
+        close = {(i, j) for i, j in zip(*np.nonzero(dist < 0.5)) if i < j}
+        self.assertTrue(close <= found)
+
+    def test_outside_positions_are_clamped(self):
+        coords = self.hash.ComputeCellCoords(np.array([[10.0, -10.0, 0.0]]))
+        self.assertEqual(tuple(coords[0]), (7, 0, 4))
+
+    def test_empty_build(self):
+        self.hash.Build(np.empty((0, 3), dtype=np.float32))
+        pairs_i, pairs_j = self.hash.FindCandidatePairs()
+        self.assertEqual(len(pairs_i), 0)
+
+    def test_active_cells_keep_every_awake_pair(self):
+        self.hash.Build(self.positions)
+        awake = np.zeros(len(self.positions), dtype=bool)
+        awake[::7] = True
+
+        pairs_i, pairs_j = self.hash.FindCandidatePairs()
+        expected = {(i, j) for i, j in zip(pairs_i.tolist(), pairs_j.tolist()) if awake[i] or awake[j]}
+        pairs_i, pairs_j = self.hash.FindCandidatePairs(self.hash.CellsContaining(awake))
+        found = set(zip(pairs_i.tolist(), pairs_j.tolist()))
+        self.assertTrue(expected <= found)
+        self.assertLess(len(found), len(self.positions) ** 2)
+
+    def test_morton_keys_follow_z_order(self):
+        hash = SpatialHash(1.0, (4.0, 4.0, 4.0))
+        coords = np.array([(0, 0, 0), (0, 0, 1), (0, 1, 0), (1, 0, 0), (1, 1, 1), (2, 0, 0)])
+        keys = hash.ComputeMortonKeys(coords - 1.5)
+        np.testing.assert_array_equal(keys, [0, 1, 2, 4, 7, 32])
+
+    def test_update_matches_full_build(self):
+        self.hash.Build(self.positions)
+        moved = self.positions.copy()
+        moved[:20] += 0.6
+
+        reference = SpatialHash(0.5, (4.0, 4.0, 4.0))
+        reference.Build(moved)
+        self.assertEqual(self.hash.Update(moved), np.count_nonzero(
+            self.hash.ComputeCellKeys(moved) != self.hash.ComputeCellKeys(self.positions)))
+
+        np.testing.assert_array_equal(self.hash.cell_keys, reference.cell_keys)
+        np.testing.assert_array_equal(self.hash.cell_start, reference.cell_start)
+        for start, end in zip(reference.cell_start, reference.cell_end):
+            self.assertEqual(set(self.hash.order[start:end]), set(reference.order[start:end]))
+
+    def test_update_without_moves_and_after_resize(self):
+        self.hash.Build(self.positions)
+        self.assertEqual(self.hash.Update(self.positions), 0)
+        # a new particle count or grid forces a full build
+        self.assertEqual(self.hash.Update(self.positions[:-1]), len(self.positions) - 1)
+        self.hash.SetGrid(1.0, (4.0, 4.0, 4.0))
+        self.assertEqual(self.hash.Update(self.positions[:-1]), len(self.positions) - 1)
+
+    def test_dilate_and_particle_cells(self):
+        self.hash.Build(self.positions)
+        cells = self.hash.ParticleCells()
+        keys = self.hash.ComputeCellKeys(self.positions)
+        np.testing.assert_array_equal(self.hash.cell_keys[cells], keys)
+
+        marked = np.zeros(self.hash.cell_keys.size, dtype=bool)
+        marked[0] = True
+        dilated = self.hash.DilateCells(marked)
+        coords = self.hash._KeysToCoords(self.hash.cell_keys)
+        near = np.all(np.abs(coords - coords[0]) <= 1, axis=1)
+        np.testing.assert_array_equal(dilated, near)
+
+class TestNarrowPhase(unittest.TestCase):
+    def setUp(self):
+        self.sim = Simulation(
+            particleNumber=40,
+            particleSize=0.2,
+            boundSize=(10.0, 10.0, 10.0),
+            frictionCoefficient=0.5
+        )
+        rng = np.random.default_rng(3)
+        # 20 disjoint overlapping pairs spread along x so no particle has two contacts
+        for k in range(20):
+            base = glm.vec3(-4.0 + k * 0.4, 0.0, 0.0)
+            offset = glm.vec3(*rng.uniform(-0.08, 0.08, size=3))
+            self.sim.AddParticle(base, glm.vec3(*rng.uniform(-1, 1, size=3)))
+            self.sim.AddParticle(base + offset, glm.vec3(*rng.uniform(-1, 1, size=3)))
+        self.pairs_i = np.arange(0, 40, 2)
+        self.pairs_j = np.arange(1, 40, 2)
+
+    def test_contact_mask(self):
+        positions = np.array([[0, 0, 0], [0.1, 0, 0], [1, 0, 0]], dtype=np.float32)
+        mask, _, distance = NarrowPhase.FindContacts(positions, np.array([0, 0]), np.array([1, 2]), 0.1)
+        self.assertEqual(mask.tolist(), [True, False])
+        np.testing.assert_allclose(distance, (0.1, 1.0), rtol=1e-6)
+
+    def test_matches_scalar_path_for_disjoint_pairs(self):
+        positions = self.sim.GetPoints().copy()
+        velocities = self.sim.GetVelocities().copy()
+        contacts = NarrowPhase.ResolveCollisions(positions, velocities, self.pairs_i, self.pairs_j, 0.1)
+
+        for p1, p2 in zip(self.pairs_i, self.pairs_j):
+            if self.sim.IsColliding(p1, p2):
+                self.sim.ResolveCollision(p1, p2)
+
+        self.assertGreater(contacts, 0)
+        np.testing.assert_allclose(positions, self.sim.GetPoints(), atol=1e-5)
+        np.testing.assert_allclose(velocities, self.sim.GetVelocities(), atol=1e-5)
+
+    def test_scatter_add_accumulates(self):
+        target = np.zeros((3, 3), dtype=np.float32)
+        NarrowPhase.ScatterAdd(target, np.array([0, 0, 2]), np.ones((3, 3)))
+        np.testing.assert_allclose(target[:, 0], (2, 0, 1))
+
+class TestBackends(unittest.TestCase):
+    def test_backends_match_reference(self):
+        deviations = Simulation.VerifyBackends(particles=24, frames=10)
+        self.assertIn("numpy", deviations)
+        for name, deviation in deviations.items():
+            self.assertLess(deviation, 1e-4, name)
+
+    def test_select_backend_picks_the_fastest_matching(self):
+        # read from the class dict so the staticmethod wrappers are restored as they were
+        originals = Simulation.__dict__["VerifyBackends"], Simulation.__dict__["TimeBackend"], Simulation._selected_backend
+        Simulation.VerifyBackends = staticmethod(lambda: {"python": 0.0, "numpy": 0.0, "numba": 1.0, "parallel": 0.0})
+        Simulation.TimeBackend = staticmethod(lambda name: {"numpy": 0.02, "numba": 0.001, "parallel": 0.01}[name])
+        Simulation._selected_backend = None
+        try:
+            # numba is fastest but does not match the reference
+            self.assertEqual(Simulation.SelectBackend(), "parallel")
+        finally:
+            Simulation.VerifyBackends, Simulation.TimeBackend, Simulation._selected_backend = originals
+
+    def test_time_backend(self):
+        self.assertGreater(Simulation.TimeBackend("numpy", particles=50, steps=2), 0.0)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            Backends.CreateBackend("cuda")
+
+    def test_numba_falls_back_without_numba(self):
+        original = Backends.njit
+        Backends.njit = None
+        try:
+            self.assertNotIn("numba", Backends.AvailableBackends())
+            self.assertEqual(Backends.CreateBackend("numba").name, "numpy")
+        finally:
+            Backends.njit = original
+
+    @unittest.skipUnless("parallel" in Backends.AvailableBackends(), "numba is not installed")
+    def test_parallel_matches_single_threaded(self):
+        rng = np.random.default_rng(5)
+        positions = rng.uniform(-0.9, 0.9, size=(400, 3))
+        velocities = rng.uniform(-1.0, 1.0, size=(400, 3))
+
+        points = []
+        for backend, workers in (("numba", None), ("parallel", 3)):
+            sim = Simulation(400, 0.1, (2.0, 2.0, 2.0), 0.7, backend=backend, workers=workers)
+            for position, velocity in zip(positions, velocities):
+                sim.AddParticle(position, velocity)
+            for _ in range(10):
+                sim.OnUpdate(1 / 240)
+            points.append(sim.GetPoints().copy())
+
+        self.assertEqual(sim._backend.GetWorkerCount(), 3)
+        np.testing.assert_allclose(points[0], points[1], atol=1e-5)
+
+    @unittest.skipUnless("parallel" in Backends.AvailableBackends(), "numba is not installed")
+    def test_parallel_backends_share_one_pool(self):
+        pools = set()
+        for _ in range(5):
+            sim = Simulation(200, 0.1, (2.0, 2.0, 2.0), 0.7, backend="parallel", workers=2)
+            sim.Prefill()
+            sim.OnUpdate(1 / 240)
+            pools.add(id(sim._backend._pool))
+        self.assertEqual(len(pools), 1)
+        self.assertIsNot(Backends.CreateBackend("parallel", 1)._pool, sim._backend._pool)
+
+    def test_collide_pairs_matches_numpy(self):
+        rng = np.random.default_rng(11)
+        positions = rng.uniform(-0.3, 0.3, size=(80, 3)).astype(np.float32)
+        velocities = rng.uniform(-1.0, 1.0, size=(80, 3)).astype(np.float32)
+        pairs_i, pairs_j = np.triu_indices(80, 1)
+        awake = rng.uniform(size=80) < 0.5
+
+        results = []
+        for name in ("numpy", "python"):
+            p, v = positions.copy(), velocities.copy()
+            contacts = Backends.CreateBackend(name).CollidePairs(p, v, 0.05, pairs_i, pairs_j, awake)
+            results.append((contacts, p, v))
+        self.assertEqual(results[0][0], results[1][0])
+        np.testing.assert_allclose(results[0][1], results[1][1], atol=1e-5)
+        np.testing.assert_allclose(results[0][2], results[1][2], atol=1e-5)
+
+    def test_backend_selected_at_construction(self):
+        sim = Simulation(10, 0.1, (1.0, 1.0, 1.0), 0.5, backend="python")
+        self.assertEqual(sim._backend.name, "python")
+
+class TestSimulationThread(unittest.TestCase):
+    def test_snapshot_interpolates_last_two_states(self):
+        snapshots = SnapshotBuffer()
+        colors = np.ones((2, 3), dtype=np.float32)
+        snapshots.Publish(np.zeros((2, 3), dtype=np.float32), colors)
+        snapshots.Publish(np.full((3, 3), 2.0, dtype=np.float32), np.ones((3, 3)))
+
+        points, out_colors = snapshots.Interpolate(0.25)
+        np.testing.assert_allclose(points[:2], 0.5)
+        # a particle missing from the older state is drawn where it is now
+        np.testing.assert_allclose(points[2], 2.0)
+        self.assertEqual(out_colors.shape, (3, 3))
+        self.assertEqual(snapshots.GetVersion(), 2)
+
+    def test_snapshot_matches_reordered_particles_by_id(self):
+        snapshots = SnapshotBuffer()
+        colors = np.zeros((3, 3), dtype=np.float32)
+        snapshots.Publish(np.array([[0, 0, 0], [1, 1, 1], [2, 2, 2]], dtype=np.float32), colors, [0, 1, 2])
+        snapshots.Publish(np.array([[4, 4, 4], [2, 2, 2], [0, 0, 0], [9, 9, 9]], dtype=np.float32),
+                          np.zeros((4, 3)), [2, 0, 1, 3])
+
+        points, _ = snapshots.Interpolate(0.5)
+        np.testing.assert_allclose(points[:, 0], [3.0, 1.0, 0.5, 9.0])
+
+    def test_particle_reusing_an_id_is_not_blended_with_the_dead_one(self):
+        sim = Simulation(1, 0.05, (2.0, 2.0, 2.0), 0.5, seed=0)
+        sim.SetEmitter(Emitter(rate=240.0, velocity=(0.0, 0.0, 0.0)))
+        sim.AddParticles([(0.5, 0.5, 0.5)], np.zeros((1, 3)), lifetimes=1 / 240)
+        snapshots = SnapshotBuffer()
+        snapshots.Publish(sim.GetPoints(), sim.GetColors(), sim.GetSerials())
+
+        # it dies in the first step and the emitter hands its ID to a new one in the second
+        sim.OnUpdate(1 / 240)
+        sim.OnUpdate(1 / 240)
+        np.testing.assert_array_equal(sim.GetIds(), [0])
+        snapshots.Publish(sim.GetPoints(), sim.GetColors(), sim.GetSerials())
+
+        points, _ = snapshots.Interpolate(0.5)
+        np.testing.assert_allclose(points, sim.GetPoints())
+
+    def test_publish_copies_the_state(self):
+        snapshots = SnapshotBuffer()
+        positions = np.zeros((1, 3), dtype=np.float32)
+        snapshots.Publish(positions, positions)
+        positions += 1
+        points, _ = snapshots.Interpolate(1.0)
+        np.testing.assert_allclose(points, 0.0)
+
+    def test_thread_steps_and_runs_commands(self):
+        sim = Simulation(10, 0.1, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.AddParticle(glm.vec3(0.0))
+        snapshots = SnapshotBuffer()
+        thread = SimulationThread(sim, snapshots, step=1 / 1000)
+
+        thread.Start()
+        self.assertTrue(thread.IsRunning())
+        thread.Submit(lambda: sim.SetFrictionCoefficient(0.25))
+        deadline = time.perf_counter() + 5.0
+        while thread.GetStepCount() < 5 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        thread.Stop()
+
+        self.assertFalse(thread.IsRunning())
+        self.assertGreaterEqual(thread.GetStepCount(), 5)
+        self.assertEqual(sim._friction_coefficient, 0.25)
+        points, _ = snapshots.Interpolate(1.0)
+        np.testing.assert_allclose(points, sim.GetPoints())
+
+    def test_catch_up_publishes_once_with_stats(self):
+        class SlowSimulation:
+            """Each step takes three step lengths, so the thread always has to catch up."""
+            def __init__(self):
+                self.steps = 0
+            def OnUpdate(self, dt):
+                time.sleep(3 * dt)
+                self.steps += 1
+            def GetPoints(self):
+                return np.zeros((1, 3), dtype=np.float32)
+            GetColors = GetPoints
+            def GetSerials(self):
+                return np.zeros(1, dtype=np.int64)
+            def GetStepStats(self):
+                return {"steps": self.steps}
+
+        sim = SlowSimulation()
+        snapshots = SnapshotBuffer()
+        thread = SimulationThread(sim, snapshots, step=1 / 1000, maxSteps=8)
+        thread.Start()
+        deadline = time.perf_counter() + 5.0
+        while thread.GetStepCount() < 40 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        thread.Stop()
+
+        self.assertLessEqual(snapshots.GetVersion(), thread.GetStepCount() // 2 + 1)
+        self.assertEqual(snapshots.GetStats(), {"steps": sim.steps})
+
+    def test_alpha_spans_the_time_between_slow_publishes(self):
+        class SlowSimulation:
+            """Each step takes ten step lengths."""
+            def OnUpdate(self, dt):
+                time.sleep(10 * dt)
+            def GetPoints(self):
+                return np.zeros((1, 3), dtype=np.float32)
+            GetColors = GetPoints
+            def GetSerials(self):
+                return np.zeros(1, dtype=np.int64)
+            def GetStepStats(self):
+                return {}
+
+        snapshots = SnapshotBuffer()
+        thread = SimulationThread(SlowSimulation(), snapshots, step=1 / 1000, maxSteps=2)
+        thread.Start()
+        deadline = time.perf_counter() + 5.0
+        while snapshots.GetVersion() < 3 and time.perf_counter() < deadline:
+            time.sleep(0.001)
+        samples = []
+        end = time.perf_counter() + 0.3
+        while time.perf_counter() < end:
+            samples.append(thread.GetAlpha())
+            time.sleep(0.001)
+        thread.Stop()
+
+        self.assertGreaterEqual(snapshots.GetPublishInterval(), 0.015)
+        # dividing by the fixed step would pin nearly every sample at 1
+        self.assertLess(samples.count(1.0) / len(samples), 0.5)
+        self.assertGreater(len(set(samples)), 10)
+
+    def test_commands_left_at_stop_still_run(self):
+        sim = Simulation(10, 0.1, (1.0, 1.0, 1.0), 0.5)
+        thread = SimulationThread(sim, SnapshotBuffer())
+        thread.Start()
+        thread.Stop()
+        thread.Submit(lambda: sim.SetFrictionCoefficient(0.1))
+        thread.Start()
+        thread.Stop()
+        self.assertEqual(sim._friction_coefficient, 0.1)
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "state.ckpt")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_arrays_round_trip_as_views(self):
+        arrays = {"a": np.arange(7, dtype=np.float32), "b": np.ones((3, 3), dtype=np.int64), "c": np.int64(5),
+                  "empty": np.zeros((0, 3), dtype=np.float32)}
+        Checkpoint.Write(self.path, {"x": [1, 2]}, arrays)
+        params, loaded = Checkpoint.Read(self.path)
+
+        self.assertEqual(params, {"x": [1, 2]})
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(loaded[name], array)
+            self.assertEqual(loaded[name].dtype, np.asarray(array).dtype)
+        self.assertIsInstance(loaded["a"], np.memmap)
+        self.assertFalse(loaded["a"].flags.writeable)
+
+    def test_rejects_other_files_and_versions(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a checkpoint")
+        with self.assertRaises(ValueError):
+            Checkpoint.Read(self.path)
+
+        Checkpoint.Write(self.path, {}, {})
+        with open(self.path, "r+b") as f:
+            f.seek(8)
+            f.write(np.array([Checkpoint.VERSION + 1], dtype="<u4").tobytes())
+        with self.assertRaises(ValueError):
+            Checkpoint.Read(self.path)
+
+    def test_restored_simulation_continues_identically(self):
+        for neighbourList in (False, True):
+            sim = Simulation(120, 0.05, (1.0, 1.0, 1.0), 0.5, seed=4)
+            sim.SetNeighbourList(neighbourList)
+            sim.SetReordering(5)
+            sim.SetEmitter(Emitter(shape="box", rate=60.0, burst=4, extents=(0.8, 0.8, 0.8),
+                                   velocitySpread=0.5, lifetime=0.3))
+            sim.AddKillZone((0.3, -1.0, -1.0), (1.0, 1.0, 1.0))
+            for _ in range(60):
+                sim.OnUpdate(1 / 240)
+            sim.SaveCheckpoint(self.path)
+            restored = Simulation.LoadCheckpoint(self.path)
+
+            for _ in range(60):
+                sim.OnUpdate(1 / 240)
+                restored.OnUpdate(1 / 240)
+            np.testing.assert_array_equal(restored.GetPoints(), sim.GetPoints())
+            np.testing.assert_array_equal(restored.GetVelocities(), sim.GetVelocities())
+            np.testing.assert_array_equal(restored.GetIds(), sim.GetIds())
+            self.assertEqual(restored.GetStepStats(), sim.GetStepStats())
+
+    def test_save_after_reconfigure_keeps_the_new_grid(self):
+        sim = Simulation(60, 0.05, (1.0, 1.0, 1.0), 0.5, seed=2)
+        sim.Prefill()
+        for _ in range(10):
+            sim.OnUpdate(1 / 240)
+        sim.SetParticleSize(0.2)
+        sim.SaveCheckpoint(self.path)
+        restored = Simulation.LoadCheckpoint(self.path)
+
+        self.assertGreaterEqual(restored.GetCellSize(), 0.2)
+        self.assertEqual(restored.GetCellSize(), sim.GetCellSize())
+        for _ in range(30):
+            sim.OnUpdate(1 / 240)
+            restored.OnUpdate(1 / 240)
+        np.testing.assert_array_equal(restored.GetPoints(), sim.GetPoints())
+
+class TestTrajectory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "run.traj")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_frames_round_trip_past_the_preallocation(self):
+        rng = np.random.default_rng(0)
+        frames = [rng.uniform(-1, 1, (n, 3)).astype(np.float32) for n in (3, 5, 4, 5, 2)]
+        with TrajectoryRecorder(self.path, 5, 0.25, frames=2) as recorder:
+            for k, positions in enumerate(frames):
+                recorder.Record(10 * k, positions, -positions, np.arange(len(positions))[::-1])
+
+        reader = TrajectoryReader(self.path)
+        self.assertEqual(len(reader), 5)
+        self.assertEqual(reader.GetDt(), 0.25)
+        self.assertEqual(reader.GetParticleCapacity(), 5)
+        for k, expected in enumerate(frames):
+            positions, velocities = reader.GetFrame(k)
+            np.testing.assert_array_equal(positions, expected)
+            np.testing.assert_array_equal(velocities, -expected)
+            np.testing.assert_array_equal(reader.GetIds(k), np.arange(len(expected))[::-1])
+            self.assertEqual(reader.GetStep(k), 10 * k)
+        # a view into the file, not a copy
+        self.assertIsInstance(positions, np.memmap)
+        self.assertFalse(positions.flags.owndata)
+        reader.Close()
+
+    def test_particles_past_the_capacity_are_dropped(self):
+        with TrajectoryRecorder(self.path, 2, 1.0) as recorder:
+            recorder.Record(0, np.ones((4, 3)), np.zeros((4, 3)))
+        reader = TrajectoryReader(self.path)
+        self.assertEqual(reader.GetCount(0), 2)
+        np.testing.assert_array_equal(reader.GetIds(0), [0, 1])
+
+    def test_empty_recording(self):
+        TrajectoryRecorder(self.path, 10, 1.0).Close()
+        self.assertEqual(len(TrajectoryReader(self.path)), 0)
+
+class TestTrajectoryPlayer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "run.traj")
+        with TrajectoryRecorder(path, 4, 0.1, particleSize=0.02) as recorder:
+            for k in range(10):
+                recorder.Record(k, np.full((4, 3), k, dtype=np.float32), np.zeros((4, 3)), np.array([3, 1, 2, 0]) + k % 2)
+        self.reader = TrajectoryReader(path)
+        self.player = TrajectoryPlayer(self.reader, prefetch=3)
+
+    def tearDown(self):
+        self.player.Close()
+        self.tmp.cleanup()
+
+    def test_speed_loop_and_seek(self):
+        self.assertEqual(self.reader.GetParticleSize(), 0.02)
+        self.assertEqual(self.player.Advance(0.25), 2)
+        self.player.SetSpeed(2.0)
+        self.assertEqual(self.player.Advance(0.25), 7)
+        # loops past the end
+        self.assertEqual(self.player.Advance(0.2), 1)
+        np.testing.assert_array_equal(self.player.GetFrame()[0], 1.0)
+
+        self.player.SetSpeed(-1.0)
+        self.player.Seek(5)
+        self.assertEqual(self.player.Advance(0.1), 4)
+        self.player.SetPaused(True)
+        self.assertEqual(self.player.Advance(1.0), 4)
+
+        self.player.SetPaused(False)
+        self.player.SetLooping(False)
+        self.assertEqual(self.player.Advance(5.0), 0)
+        self.player.Seek(99)
+        self.assertEqual(self.player.GetFrameIndex(), 9)
+
+    def test_colours_follow_ids(self):
+        colors = self.player.GetColors().copy()
+        self.player.Seek(1)
+        # the IDs of frame 1 are those of frame 0 shifted by one
+        np.testing.assert_array_equal(self.player.GetColors()[[3, 1, 2]], colors[[1, 2, 0]])
+
+    def test_prefetch_runs_ahead_of_playback(self):
+        self.player.Seek(6)
+        deadline = time.perf_counter() + 5.0
+        while set(self.player._warm) < {7, 8, 9} and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.assertTrue({7, 8, 9} <= set(self.player._warm))
+
+class TestHeadlessRunner(unittest.TestCase):
+    def test_parse_args_priority(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config = os.path.join(tmp, "sweep.json")
+            with open(config, "w") as f:
+                json.dump({"particles": 500, "friction": 0.2}, f)
+            params = run.ParseArgs(["--config", config, "--particles", "7", "--bound-size", "2", "--seconds", "0.5"])
+
+        # command line beats config, config beats defaults
+        self.assertEqual(params["particles"], 7)
+        self.assertEqual(params["friction"], 0.2)
+        self.assertEqual(params["bound_size"], [2.0, 2.0, 2.0])
+        self.assertEqual(params["frames"], 120)
+
+    def test_parse_args_rejects_bad_bound_size(self):
+        self.assertEqual(run.ParseArgs(["--bound-size", "1", "2", "3"])["bound_size"], [1.0, 2.0, 3.0])
+        with tempfile.TemporaryDirectory() as tmp:
+            config = os.path.join(tmp, "bad.json")
+            with open(config, "w") as f:
+                json.dump({"bound_size": [1.0, 2.0]}, f)
+            for argv in (["--bound-size", "1", "2"], ["--bound-size", "1", "2", "3", "4"], ["--config", config]):
+                with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                    run.ParseArgs(argv)
+            # a config value of a single number still means a cube
+            with open(config, "w") as f:
+                json.dump({"bound_size": 2.5}, f)
+            self.assertEqual(run.ParseArgs(["--config", config])["bound_size"], [2.5, 2.5, 2.5])
+
+    def test_run_writes_stats_and_trajectory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stats_path = os.path.join(tmp, "stats.json")
+            trajectory_path = os.path.join(tmp, "run.npz")
+            stats = run.Main(["--particles", "5", "--frames", "240", "--stats", stats_path,
+                              "--trajectory", trajectory_path, "--record-every", "60"])
+
+            self.assertEqual(stats["frames"], 240)
+            self.assertGreater(stats["particle_count"], 0)
+            self.assertGreaterEqual(stats["mean_substeps"], 1.0)
+            with open(stats_path) as f:
+                self.assertEqual(json.load(f)["particle_count"], stats["particle_count"])
+            with np.load(trajectory_path) as trajectory:
+                self.assertEqual(trajectory["positions"].shape[0], 4)
+                self.assertEqual(trajectory["counts"][-1], stats["particle_count"])
+
+    def test_recording_checkpoint_and_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            recording = os.path.join(tmp, "run.traj")
+            checkpoint = os.path.join(tmp, "end.ckpt")
+            stats = run.Main(["--particles", "5", "--frames", "240", "--recording", recording,
+                              "--record-every", "60", "--checkpoint", checkpoint])
+
+            reader = TrajectoryReader(recording)
+            self.assertEqual(len(reader), 4)
+            self.assertEqual(reader.GetStep(3), 240)
+            self.assertAlmostEqual(reader.GetDt(), 60 / 240)
+            self.assertEqual(reader.GetCount(3), stats["particle_count"])
+            reader.Close()
+
+            resumed = run.Main(["--resume", checkpoint, "--frames", "1"])
+            self.assertGreaterEqual(resumed["particle_count"], stats["particle_count"])
+
+    def test_no_window_or_gl_imports(self):
+        code = ("import sys, run; run.Main(['--frames', '2']); "
+                "print(any(m.split('.')[0] in ('OpenGL', 'glfw', 'imgui') for m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(out.stdout.strip().splitlines()[-1], "False")
+
+class TestBenchmark(unittest.TestCase):
+    def test_run_reports_phases_and_memory(self):
+        result = benchmark.Benchmark(200, 0.05, 1.2, seed=3).Run(steps=2, warmup=1)
+        self.assertGreater(result["steps_per_second"], 0)
+        self.assertEqual(set(result["phase_ms_per_step"]), set(benchmark.PHASES))
+        self.assertGreater(result["phase_ms_per_step"]["narrow_phase"], 0)
+        self.assertGreater(result["peak_memory_bytes"], 0)
+
+    def test_scene_is_reproducible(self):
+        a = benchmark.Benchmark(50, 0.05, 1.2, seed=9).CreateSimulation()
+        b = benchmark.Benchmark(50, 0.05, 1.2, seed=9).CreateSimulation()
+        np.testing.assert_array_equal(a.GetPoints(), b.GetPoints())
+        np.testing.assert_array_equal(a.GetColors(), b.GetColors())
+
+    def test_too_dense_scene_is_skipped(self):
+        result = benchmark.Benchmark(100000, 0.05, 1.2).Run(steps=1)
+        self.assertIn("skipped", result)
+
+    def test_phase_timing_is_off_by_default(self):
+        sim = benchmark.Benchmark(20, 0.05, 1.2).CreateSimulation()
+        sim.OnUpdate(1 / 240)
+        self.assertEqual(sim.GetPhaseTimes(), {})
+
 class TestSimulation(unittest.TestCase):
     def setUp(self):
         # small 10×10×10 box, max 2 particles, radius 1, friction 0.5
@@ -233,48 +1456,331 @@ class TestSimulation(unittest.TestCase):
         self.sim.AddParticle(glm.vec3(1,2,3))
         self.assertEqual(self.sim.GetParticleCount(), 1)
         # position matches emitter
-        self.assertEqual(self.sim.GetPoints()[0], glm.vec3(1,2,3))
+        self.assertEqual(tuple(self.sim.GetPoints()[0]), (1.0, 2.0, 3.0))
         # velocity matches initial
-        self.assertEqual(self.sim._velocities[0], self.sim._initial_particle_velocity)
+        self.assertEqual(glm.vec3(*self.sim.GetVelocities()[0]), self.sim._initial_particle_velocity)
 
     def test_check_wall_collisions(self):
         # manually inject a position beyond +x bound
         # bound half-size is 5, radius=1 => max x=4
-        self.sim._positions.append(glm.vec3(10.0, 0.0, 0.0))
-        self.sim._velocities.append(glm.vec3(1.0, 0.0, 0.0))
+        self.sim.AddParticle(glm.vec3(10.0, 0.0, 0.0), glm.vec3(1.0, 0.0, 0.0))
         self.sim.CheckWallCollisions(0)
         # x should be clamped to 4, and velocity flipped & scaled by friction
-        self.assertAlmostEqual(self.sim._positions[0].x, 4.0)
-        self.assertAlmostEqual(self.sim._velocities[0].x, -1.0 * 0.5)
+        self.assertAlmostEqual(self.sim.GetPoints()[0][0], 4.0)
+        self.assertAlmostEqual(self.sim.GetVelocities()[0][0], -1.0 * 0.5)
+
+    def test_check_wall_collisions_all_particles(self):
+        # one particle through each wall, the floor uses its own restitution
+        self.sim.Reconfigure(particleNumber=3)
+        self.sim.AddParticle(glm.vec3(10.0, 0.0, 0.0), glm.vec3(1.0, 0.0, 0.0))
+        self.sim.AddParticle(glm.vec3(0.0, -10.0, 0.0), glm.vec3(0.0, -1.0, 0.0))
+        self.sim.AddParticle(glm.vec3(0.0, 0.0, 0.0), glm.vec3(1.0, 1.0, 1.0))
+        self.sim.CheckWallCollisions()
+
+        points = self.sim.GetPoints()
+        velocities = self.sim.GetVelocities()
+        self.assertAlmostEqual(points[0][0], 4.0)
+        self.assertAlmostEqual(velocities[0][0], -0.5)
+        self.assertAlmostEqual(points[1][1], -4.0)
+        self.assertAlmostEqual(velocities[1][1], 0.8)
+        # untouched particle keeps its state
+        np.testing.assert_allclose(velocities[2], (1.0, 1.0, 1.0))
+
+    def test_integrate(self):
+        self.sim.AddParticle(glm.vec3(0.0), glm.vec3(1.0, 0.0, 0.0))
+        self.sim.Integrate(0.5)
+        # v += g*dt, then p += v*dt
+        np.testing.assert_allclose(self.sim.GetVelocities()[0], (1.0, -1.4, 0.0), rtol=1e-6)
+        np.testing.assert_allclose(self.sim.GetPoints()[0], (0.5, -0.7, 0.0), rtol=1e-6)
 
     def test_create_grid_and_neighbor_collision(self):
         # override cell size to 2*r = 2 so particles within 2 units collide
-        self.sim._cell_size = self.sim._particle_radius * 2.0
+        self.sim.ResizeGrid(self.sim._particle_radius * 2.0)
+        self.assertEqual(self.sim._cell_count, glm.vec3(5, 5, 5))
         # place two overlapping particles in the same cell
         p1 = glm.vec3(0.0, 0.0, 0.0)
         p2 = glm.vec3(1.0, 0.0, 0.0)  # distance=1 < diameter=2
-        self.sim._positions = [p1, p2]
-        self.sim._velocities = [glm.vec3(0)] * 2
-        # grid-template setup
-        self.sim._cell_count = glm.vec3(
-            int(math.ceil(10.0 / self.sim._cell_size)),
-            int(math.ceil(10.0 / self.sim._cell_size)),
-            int(math.ceil(10.0 / self.sim._cell_size))
-        )
-        self.sim._grid_template = [
-            [
-                [Cell() for _ in range(int(self.sim._cell_count.z))]
-                for _ in range(int(self.sim._cell_count.y))
-            ]
-            for _ in range(int(self.sim._cell_count.x))
-        ]
-        self.sim._grid = copy.deepcopy(self.sim._grid_template)
+        self.sim.AddParticle(p1, glm.vec3(0))
+        self.sim.AddParticle(p2, glm.vec3(0))
 
         # run CreateGrid to resolve their overlap
         self.sim.CreateGrid()
         # after collision resolution they should be separated by at least diameter
-        dist = glm.distance(self.sim._positions[0], self.sim._positions[1])
+        points = self.sim.GetPoints()
+        dist = np.linalg.norm(points[0] - points[1])
         self.assertGreaterEqual(dist, 2.0 - 1e-6)
 
+    def test_substeps_follow_speed(self):
+        self.sim.SetSubstepping(cfl=0.5, minSubsteps=1, maxSubsteps=16)
+        self.sim.AddParticle(glm.vec3(0.0), glm.vec3(0.0))
+        self.assertEqual(self.sim.ComputeSubsteps(0.01), 1)
+
+        # 60 units/s over 0.1 s, plus gravity, is just over 12 half radii
+        self.sim.GetVelocities()[0] = (60.0, 0.0, 0.0)
+        self.assertEqual(self.sim.ComputeSubsteps(0.1), 13)
+
+        self.sim.GetVelocities()[0] = (1000.0, 0.0, 0.0)
+        self.assertEqual(self.sim.ComputeSubsteps(0.1), 16)
+
+    def test_step_stats_report_substeps(self):
+        self.sim.SetSubstepping(minSubsteps=3, maxSubsteps=3)
+        self.sim.OnUpdate(1 / 240)
+        stats = self.sim.GetStepStats()
+        self.assertEqual(stats["substeps"], 3)
+        self.assertEqual(stats["mean_substeps"], 3.0)
+
+    def test_incremental_grid_matches_rebuild(self):
+        rng = np.random.default_rng(3)
+        positions = rng.uniform(-4.0, 4.0, size=(60, 3))
+        velocities = rng.uniform(-5.0, 5.0, size=(60, 3))
+
+        points = []
+        for incremental in (False, True):
+            sim = Simulation(60, 0.5, (10.0, 10.0, 10.0), 0.5, seed=0)
+            sim.SetIncrementalGrid(incremental, rebuildInterval=8)
+            sim.AddParticles(positions, velocities)
+            for _ in range(20):
+                sim.OnUpdate(1 / 60)
+            points.append(sim.GetPoints().copy())
+        self.assertLess(sim.GetStepStats()["grid_moved"], 60)
+        np.testing.assert_allclose(points[0], points[1], atol=1e-4)
+
+    def test_neighbour_list_matches_grid(self):
+        rng = np.random.default_rng(4)
+        positions = rng.uniform(-4.0, 4.0, size=(60, 3))
+        velocities = rng.uniform(-1.0, 1.0, size=(60, 3))
+
+        points = []
+        for neighbour_list in (False, True):
+            sim = Simulation(60, 0.5, (10.0, 10.0, 10.0), 0.5, seed=0)
+            sim.SetNeighbourList(neighbour_list)
+            sim.AddParticles(positions, velocities)
+            for _ in range(20):
+                sim.OnUpdate(1 / 240)
+            points.append(sim.GetPoints().copy())
+        np.testing.assert_allclose(points[0], points[1], atol=1e-4)
+
+        # slow particles reuse the list for many substeps
+        stats = sim.GetStepStats()
+        self.assertLess(stats["neighbour_rebuilds"], 20)
+        self.assertGreater(stats["neighbour_pairs"], 0)
+
+    def test_neighbour_list_rebuilds_after_moving_half_the_skin(self):
+        self.sim.Reconfigure(particleNumber=3)
+        self.sim.SetNeighbourList(True, skin=0.5)
+        self.sim.AddParticles([(0.0, 0.0, 0.0), (3.0, 0.0, 0.0)], np.zeros((2, 3)))
+        self.assertTrue(self.sim.UpdateNeighbourList())
+        self.assertFalse(self.sim.UpdateNeighbourList())
+
+        self.sim.GetPoints()[0] += (0.2, 0.0, 0.0)
+        self.assertFalse(self.sim.UpdateNeighbourList())
+        self.sim.GetPoints()[0] += (0.1, 0.0, 0.0)
+        self.assertTrue(self.sim.UpdateNeighbourList())
+
+        # new particles are not in the list yet
+        self.sim.AddParticle(glm.vec3(-3.0, 0.0, 0.0))
+        self.assertTrue(self.sim.UpdateNeighbourList())
+
+        with self.assertRaises(ValueError):
+            self.sim.SetNeighbourList(True, skin=0.0)
+
+    def test_reorder_keeps_particles_by_id(self):
+        rng = np.random.default_rng(8)
+        positions = rng.uniform(-4.0, 4.0, size=(40, 3))
+        velocities = rng.uniform(-1.0, 1.0, size=(40, 3))
+
+        sims = []
+        for interval in (0, 3):
+            sim = Simulation(40, 0.5, (10.0, 10.0, 10.0), 0.5, seed=0)
+            sim.SetReordering(interval)
+            sim.AddParticles(positions, velocities)
+            for _ in range(10):
+                sim.OnUpdate(1 / 240)
+            sims.append(sim)
+
+        plain, reordered = sims
+        self.assertFalse(np.array_equal(reordered.GetIds(), np.arange(40)))
+        keys = reordered._spatial_hash.ComputeMortonKeys(reordered.GetPoints())
+        rows = reordered.GetIndexOf(np.arange(40))
+        np.testing.assert_allclose(reordered.GetPoints()[rows], plain.GetPoints(), atol=1e-4)
+        np.testing.assert_allclose(reordered.GetColors()[rows], plain.GetColors())
+        self.assertGreater(np.mean(np.diff(keys.astype(np.int64)) >= 0), 0.8)
+
+    def test_emitter_fills_up_to_particle_number(self):
+        sim = Simulation(50, 0.05, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.GetEmitter().burst = 20
+        for _ in range(24):
+            sim.OnUpdate(1 / 240)
+        self.assertEqual(sim.GetParticleCount(), 20)
+        for _ in range(48):
+            sim.OnUpdate(1 / 240)
+        self.assertEqual(sim.GetParticleCount(), 50)
+
+    def test_prefill_starts_at_full_density_without_overlap(self):
+        sim = Simulation(200, 0.05, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.Prefill()
+        self.assertEqual(sim.GetParticleCount(), 200)
+        points = sim.GetPoints()
+        distance = np.linalg.norm(points[:, None] - points[None], axis=2)
+        np.fill_diagonal(distance, np.inf)
+        self.assertGreaterEqual(distance.min(), 0.05)
+        self.assertTrue(np.all(np.abs(points) <= 0.5 - 0.025))
+
+    def test_lifetimes_and_kill_zones_remove_particles(self):
+        sim = Simulation(10, 0.05, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.SetSleeping(False)
+        sim.AddParticles([(-0.3, 0.0, 0.0), (0.0, 0.0, 0.0), (0.3, 0.0, 0.0)], np.zeros((3, 3)),
+                         lifetimes=[np.inf, 0.01, np.inf])
+        ids = sim.GetIds().copy()
+        sim.AddKillZone((0.2, -1.0, -1.0), (1.0, 1.0, 1.0))
+        sim.GetEmitter().rate = 0.0
+
+        sim.OnUpdate(1 / 60)
+        self.assertEqual(sim.GetParticleCount(), 1)
+        self.assertEqual(sim.GetStepStats()["removed"], 2)
+        np.testing.assert_array_equal(sim.GetIndexOf(ids), [0, -1, -1])
+
+        with self.assertRaises(ValueError):
+            sim.AddKillZone((1.0, 0.0, 0.0), (0.0, 1.0, 1.0))
+
+    def test_continuous_emission_reaches_a_steady_state(self):
+        sim = Simulation(200, 0.05, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.SetEmitter(Emitter(shape="box", rate=60.0, burst=10, extents=(0.8, 0.8, 0.8), lifetime=0.2))
+        for _ in range(120):
+            sim.OnUpdate(1 / 60)
+        store = sim._particles
+        self.assertEqual(store.capacity, 200)
+        self.assertLessEqual(store.count, 200)
+        self.assertGreater(sim.GetStepStats()["removed"], 1000)
+        # IDs are recycled, so the ID table is bounded by the pool as well
+        self.assertLessEqual(store._index_of.size, 2 * 200)
+
+    def test_adding_past_the_particle_number_never_grows_the_pool(self):
+        sim = Simulation(5, 0.05, (1.0, 1.0, 1.0), 0.5, seed=0)
+        store = sim._particles
+        self.assertEqual(sim.AddParticles(np.zeros((3, 3)), np.ones((3, 3)), lifetimes=[1.0, 2.0, 3.0]), 3)
+        self.assertEqual(sim.AddParticles(np.zeros((4, 3)), np.ones((4, 3)), lifetimes=[4.0, 5.0, 6.0, 7.0]), 2)
+        np.testing.assert_array_equal(store.lifetimes, [1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(sim.AddParticles(np.zeros((1, 3))), 0)
+        sim.AddParticle(glm.vec3(0.0))
+        sim.Prefill(10)
+        self.assertEqual(store.count, 5)
+        self.assertEqual(store.capacity, 5)
+
+        sim.RemoveParticles([0, 1])
+        sim.Prefill(10)
+        self.assertEqual(store.count, 5)
+        sim.Reconfigure(particleNumber=7)
+        self.assertEqual(store.capacity, 7)
+
+    def test_removal_wakes_particles_resting_on_it(self):
+        sim = Simulation(2, 0.1, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.AddParticles([(0.0, -0.45, 0.0), (0.0, -0.35, 0.0)], np.zeros((2, 3)))
+        sim.SetSleeping(True)
+        sim.GetEmitter().rate = 0.0
+        for _ in range(60):
+            sim.OnUpdate(1 / 60)
+        self.assertEqual(sim.GetSleepingCount(), 2)
+
+        sim.RemoveParticles([sim.GetIndexOf(0)])
+        self.assertEqual(sim.GetSleepingCount(), 0)
+
+    def test_reconfigure_rederives_the_grid_once_before_the_next_step(self):
+        sim = Simulation(10, 0.05, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.GetEmitter().rate = 0.0
+        calls = []
+        resize = sim.ResizeGrid
+        sim.ResizeGrid = lambda cellSize: (calls.append(cellSize), resize(cellSize))
+
+        for size in np.linspace(0.05, 0.2, 20):
+            sim.SetParticleSize(size)
+        sim.SetBoundSize((2.0, 1.0, 1.0))
+        self.assertEqual(calls, [])
+        self.assertAlmostEqual(sim.GetParticleSize(), 0.2)
+
+        sim.OnUpdate(1 / 240)
+        self.assertEqual(len(calls), 1)
+        self.assertAlmostEqual(sim.GetCellSize(), sim.CalculateOptimalCellSize())
+        self.assertEqual(sim._spatial_hash.GetCellCount(), (6, 3, 3))
+
+    def test_larger_particles_collide_after_resizing(self):
+        sim = Simulation(2, 0.05, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.SetSleeping(False)
+        sim.GetEmitter().rate = 0.0
+        sim.AddParticles([(-0.1, 0.0, 0.0), (0.1, 0.0, 0.0)], np.zeros((2, 3)))
+        sim.SetParticleSize(0.3)
+        sim.OnUpdate(1 / 240)
+        points = sim.GetPoints()
+        self.assertGreaterEqual(np.linalg.norm(points[1] - points[0]), 0.3 - 1e-4)
+
+    def test_lowering_the_particle_number_keeps_the_rest(self):
+        sim = Simulation(10, 0.05, (1.0, 1.0, 1.0), 0.5, seed=0)
+        sim.Prefill()
+        before = sim.GetPoints()[:4].copy()
+        sim.SetParticleNumber(4)
+        self.assertEqual(sim.GetParticleCount(), 4)
+        np.testing.assert_allclose(sim.GetPoints(), before)
+        np.testing.assert_array_equal(sim.GetIds(), np.arange(4))
+
+        sim.SetParticleNumber(12)
+        sim.Prefill()
+        self.assertEqual(sim.GetParticleCount(), 12)
+
+    def test_resting_particles_fall_asleep(self):
+        self.sim.SetSleeping(True, time=5 / 240)
+        self.sim.AddParticle(glm.vec3(0.0, -4.0, 0.0), glm.vec3(0.0))
+        for _ in range(20):
+            self.sim.OnUpdate(1 / 240)
+        self.assertEqual(self.sim.GetSleepingCount(), 1)
+
+        # asleep particles are not integrated
+        before = self.sim.GetPoints().copy()
+        self.sim.Integrate(0.5)
+        np.testing.assert_array_equal(self.sim.GetPoints(), before)
+
+    def test_contact_wakes_sleeping_particle(self):
+        self.sim.SetSleeping(True, time=5 / 240)
+        self.sim.AddParticle(glm.vec3(0.0, -4.0, 0.0), glm.vec3(0.0))
+        for _ in range(20):
+            self.sim.OnUpdate(1 / 240)
+        self.assertEqual(self.sim.GetSleepingCount(), 1)
+
+        self.sim.AddParticle(glm.vec3(1.5, -4.0, 0.0), glm.vec3(-20.0, 0.0, 0.0))
+        self.sim.OnUpdate(1 / 240)
+        self.assertEqual(self.sim.GetSleepingCount(), 0)
+        self.assertLess(self.sim.GetVelocities()[0][0], 0.0)
+
+    def test_restless_neighbour_keeps_particle_awake(self):
+        self.sim.SetSleeping(True, time=1 / 240)
+        self.sim.AddParticles([(0.0, -4.0, 0.0), (3.0, -4.0, 0.0)], np.zeros((2, 3)))
+        self.sim.GetVelocities()[1] = (0.0, 0.0, 1.0)
+        self.sim.OnUpdate(1 / 240)
+        self.assertFalse(self.sim._particles.asleep[0])
+
+        self.sim.SetSleeping(False)
+        self.assertEqual(self.sim.GetSleepingCount(), 0)
+
+    def test_ballistic_particle_does_not_sleep_at_the_top_of_its_throw(self):
+        sim = Simulation(1, 0.01, (1.2, 1.2, 1.2), 0.7, seed=0)
+        # many substeps and a calm window shorter than the stretch around the apex
+        sim.SetSubstepping(minSubsteps=64, maxSubsteps=64)
+        sim.SetSleeping(True, time=1 / 240)
+        sim.GetEmitter().rate = 0.0
+        sim.AddParticles([(0.0, 0.0, 0.0)], [(0.0, 1.0, 0.0)])
+        heights = []
+        for _ in range(40):
+            sim.OnUpdate(1 / 60)
+            heights.append(sim.GetPoints()[0][1])
+            self.assertEqual(sim.GetSleepingCount(), 0)
+        self.assertGreater(max(heights), 0.15)
+        # past the top and falling again, not frozen in the air
+        self.assertLess(heights[-1], max(heights))
+
+    def test_invalid_substepping(self):
+        with self.assertRaises(ValueError):
+            self.sim.SetSubstepping(cfl=0.0)
+        with self.assertRaises(ValueError):
+            self.sim.SetSubstepping(minSubsteps=4, maxSubsteps=2)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file